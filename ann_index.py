@@ -0,0 +1,133 @@
+"""
+Builders for the FAISS index types a VectorIndex can use: exact flat search for
+small corpora, HNSW and IVF-PQ approximate search for large ones.
+
+Every builder adds vectors in the order given, so position i of the new index is
+position i of the old one and LangChain's index_to_docstore_id stays valid.
+"""
+import logging
+import math
+
+import faiss
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+PQ_CENTROIDS = 256  # 8-bit codes per sub-quantizer
+IVF_POINTS_PER_LIST = 39  # FAISS warns when k-means has fewer training points per centroid
+
+
+def index_kind(index) -> str:
+    """Which of INDEX_TYPES a FAISS index is"""
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    return "flat"
+
+
+def ivf_lists(count: int) -> int:
+    """Inverted lists for `count` vectors: the configured value, or about 4 * sqrt(n)"""
+    nlist = settings.faiss_ivf_nlist or int(4 * math.sqrt(count))
+    return max(1, min(nlist, count // IVF_POINTS_PER_LIST))
+
+
+def ivfpq_trainable(count: int) -> bool:
+    """IVF-PQ needs enough vectors to train the PQ codebooks and the coarse quantizer"""
+    return count >= max(PQ_CENTROIDS, IVF_POINTS_PER_LIST)
+
+
+def choose_index_type(count: int, requested: str = "auto") -> str:
+    """
+    Index type for `count` chunks. "auto" stays exact until settings.faiss_hnsw_min_chunks,
+    then uses HNSW, and IVF-PQ from settings.faiss_ivfpq_min_chunks where HNSW's memory
+    and build time stop paying off. An explicit IVF-PQ request falls back to flat until
+    there is enough data to train it.
+    """
+    if requested == "auto":
+        if count >= settings.faiss_ivfpq_min_chunks:
+            requested = "ivfpq"
+        elif count >= settings.faiss_hnsw_min_chunks:
+            requested = "hnsw"
+        else:
+            requested = "flat"
+    if requested not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type {requested!r}; expected auto or one of {INDEX_TYPES}")
+    if requested == "ivfpq" and not ivfpq_trainable(count):
+        return "flat"
+    return requested
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Largest sub-quantizer count <= settings.faiss_pq_m that divides the vector size"""
+    m = max(1, min(settings.faiss_pq_m, dim))
+    while dim % m:
+        m -= 1
+    return m
+
+
+def all_vectors(index) -> np.ndarray:
+    """Every stored vector, in position order. IVF-PQ returns its decoded approximations."""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def apply_search_params(index) -> None:
+    """Set the recall/latency knobs from settings; they are not tied to how the index was built"""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = settings.faiss_hnsw_ef_search
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = settings.faiss_ivf_nprobe
+
+
+def build_index(kind: str, vectors: np.ndarray, metric: int = faiss.METRIC_L2):
+    """Build a new index of `kind` holding `vectors` (float32, one row per chunk)"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dim = vectors.shape
+    if kind == "flat":
+        index = faiss.IndexFlat(dim, metric)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, settings.faiss_hnsw_m, metric)
+        index.hnsw.efConstruction = settings.faiss_hnsw_ef_construction
+    elif kind == "ivfpq":
+        quantizer = faiss.IndexFlat(dim, metric)
+        index = faiss.IndexIVFPQ(quantizer, dim, ivf_lists(count), _pq_subquantizers(dim), 8, metric)
+        # Training cost grows with the sample; a few hundred points per list is plenty
+        sample_size = min(count, max(PQ_CENTROIDS, index.nlist) * 256)
+        sample = vectors[np.random.default_rng(0).choice(count, sample_size, replace=False)]
+        index.train(sample)
+        index.make_direct_map()
+    else:
+        raise ValueError(f"Unknown FAISS index type {kind!r}")
+
+    if count:
+        index.add(vectors)
+    apply_search_params(index)
+    logger.info(f"Built {kind} FAISS index over {count} vectors")
+    return index
+
+
+def rebuild_without(index, keep: np.ndarray):
+    """
+    A copy of `index` holding only the positions in `keep`, renumbered from 0.
+    HNSW cannot remove vectors in place, and IVF removal leaves gaps in the
+    positions LangChain relies on, so both are rebuilt. IVF-PQ keeps its trained
+    quantizers; re-adding decoded vectors maps them back to the same codes.
+    """
+    vectors = all_vectors(index)[keep]
+    if isinstance(index, faiss.IndexIVF):
+        rebuilt = faiss.clone_index(index)
+        rebuilt.reset()
+        rebuilt.make_direct_map()
+        if len(vectors):
+            rebuilt.add(vectors)
+        apply_search_params(rebuilt)
+        return rebuilt
+    return build_index(index_kind(index), vectors, index.metric_type)
+
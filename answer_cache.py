@@ -0,0 +1,216 @@
+"""
+Two-level cache of LLM answers, kept in SQLite so it survives restarts:
+exact prompt matches first, then semantically similar questions about the same document
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from embeddings import cosine_similarities
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_key(model: str, temperature: float, prompt: str) -> str:
+    """Exact-cache key; whitespace differences in the prompt don't matter"""
+    normalized = " ".join(prompt.split())
+    return hashlib.sha256(f"{model}\x00{temperature}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    Level 1 maps a hash of (model, temperature, prompt) to the raw answer.
+    Level 2 stores (document scope, question embedding, answer) and returns the
+    answer of the most similar earlier question about the same documents when its
+    cosine similarity reaches `semantic_threshold`. Level 2 is only used when an
+    `embed` function is given, and compares against the `max_scope_rows` most
+    recently used questions of a scope.
+
+    Entries expire after `ttl_seconds`; beyond `max_entries` per level the least
+    recently used ones are evicted. Without `db_path` the cache lives in memory.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        ttl_seconds: float = 24 * 3600,
+        max_entries: int = 10_000,
+        semantic_threshold: float = 0.95,
+        embed: Optional[Callable[[str], List[float]]] = None,
+        max_scope_rows: int = 2000,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_scope_rows = max_scope_rows
+        self.semantic_threshold = semantic_threshold
+        self.embed = embed
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        if db_path is not None:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(db_path) if db_path is not None else ":memory:", check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS exact_answers (
+                key TEXT PRIMARY KEY, answer TEXT, created_at REAL, last_used REAL
+            );
+            CREATE TABLE IF NOT EXISTS semantic_answers (
+                id INTEGER PRIMARY KEY, scope TEXT, question TEXT, vector BLOB,
+                answer TEXT, created_at REAL, last_used REAL
+            );
+            CREATE INDEX IF NOT EXISTS semantic_scope ON semantic_answers (scope);
+        """)
+        self._db.commit()
+
+    def _cutoff(self) -> float:
+        return time.time() - self.ttl_seconds
+
+    def _evict(self, table: str) -> None:
+        """Drop expired rows, then the least recently used beyond max_entries. Caller holds the lock."""
+        self._db.execute(f"DELETE FROM {table} WHERE created_at < ?", (self._cutoff(),))
+        self._db.execute(
+            f"DELETE FROM {table} WHERE rowid IN "
+            f"(SELECT rowid FROM {table} ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def get_exact(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT answer FROM exact_answers WHERE key = ? AND created_at >= ?", (key, self._cutoff())
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE exact_answers SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def put_exact(self, key: str, answer: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO exact_answers VALUES (?, ?, ?, ?)", (key, answer, now, now))
+            self._evict("exact_answers")
+            self._db.commit()
+
+    def get_similar(self, scope: str, question: str, vector: Optional[List[float]] = None) -> Optional[str]:
+        """Answer of the closest cached question in `scope`, if it is similar enough"""
+        if vector is None and self.embed is None:
+            return None
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, vector, answer FROM semantic_answers WHERE scope = ? AND created_at >= ? "
+                "ORDER BY last_used DESC LIMIT ?",
+                (scope, self._cutoff(), self.max_scope_rows),
+            ).fetchall()
+        if not rows:
+            return None
+
+        vector = vector if vector is not None else self.embed(question)
+        # Rows of another dimension were written by a different embedding model
+        rows = [row for row in rows if len(row[1]) == len(vector) * 4]
+        if not rows:
+            return None
+        matrix = np.frombuffer(b"".join(blob for _, blob, _ in rows), dtype=np.float32).reshape(len(rows), -1)
+        scores = cosine_similarities(matrix, vector)
+        best = int(np.argmax(scores))
+        if scores[best] < self.semantic_threshold:
+            return None
+        best_id, _, best_answer = rows[best]
+        with self._lock:
+            self._db.execute("UPDATE semantic_answers SET last_used = ? WHERE id = ?", (time.time(), best_id))
+            self._db.commit()
+        return best_answer
+
+    def put_similar(self, scope: str, question: str, answer: str, vector: Optional[List[float]] = None) -> None:
+        if vector is None and self.embed is None:
+            return
+        vector = vector if vector is not None else self.embed(question)
+        now = time.time()
+        with self._lock:
+            # One entry per question text and scope; re-asking refreshes it
+            self._db.execute("DELETE FROM semantic_answers WHERE scope = ? AND question = ?", (scope, question))
+            self._db.execute(
+                "INSERT INTO semantic_answers (scope, question, vector, answer, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (scope, question, array("f", vector).tobytes(), answer, now, now),
+            )
+            self._evict("semantic_answers")
+            self._db.commit()
+
+    def lookup(self, key: str, scope: Optional[str] = None, question: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Try the exact level, then (with a scope and question) the semantic one.
+        Returns (answer, "exact" | "semantic"), or (None, None) on a miss.
+        """
+        answer = self.get_exact(key)
+        if answer is not None:
+            self.record("exact")
+            return answer, "exact"
+        if scope is not None and question and self.embed is not None:
+            answer = self.get_similar(scope, question)
+            if answer is not None:
+                self.record("semantic")
+                return answer, "semantic"
+        self.record(None)
+        return None, None
+
+    def record(self, level: Optional[str]) -> None:
+        """Count a lookup that hit `level` ("exact" or "semantic"), or a miss for None"""
+        with self._lock:
+            if level == "exact":
+                self.exact_hits += 1
+            elif level == "semantic":
+                self.semantic_hits += 1
+            else:
+                self.misses += 1
+
+    def store(self, key: str, answer: str, scope: Optional[str] = None, question: Optional[str] = None) -> None:
+        self.put_exact(key, answer)
+        if scope is not None and question and self.embed is not None:
+            self.put_similar(scope, question, answer)
+
+    def invalidate(self, doc_id: str) -> int:
+        """
+        Forget semantic answers that may have drawn on `doc_id`. Exact entries need no
+        invalidation: new document text changes the prompt and so the key.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM semantic_answers WHERE scope = '*' OR ',' || scope || ',' LIKE ?",
+                (f"%,{doc_id},%",),
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM exact_answers")
+            self._db.execute("DELETE FROM semantic_answers")
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            exact = self._db.execute("SELECT COUNT(*) FROM exact_answers").fetchone()[0]
+            semantic = self._db.execute("SELECT COUNT(*) FROM semantic_answers").fetchone()[0]
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "exact_entries": exact,
+                "semantic_entries": semantic,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+
+def document_scope(doc_ids: Optional[List[str]]) -> str:
+    """Semantic-cache scope for a search over `doc_ids` ("*" = every document)"""
+    return ",".join(sorted(set(doc_ids))) if doc_ids else "*"
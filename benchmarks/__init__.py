@@ -0,0 +1,3 @@
+"""
+Benchmarks and comparison scripts; run them from the repository root with `python -m benchmarks.<name>`
+"""
@@ -0,0 +1,116 @@
+"""
+Recall vs latency of the approximate FAISS index types against exact flat search.
+
+    python -m benchmarks.ann_recall --chunks 100000
+    python -m benchmarks.ann_recall --url https://example.com/policy.pdf --queries 200
+
+By default the corpus is synthetic: clustered vectors the size of the configured
+embedding model's output, which behave much more like text embeddings than uniform
+noise. With --url the chunks of a real document are embedded instead and a sample
+of them is used as queries.
+
+For every HNSW efSearch / IVF-PQ nprobe setting it prints recall@k (share of the
+exact top-k that was found), mean and p95 per-query latency and build time.
+"""
+import argparse
+import json
+import time
+from typing import List
+
+import faiss
+import numpy as np
+
+from ann_index import build_index
+from config import settings
+
+
+def synthetic_corpus(count: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    assignment = rng.integers(0, clusters, size=count)
+    vectors = centers[assignment] + 0.35 * rng.normal(size=(count, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def embedded_corpus(url: str) -> np.ndarray:
+    from query_engine import get_context
+    from vector_store import get_embeddings
+
+    texts = [doc.page_content for doc in get_context(url)]
+    return np.array(get_embeddings().embed_documents(texts), dtype=np.float32)
+
+
+def measure(index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found[i] = ids[0]
+    recall = np.mean([len(set(row) & set(expected)) / k for row, expected in zip(found, truth)])
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "recall_at_k": round(float(recall), 4),
+        "mean_ms": round(float(latencies_ms.mean()), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+    }
+
+
+def timed_build(kind: str, vectors: np.ndarray):
+    start = time.perf_counter()
+    index = build_index(kind, vectors)
+    return index, round(time.perf_counter() - start, 2)
+
+
+def run(vectors: np.ndarray, queries: np.ndarray, k: int, ef_values: List[int], nprobe_values: List[int]) -> List[dict]:
+    flat, flat_build = timed_build("flat", vectors)
+    _, truth = flat.search(queries, k)
+    rows = [{"index": "flat", "param": None, "build_s": flat_build, **measure(flat, queries, truth, k)}]
+
+    hnsw, hnsw_build = timed_build("hnsw", vectors)
+    for ef in ef_values:
+        hnsw.hnsw.efSearch = ef
+        rows.append({"index": "hnsw", "param": f"efSearch={ef}", "build_s": hnsw_build, **measure(hnsw, queries, truth, k)})
+
+    ivfpq, ivfpq_build = timed_build("ivfpq", vectors)
+    for nprobe in nprobe_values:
+        ivfpq.nprobe = min(nprobe, ivfpq.nlist)
+        rows.append({"index": "ivfpq", "param": f"nprobe={ivfpq.nprobe}", "build_s": ivfpq_build, **measure(ivfpq, queries, truth, k)})
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=50_000, help="synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384, help="synthetic vector size (e5-small: 384)")
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--url", help="embed this document's chunks instead of a synthetic corpus")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=settings.max_docs_for_context * 5)
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--json", action="store_true", help="print rows as JSON instead of a table")
+    args = parser.parse_args()
+
+    vectors = embedded_corpus(args.url) if args.url else synthetic_corpus(args.chunks, args.dim, args.clusters)
+    rng = np.random.default_rng(1)
+    # Queries are perturbed corpus vectors so every query has real neighbours
+    queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+
+    rows = run(vectors, queries, args.k, args.ef, args.nprobe)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, {len(queries)} queries, recall@{args.k}")
+    print(f"{'index':<7} {'param':<14} {'recall':>7} {'mean ms':>8} {'p95 ms':>8} {'build s':>8}")
+    for row in rows:
+        print(f"{row['index']:<7} {row['param'] or '-':<14} {row['recall_at_k']:>7.4f} "
+              f"{row['mean_ms']:>8.3f} {row['p95_ms']:>8.3f} {row['build_s']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
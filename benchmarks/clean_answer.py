@@ -0,0 +1,173 @@
+"""
+Micro-benchmark and golden check for `llm.clean_answer`.
+
+    python -m benchmarks.clean_answer
+    python -m benchmarks.clean_answer --number 2000 --json
+    python -m benchmarks.clean_answer --write-golden
+
+The golden file holds realistic LLM answers together with the output of the
+previous, uncompiled implementation (kept below as `reference_clean_answer`).
+The run exits 1 if `clean_answer` no longer reproduces any of them, then times
+both implementations over the same answers.
+"""
+import argparse
+import json
+import re
+import sys
+import timeit
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from llm import clean_answer
+
+GOLDEN_PATH = Path(__file__).with_name("clean_answer_golden.json")
+
+# Answers in the shapes the model actually returns: boilerplate openers, document
+# references, bullets, ellipses, several sentences
+ANSWERS = [
+    "A grace period of thirty days is provided for premium payment after the due date.",
+    "According to the document, a grace period of thirty days is provided for premium payment after the due date.",
+    "Based on the information provided, there is a waiting period of thirty-six (36) months of continuous coverage for pre-existing diseases.",
+    "As per the policy: maternity expenses are covered after 24 months of continuous coverage. Document 2 states the limit is two deliveries.",
+    "The document states that the policy has a specific waiting period of two (2) years for cataract surgery (source: Document 3).",
+    "Yes, the policy covers medical expenses for the organ donor's hospitalization for harvesting the organ, provided the donation complies with the Transplantation of Human Organs Act, 1994.",
+    "No, the policy does not cover cosmetic surgery unless it is required for reconstruction following an accident, burn or cancer.",
+    "Document 1 indicates that a No Claim Discount of 5% on the base premium is offered on renewal for a one-year policy term.",
+    "The information shows: Expenses for health check-ups are reimbursed at the end of every block of two continuous policy years...",
+    "According to Document 4, a hospital is defined as an institution with at least 10 inpatient beds in towns with a population below ten lakhs, or 15 beds elsewhere.",
+    "The policy covers inpatient AYUSH treatment up to the sum insured.\n\n• Treatment must be taken in an AYUSH hospital.\n• Day care is not covered.",
+    "For Plan A, the daily room rent is capped at 1% of the sum insured and ICU charges at 2% of the sum insured. These limits do not apply to treatment in a preferred provider network hospital.",
+    "However, the policy excludes expenses arising from adventure sports . This includes para-jumping, rock climbing and scuba diving.",
+    "The document does not mention a specific waiting period for this condition.",
+    "It is mentioned in the document that claims must be notified within 24 hours of emergency hospitalization. Documents must be submitted within 30 days of discharge. Late claims may be considered in cases of hardship.",
+    "From the provided information - the sum insured is restored once per policy year. The restored amount cannot be used for the same illness. It applies to all insured members.",
+    "Indeed, pre-hospitalization expenses are covered for 30 days and post-hospitalization expenses for 60 days.",
+    "The data suggests the co-payment is 10% for insured persons aged above 60 years at entry.",
+    "Based on the document: Yes. The policy covers domiciliary hospitalization when the patient cannot be moved to a hospital.",
+    "As per the available data, ambulance charges are covered up to Rs. 2,000 per hospitalization.",
+    "The content shows that the free look period is 15 days from the date of receipt of the policy document...",
+    "Moreover, modern treatments such as robotic surgery are covered up to 50% of the sum insured",
+    "Thirty days.",
+    "The grace period is thirty days.",
+    "Furthermore, organ donor expenses are covered. (source: Section 3.1.14)",
+    "The policy reveals - dental treatment is excluded unless it requires hospitalization due to an accident.",
+    "This health policy provides coverage for hospitalization expenses. It includes room rent, nursing charges, and surgeon fees. Pre-existing diseases are covered after 36 months. Claims must be filed within 30 days.",
+    "According to the information in Document 2 and Document 5, the waiting period for hernia and hydrocele is 24 months.",
+    "The documents indicate that the policy term is one year , renewable for life .",
+    "Answer: The maximum entry age is 65 years.",
+    "",
+]
+
+
+def reference_clean_answer(text: str) -> str:
+    """clean_answer before it was compiled: ~70 substitutions built from re.escape on every call"""
+    if not text:
+        return ""
+
+    noisy_starts = [
+        "According to the document", "As per the policy", "Based on the information provided",
+        "According to Document", "The document states", "It is mentioned in the document",
+        "From the documents", "As per the available data", "Based on the document",
+        "According to the information", "The document indicates", "As mentioned in the document",
+        "From the provided information", "Based on the available information", "Document 1 states",
+        "Document 2 states", "Document 3 states", "The policy states", "The information indicates",
+        "The content shows", "The document mentions", "The text reveals", "The data suggests",
+        "The information shows", "According to", "Based on", "As per", "The documents indicate",
+        "The policy indicates", "The information shows", "The document shows", "The policy shows",
+        "The documents show", "The information reveals", "The document reveals", "The policy reveals",
+    ]
+
+    text = re.sub(r'Document \d+', '', text)
+    text = re.sub(r'\(source: [^)]+\)', '', text)
+    text = re.sub(r'Document \d+ states', '', text)
+    text = re.sub(r'Document \d+ indicates', '', text)
+
+    for phrase in noisy_starts:
+        text = re.sub(rf"^{re.escape(phrase)}[:,\- ]*", "", text, flags=re.IGNORECASE)
+        text = re.sub(rf"{re.escape(phrase)}[:,\- ]*", "", text, flags=re.IGNORECASE)
+
+    text = text.replace('\n', ' ').replace('•', '-').replace('●', '-')
+    text = re.sub(r'\s+', ' ', text).strip()
+
+    text = re.sub(r"[.]+$", "", text)
+    text = re.sub(r"\.\.\.$", "", text)
+    text = re.sub(r"\.\.\.", "", text)
+    text = re.sub(r'\s+([.,!?;])', r'\1', text)
+    text = re.sub(r'^(yes|no|however|indeed|furthermore|moreover)[, ]+', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'^(The|This|That|Such) [A-Za-z]+ (policy|document)[\s\-:,]*', '', text, flags=re.IGNORECASE)
+
+    sentences = re.split(r'(?<=[.!?]) +', text)
+    if len(sentences) > 2:
+        combined_length = sum(len(s) for s in sentences[:2])
+        if combined_length < 100 and len(sentences) > 2:
+            text = " ".join(sentences[:3])
+        else:
+            text = " ".join(sentences[:2])
+    else:
+        text = " ".join(sentences)
+
+    text = re.sub(r'^[A-Z][a-z]+ [a-z]+ [a-z]+[:,\- ]*', '', text)
+    text = re.sub(r'^[A-Z][a-z]+ [a-z]+[:,\- ]*', '', text)
+
+    return text.strip()
+
+
+def write_golden() -> None:
+    cases = [{"input": answer, "expected": reference_clean_answer(answer)} for answer in ANSWERS]
+    GOLDEN_PATH.write_text(json.dumps(cases, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    print(f"Wrote {len(cases)} cases to {GOLDEN_PATH}")
+
+
+def check_golden() -> List[Dict[str, str]]:
+    """Golden cases whose clean_answer output differs from the recorded one"""
+    cases = json.loads(GOLDEN_PATH.read_text(encoding="utf-8"))
+    failures = []
+    for case in cases:
+        actual = clean_answer(case["input"])
+        if actual != case["expected"]:
+            failures.append({**case, "actual": actual})
+    return failures
+
+
+def time_per_answer(func: Callable[[str], str], answers: List[str], number: int, repeat: int) -> float:
+    """Best-of-`repeat` microseconds per answer"""
+    best = min(timeit.repeat(lambda: [func(answer) for answer in answers], number=number, repeat=repeat))
+    return best / (number * len(answers)) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=500, help="passes over the answers per timing")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--write-golden", action="store_true", help="record the reference outputs and exit")
+    parser.add_argument("--json", action="store_true", help="print results as JSON instead of a table")
+    args = parser.parse_args()
+
+    if args.write_golden:
+        write_golden()
+        return
+
+    failures = check_golden()
+    answers = [answer for answer in ANSWERS if answer]
+    reference_us = time_per_answer(reference_clean_answer, answers, args.number, args.repeat)
+    compiled_us = time_per_answer(clean_answer, answers, args.number, args.repeat)
+    results = {
+        "golden_failures": len(failures),
+        "reference_us_per_answer": round(reference_us, 2),
+        "compiled_us_per_answer": round(compiled_us, 2),
+        "speedup": round(reference_us / compiled_us, 1),
+    }
+    if args.json:
+        print(json.dumps({**results, "failures": failures}, indent=2, ensure_ascii=False))
+    else:
+        for failure in failures:
+            print(f"MISMATCH {failure['input']!r}\n  expected {failure['expected']!r}\n  actual   {failure['actual']!r}")
+        print(f"{len(answers)} answers, golden failures: {len(failures)}")
+        print(f"reference  {reference_us:8.2f} us/answer")
+        print(f"compiled   {compiled_us:8.2f} us/answer  ({results['speedup']}x)")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+End-to-end benchmarks against a real server process. OpenRouter is replaced by
+benchmarks.stub_openrouter and documents come from benchmarks.fixture_server,
+so runs are repeatable and measure this service only.
+
+    python -m benchmarks.e2e
+    python -m benchmarks.e2e --llm-latency 0.8 --llm-error-rate 0.02 --concurrency 16 --load-requests 200
+    python -m benchmarks.e2e --save-baseline benchmarks/baseline.json
+    python -m benchmarks.e2e --baseline benchmarks/baseline.json --tolerance 0.15
+
+Benchmarks:
+  ingest     POST /ingest of the fixture PDF and HTML, alternately
+  retrieval  retrieval stages of POST /query (keyword search, query embedding, vector search)
+  hackrx     POST /hackrx/run with ten questions, one request at a time (the first, cold one is reported apart)
+  load       POST /hackrx/run from --concurrency clients at once
+
+Each reports p50/p95/p99/mean latency in ms, requests per second and errors.
+With --baseline, latencies more than --tolerance above the baseline (or
+throughput that much below) are flagged and the exit status is 1.
+The answer cache is disabled on the server so every question reaches the stub.
+"""
+import argparse
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from auth import get_api_key
+from benchmarks.fixture_server import FixtureServer
+from benchmarks.stub_openrouter import StubOpenRouter
+
+QUESTIONS = [
+    "What is the grace period for premium payment?",
+    "What is the waiting period for pre-existing diseases (PED) to be covered?",
+    "Does this policy cover maternity expenses, and what are the conditions?",
+    "What is the waiting period for cataract surgery?",
+    "Are the medical expenses for an organ donor covered under this policy?",
+    "What is the No Claim Discount (NCD) offered in this policy?",
+    "Is there a benefit for preventive health check-ups?",
+    "How does the policy define a 'Hospital'?",
+    "What is the extent of coverage for AYUSH treatments?",
+    "Are there any sub-limits on room rent and ICU charges for Plan A?",
+]
+RETRIEVAL_STAGES = ("keyword_search", "embed_query", "vector_search")
+# Metrics where a higher number is better; every other metric is a latency
+HIGHER_IS_BETTER = {"rps"}
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, q in 0-100"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies: List[float], errors: int, wall_seconds: float) -> Dict[str, Any]:
+    """Latencies in seconds -> ms percentiles, plus requests per second over `wall_seconds`"""
+    ms = [latency * 1000 for latency in latencies]
+    total = len(latencies) + errors
+
+    def rounded(value: Optional[float]) -> Optional[float]:
+        return round(value, 1) if value is not None else None
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "p50_ms": rounded(percentile(ms, 50)),
+        "p95_ms": rounded(percentile(ms, 95)),
+        "p99_ms": rounded(percentile(ms, 99)),
+        "mean_ms": rounded(sum(ms) / len(ms)) if ms else None,
+        "rps": round(total / wall_seconds, 2) if wall_seconds else None,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class AppServer:
+    """The app under uvicorn in a child process, pointed at the stub and a throwaway cache dir"""
+
+    def __init__(self, llm_url: str, cache_dir: str, ready_timeout: float, extra_env: Dict[str, str]):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.ready_timeout = ready_timeout
+        self.env = dict(
+            os.environ,
+            OPENROUTER_BASE_URL=llm_url,
+            OPENROUTER_API_KEY="benchmark-stub-key",
+            CACHE_DIR=cache_dir,
+            ANSWER_CACHE_ENABLED="false",
+            LOG_LEVEL="WARNING",
+            **extra_env,
+        )
+        self.process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> "AppServer":
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.port), "--log-level", "warning"],
+            env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.time() + self.ready_timeout
+        with httpx.Client(base_url=self.url, timeout=5.0) as client:
+            while time.time() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"Server exited with status {self.process.returncode}")
+                try:
+                    if client.get("/ready").status_code == 200:
+                        return self
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError(f"Server not ready after {self.ready_timeout}s")
+
+    def __exit__(self, *exc) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=15)
+
+
+def timed(call: Callable[[], httpx.Response]) -> Tuple[float, Optional[httpx.Response]]:
+    start = time.perf_counter()
+    try:
+        response = call()
+    except httpx.HTTPError:
+        response = None
+    return time.perf_counter() - start, response
+
+
+def ok(response: Optional[httpx.Response]) -> bool:
+    return response is not None and response.status_code == 200
+
+
+def bench_ingest(client: httpx.Client, fixtures: FixtureServer, runs: int) -> Dict[str, Any]:
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for i in range(runs):
+        # A fresh query string per run, so the download and parse are never skipped
+        url = fixtures.url(f"/policy.{'pdf' if i % 2 == 0 else 'html'}?run={i}")
+        seconds, response = timed(lambda: client.post("/ingest", json={"url": url, "doc_id": f"bench-{i}"}))
+        if ok(response):
+            latencies.append(seconds)
+        else:
+            errors += 1
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def bench_retrieval(client: httpx.Client, runs: int) -> Dict[str, Any]:
+    """Retrieval time as reported by /query?timings=true, so the LLM stub's latency is left out"""
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for i in range(runs):
+        question = QUESTIONS[i % len(QUESTIONS)]
+        _, response = timed(lambda: client.post("/query", params={"timings": "true"},
+                                                json={"questions": [question], "doc_ids": ["bench-0"]}))
+        if ok(response) and not response.json()[0].get("error"):
+            timings = response.json()[0]["timings"] or {}
+            latencies.append(sum(timings.get(stage, 0.0) for stage in RETRIEVAL_STAGES))
+        else:
+            errors += 1
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def _hackrx(client: httpx.Client, url: str, questions: List[str]) -> Tuple[float, bool]:
+    seconds, response = timed(lambda: client.post("/hackrx/run", json={"documents": url, "questions": questions}))
+    return seconds, ok(response) and not response.json().get("errors")
+
+
+def bench_hackrx(client: httpx.Client, url: str, runs: int) -> Dict[str, Any]:
+    cold_seconds, cold_ok = _hackrx(client, url, QUESTIONS)
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for _ in range(runs):
+        seconds, success = _hackrx(client, url, QUESTIONS)
+        if success:
+            latencies.append(seconds)
+        else:
+            errors += 1
+    result = summarize(latencies, errors, time.perf_counter() - start)
+    result["cold_ms"] = round(cold_seconds * 1000, 1) if cold_ok else None
+    return result
+
+
+def bench_load(client: httpx.Client, url: str, concurrency: int, requests: int, questions: int) -> Dict[str, Any]:
+    def one(i: int) -> Tuple[float, bool]:
+        # Rotate through the questions so requests differ
+        chosen = [QUESTIONS[(i + j) % len(QUESTIONS)] for j in range(questions)]
+        return _hackrx(client, url, chosen)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+    latencies = [seconds for seconds, success in outcomes if success]
+    result = summarize(latencies, len(outcomes) - len(latencies), wall)
+    result["concurrency"] = concurrency
+    return result
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[Dict[str, Any]]:
+    """One row per metric present in both runs; `regression` is True when it moved the wrong way by more than `tolerance`"""
+    rows = []
+    for bench, metrics in results.items():
+        if bench == "stub":
+            continue
+        for metric, current in metrics.items():
+            previous = baseline.get(bench, {}).get(metric)
+            if metric in ("requests", "errors", "concurrency") or not current or not previous:
+                continue
+            change = (current - previous) / previous
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            rows.append({
+                "benchmark": bench, "metric": metric, "baseline": previous, "current": current,
+                "change": round(change, 3), "regression": worse > tolerance,
+            })
+    return rows
+
+
+def run(args) -> Dict[str, Dict[str, Any]]:
+    stub = StubOpenRouter(latency=args.llm_latency, jitter=args.llm_jitter, error_rate=args.llm_error_rate, seed=0).start()
+    fixtures = FixtureServer(pages=args.pages).start()
+    auth = {"Authorization": f"Bearer {get_api_key()}"}
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                AppServer(stub.url, cache_dir, args.ready_timeout, {"LLM_MAX_CONCURRENCY": str(args.llm_concurrency)}) as app, \
+                httpx.Client(base_url=app.url, headers=auth, timeout=args.request_timeout,
+                             limits=httpx.Limits(max_connections=args.concurrency + 2)) as client:
+            results["ingest"] = bench_ingest(client, fixtures, args.ingest_runs)
+            results["retrieval"] = bench_retrieval(client, args.retrieval_runs)
+            document = fixtures.url("/policy.pdf?hackrx")
+            results["hackrx"] = bench_hackrx(client, document, args.hackrx_runs)
+            results["load"] = bench_load(client, document, args.concurrency, args.load_requests, args.load_questions)
+    finally:
+        stub.shutdown()
+        fixtures.shutdown()
+    results["stub"] = {"llm_requests": stub.requests, "llm_errors": stub.errors}
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="stub OpenRouter seconds per reply")
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="LLM_MAX_CONCURRENCY for the server")
+    parser.add_argument("--pages", type=int, default=40, help="fixture document length")
+    parser.add_argument("--ingest-runs", type=int, default=10)
+    parser.add_argument("--retrieval-runs", type=int, default=50)
+    parser.add_argument("--hackrx-runs", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--load-requests", type=int, default=64)
+    parser.add_argument("--load-questions", type=int, default=3, help="questions per load request")
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--save-baseline", help="write the results as the new baseline")
+    parser.add_argument("--baseline", help="compare against this baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown before flagging")
+    args = parser.parse_args()
+
+    results = run(args)
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    print(f"{'benchmark':<10} {'reqs':>5} {'errs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'rps':>8}")
+    for bench, row in results.items():
+        if bench == "stub":
+            continue
+        cells = [f"{row[key]:>9.1f}" if row[key] is not None else f"{'-':>9}" for key in ("p50_ms", "p95_ms", "p99_ms", "mean_ms")]
+        rps = f"{row['rps']:>8.2f}" if row["rps"] is not None else f"{'-':>8}"
+        print(f"{bench:<10} {row['requests']:>5} {row['errors']:>5} {' '.join(cells)} {rps}")
+    if results["hackrx"].get("cold_ms") is not None:
+        print(f"hackrx cold request (download + index build): {results['hackrx']['cold_ms']:.1f} ms")
+    print(f"stub OpenRouter: {results['stub']['llm_requests']} requests, {results['stub']['llm_errors']} injected errors")
+
+    if not args.baseline:
+        return
+    with open(args.baseline) as f:
+        rows = compare(results, json.load(f), args.tolerance)
+    regressions = [row for row in rows if row["regression"]]
+    print(f"\nvs {args.baseline} (tolerance {args.tolerance:.0%}):")
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"  {row['benchmark']:<10} {row['metric']:<8} {row['baseline']:>10} -> {row['current']:>10} ({row['change']:+.1%}){flag}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
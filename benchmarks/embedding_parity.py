@@ -0,0 +1,64 @@
+"""
+Compare an embedding backend against the PyTorch one before switching EMBEDDING_BACKEND.
+
+    python -m benchmarks.embedding_parity --backend onnx
+    python -m benchmarks.embedding_parity --backend quantized --url https://example.com/policy.pdf
+
+Reports cosine similarity between the two backends' vectors (1.0 = identical) and
+the time each took to embed the same texts.
+"""
+import argparse
+import json
+from typing import List
+
+from config import settings
+from embeddings import EMBEDDING_BACKENDS, compare_backends, load_embedding_model
+
+SAMPLE_TEXTS = [
+    "What is the grace period for premium payment?",
+    "The waiting period for pre-existing diseases is thirty-six months of continuous coverage.",
+    "Maternity expenses are covered after the policy has been in force for 24 months.",
+    "Cataract surgery is covered after a waiting period of two years.",
+    "Room rent is capped at one percent of the sum insured per day.",
+    "The policy covers organ donor expenses for harvesting the organ.",
+    "A no claim discount of five percent is offered on renewal.",
+    "AYUSH treatments are covered up to the sum insured in an AYUSH hospital.",
+]
+
+
+def load_texts(args) -> List[str]:
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    if args.url:
+        from query_engine import get_context
+        return [doc.page_content for doc in get_context(args.url)][:args.limit]
+    return SAMPLE_TEXTS
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=[b for b in EMBEDDING_BACKENDS if b != "torch"], default="onnx")
+    parser.add_argument("--model", default=settings.embedding_model)
+    parser.add_argument("--file", help="text file with one passage per line")
+    parser.add_argument("--url", help="document URL whose chunks are embedded")
+    parser.add_argument("--limit", type=int, default=500, help="max chunks taken from --url")
+    parser.add_argument("--batch-size", type=int, default=settings.embedding_batch_size)
+    parser.add_argument("--threads", type=int, default=settings.embedding_threads)
+    args = parser.parse_args()
+
+    texts = load_texts(args)
+    options = {"batch_size": args.batch_size, "threads": args.threads}
+    reference = load_embedding_model(args.model, backend="torch", **options)
+    candidate = load_embedding_model(args.model, backend=args.backend, **options)
+    # Warm both up so model/session initialisation isn't counted as embedding time
+    reference.embed_documents(texts[:1])
+    candidate.embed_documents(texts[:1])
+
+    report = compare_backends(texts, candidate, reference)
+    report.update({"model": args.model, "backend": args.backend, **options})
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
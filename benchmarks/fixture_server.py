@@ -0,0 +1,155 @@
+"""
+Local server for benchmark documents: a synthetic insurance policy as a PDF and
+as an HTML page, so ingest runs don't depend on a remote blob store.
+
+    python -m benchmarks.fixture_server --port 8082 --pages 40
+
+serves /policy.pdf and /policy.html. Any query string is ignored, so
+`/policy.pdf?run=3` gives a fresh cache key for the same document.
+"""
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+
+# Clauses the benchmark questions are about, mixed in with filler
+CLAUSES = [
+    "A grace period of thirty days is provided for premium payment after the due date to renew or continue the policy.",
+    "There is a waiting period of thirty-six months of continuous coverage for pre-existing diseases and their complications.",
+    "Maternity expenses are covered after the female insured person has been continuously covered for twenty-four months.",
+    "The policy has a specific waiting period of two years for cataract surgery.",
+    "Medical expenses for harvesting an organ for an insured person are covered when the donation complies with the law.",
+    "A no claim discount of five percent on the base premium is offered on renewal for a one-year policy term.",
+    "Expenses for health check-ups are reimbursed at the end of every block of two continuous policy years.",
+    "A hospital means an institution with at least ten inpatient beds, qualified nursing staff and a daily record of patients.",
+    "Inpatient AYUSH treatment is covered up to the sum insured in an AYUSH hospital.",
+    "For Plan A, daily room rent is capped at one percent of the sum insured and ICU charges at two percent.",
+]
+FILLER = (
+    "The insured person shall give notice of any claim within the time limits stated in this section, "
+    "and all documents required by the company shall be submitted together with the claim form."
+)
+
+
+def policy_sections(pages: int) -> List[Tuple[str, List[str]]]:
+    """(heading, paragraphs) for every page; each clause appears once, spread through the document"""
+    clauses_on = {}
+    for i, clause in enumerate(CLAUSES):
+        clauses_on.setdefault(i * pages // len(CLAUSES), []).append(clause)
+    sections = []
+    for page in range(pages):
+        paragraphs = [f"{FILLER} Clause {page + 1}.{i + 1}." for i in range(4)]
+        paragraphs[2:2] = clauses_on.get(page, [])
+        sections.append((f"Section {page + 1}", paragraphs))
+    return sections
+
+
+def _wrap(text: str, width: int = 90) -> List[str]:
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    return lines + ([line] if line else [])
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_pdf(pages: int) -> bytes:
+    """A plain-text PDF, one section per page, written by hand so no PDF library is needed"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for heading, paragraphs in policy_sections(pages):
+        lines = [heading] + [line for paragraph in paragraphs for line in _wrap(paragraph) + [""]]
+        text = "\n".join(f"({_pdf_escape(line)}) Tj T*" for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 50 780 Td\n{text}\nET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def build_html(pages: int) -> bytes:
+    body = "\n".join(
+        f"<h2>{heading}</h2>\n" + "\n".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+        for heading, paragraphs in policy_sections(pages)
+    )
+    return f"<html><head><title>Benchmark Policy</title></head><body>\n{body}\n</body></html>".encode()
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, pages: int = 40):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.documents = {
+            "/policy.pdf": (build_pdf(pages), "application/pdf"),
+            "/policy.html": (build_html(pages), "text/html; charset=utf-8"),
+        }
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+    def start(self) -> "FixtureServer":
+        threading.Thread(target=self.serve_forever, name="fixture-server", daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FixtureServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        document = self.server.documents.get(self.path.split("?")[0])
+        if document is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body, content_type = document
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--pages", type=int, default=40)
+    args = parser.parse_args()
+
+    server = FixtureServer(args.port, args.pages)
+    print(f"Fixtures at {server.url('/policy.pdf')} and {server.url('/policy.html')}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
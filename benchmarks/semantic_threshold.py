@@ -0,0 +1,88 @@
+"""
+Labelled check for ANSWER_CACHE_SEMANTIC_THRESHOLD: embeds pairs of questions
+with the configured embedding model and reports whether the threshold separates
+rewordings of one question (same answer) from different questions with similar
+wording (different answers).
+
+    python -m benchmarks.semantic_threshold
+    python -m benchmarks.semantic_threshold --threshold 0.97 --json
+
+Exits 1 when a pair with different answers scores at or above the threshold,
+i.e. when turning on ANSWER_CACHE_SEMANTIC could return another question's answer.
+Rewordings scoring below it only cost a cache miss.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Tuple
+
+from config import settings
+from embeddings import cosine_similarities
+
+# (question, question, same answer?)
+PAIRS: List[Tuple[str, str, bool]] = [
+    ("What is the grace period for premium payment?", "How long is the grace period for paying the premium?", True),
+    ("What is the waiting period for cataract surgery?", "How long must I wait before cataract surgery is covered?", True),
+    ("Does the policy cover maternity expenses?", "Are maternity expenses covered by this policy?", True),
+    ("What is the No Claim Discount offered?", "How much No Claim Discount does the policy give?", True),
+    ("How does the policy define a hospital?", "What is the definition of a hospital in the policy?", True),
+    ("Are organ donor expenses covered?", "Does the policy pay for the organ donor's medical expenses?", True),
+    ("What is the waiting period for pre-existing diseases?", "How long is the waiting period for pre-existing diseases (PED)?", True),
+    ("Is there a benefit for preventive health check-ups?", "Does the policy reimburse preventive health check-ups?", True),
+    ("What is the waiting period for cataract surgery?", "What is the waiting period for maternity expenses?", False),
+    ("What is the waiting period for cataract surgery?", "What is the waiting period for pre-existing diseases?", False),
+    ("What is the waiting period for hernia?", "What is the waiting period for hydrocele?", False),
+    ("What is the room rent limit for Plan A?", "What is the room rent limit for Plan B?", False),
+    ("What are the ICU charges limit for Plan A?", "What is the room rent limit for Plan A?", False),
+    ("What is the grace period for premium payment?", "What is the free look period of the policy?", False),
+    ("Is AYUSH treatment covered?", "Is dental treatment covered?", False),
+    ("Are pre-hospitalization expenses covered?", "Are post-hospitalization expenses covered?", False),
+    ("What is the No Claim Discount offered?", "What is the co-payment for senior citizens?", False),
+    ("Does the policy cover cosmetic surgery?", "Does the policy cover bariatric surgery?", False),
+]
+
+
+def score_pairs(embed_documents) -> List[Dict[str, Any]]:
+    questions = list(dict.fromkeys(question for pair in PAIRS for question in pair[:2]))
+    vectors = dict(zip(questions, embed_documents(questions)))
+    return [
+        {"a": a, "b": b, "same": same, "score": round(float(cosine_similarities([vectors[a]], vectors[b])[0]), 4)}
+        for a, b, same in PAIRS
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threshold", type=float, default=settings.answer_cache_semantic_threshold)
+    parser.add_argument("--json", action="store_true", help="print results as JSON instead of a table")
+    args = parser.parse_args()
+
+    from vector_store import get_embeddings  # deferred: loads the embedding model
+    # The uncached model, so the check never reads or fills the embedding cache
+    pairs = score_pairs(get_embeddings().base.embed_documents)
+    different = [pair["score"] for pair in pairs if not pair["same"]]
+    same = [pair["score"] for pair in pairs if pair["same"]]
+    unsafe = [pair for pair in pairs if not pair["same"] and pair["score"] >= args.threshold]
+    results = {
+        "model": settings.embedding_model,
+        "threshold": args.threshold,
+        "max_different_score": max(different),
+        "min_same_score": min(same),
+        "same_pairs_reused": sum(score >= args.threshold for score in same),
+        "same_pairs": len(same),
+        "unsafe_pairs": len(unsafe),
+    }
+    if args.json:
+        print(json.dumps({**results, "pairs": pairs}, indent=2))
+    else:
+        for pair in sorted(pairs, key=lambda pair: -pair["score"]):
+            label = "same" if pair["same"] else "DIFFERENT" if pair in unsafe else "different"
+            print(f"{pair['score']:.4f}  {label:<9}  {pair['a']}  |  {pair['b']}")
+        print(f"\n{results['model']} at threshold {args.threshold}: highest different-answer score "
+              f"{results['max_different_score']}, {results['same_pairs_reused']}/{len(same)} rewordings reused")
+    if unsafe:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
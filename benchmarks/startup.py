@@ -0,0 +1,116 @@
+"""
+Cold-start timings: how long `import main` takes and how long a fresh server
+needs before it answers its first request and before /ready reports the
+embedding model loaded.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 5 --json
+
+Each run starts a new Python process, so nothing is shared between runs
+(the OS file cache still is; the first run is usually the slowest).
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def import_time() -> float:
+    """Seconds spent importing main in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _poll(client: httpx.Client, path: str, deadline: float,
+          accept: Callable[[httpx.Response], bool] = lambda response: True) -> Optional[float]:
+    """Time (perf_counter) at which `path` first gave an accepted response, or None at the deadline"""
+    while time.perf_counter() < deadline:
+        try:
+            response = client.get(path)
+            if accept(response):
+                return time.perf_counter()
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    return None
+
+
+def _model_loaded(response: httpx.Response) -> bool:
+    return response.json()["checks"]["embeddings"]["loaded"]
+
+
+def server_times(timeout: float) -> Dict[str, Optional[float]]:
+    """Seconds from launching uvicorn to the first answered request and to the embedding model being loaded"""
+    port = _free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=dict(os.environ),
+    )
+    try:
+        deadline = start + timeout
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=5.0) as client:
+            first = _poll(client, "/", deadline)
+            # /ready also checks the LLM key; only the model loading is part of startup
+            ready = _poll(client, "/ready", deadline, accept=_model_loaded) if first else None
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return {
+        "first_request_s": round(first - start, 3) if first else None,
+        "ready_s": round(ready - start, 3) if ready else None,
+    }
+
+
+def summarize(values: List[Optional[float]]) -> Dict[str, Optional[float]]:
+    values = [value for value in values if value is not None]
+    if not values:
+        return {"min": None, "median": None, "max": None}
+    return {"min": round(min(values), 3), "median": round(statistics.median(values), 3), "max": round(max(values), 3)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for a server to become ready")
+    parser.add_argument("--skip-server", action="store_true", help="only measure the import")
+    parser.add_argument("--json", action="store_true", help="print results as JSON instead of a table")
+    args = parser.parse_args()
+
+    imports = [import_time() for _ in range(args.runs)]
+    servers = [] if args.skip_server else [server_times(args.timeout) for _ in range(args.runs)]
+    results = {
+        "import_main_s": summarize(imports),
+        "first_request_s": summarize([run["first_request_s"] for run in servers]),
+        "ready_s": summarize([run["ready_s"] for run in servers]),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.runs} runs")
+    print(f"{'metric':<18} {'min':>8} {'median':>8} {'max':>8}")
+    for name, row in results.items():
+        cells = [f"{row[key]:>8.3f}" if row[key] is not None else f"{'-':>8}" for key in ("min", "median", "max")]
+        print(f"{name:<18} {' '.join(cells)}")
+
+
+if __name__ == "__main__":
+    main()
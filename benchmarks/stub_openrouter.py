@@ -0,0 +1,146 @@
+"""
+Local stand-in for the OpenRouter chat-completions API, so benchmarks measure
+this service rather than a remote model.
+
+    python -m benchmarks.stub_openrouter --port 8081 --latency 0.8 --jitter 0.3 --error-rate 0.02
+
+then run the app with OPENROUTER_BASE_URL=http://127.0.0.1:8081 (any OPENROUTER_API_KEY).
+
+Every reply waits `latency` +- `jitter` seconds. A share `error_rate` of the
+requests fail with `error_status` (503 by default, retried by the client).
+Grouped prompts get a JSON array with one answer per question, and stream=true
+requests are answered as server-sent events, word by word.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+ANSWER = "The policy covers this after a waiting period of thirty days, subject to the stated conditions."
+GROUP_PATTERN = re.compile(r"JSON array of (\d+) strings")
+
+
+class StubOpenRouter(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.5, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 503, seed: Optional[int] = None):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> "StubOpenRouter":
+        """Serve on a daemon thread; returns self for chaining"""
+        threading.Thread(target=self.serve_forever, name="stub-openrouter", daemon=True).start()
+        return self
+
+    def plan(self):
+        """(delay, fail) for the next request"""
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            fail = self.random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return delay, fail
+
+
+def reply_text(payload: Dict[str, Any]) -> str:
+    prompt = payload["messages"][-1]["content"]
+    group = GROUP_PATTERN.search(prompt)
+    if group:
+        return json.dumps([f"{ANSWER} ({i + 1})" for i in range(int(group.group(1)))])
+    return ANSWER
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StubOpenRouter
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.endswith("/chat/completions"):
+            self._send(404, b'{"error": "not found"}')
+            return
+        payload = json.loads(body)
+        delay, fail = self.server.plan()
+        time.sleep(delay)
+        if fail:
+            self._send(self.server.error_status, json.dumps({"error": {"message": "stub failure"}}).encode())
+            return
+
+        text = reply_text(payload)
+        usage = {"prompt_tokens": len(payload["messages"][-1]["content"]) // 4, "completion_tokens": len(text) // 4}
+        if payload.get("stream"):
+            self._stream(text, usage)
+            return
+        self._send(200, json.dumps({
+            "id": "stub",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        }).encode())
+
+    def _stream(self, text: str, usage: Dict[str, int]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(data: str) -> None:
+            event = f"data: {data}\n\n".encode()
+            self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            self.wfile.flush()
+
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            delta = word if i == len(words) - 1 else word + " "
+            chunk(json.dumps({"choices": [{"index": 0, "delta": {"content": delta}}]}))
+        chunk(json.dumps({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}))
+        chunk("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+- seconds around --latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    server = StubOpenRouter(args.port, args.latency, args.jitter, args.error_rate, args.error_status)
+    print(f"Stub OpenRouter listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
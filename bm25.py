@@ -0,0 +1,114 @@
+"""
+Lexical (BM25) retrieval over the same chunks as the FAISS index, plus
+reciprocal rank fusion to merge the two rankings
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, Sequence, Tuple
+
+# BM25 term-frequency saturation and length normalisation
+K1 = 1.5
+B = 0.75
+
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be been before being below between both but by
+can could did do does doing during each for from further had has have having he her here hers him his how
+i if in into is it its itself just me more most my no nor not of off on once only or other our out over own
+same she should so some such than that the their them then there these they this those through to too under
+until up very was we were what when where which while who whom why will with would you your
+""".split())
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords, with a light plural strip ("diseases" -> "disease")"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS or (len(token) == 1 and not token.isdigit()):
+            continue
+        if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """
+    Inverted index of chunk id -> term frequencies, scored with Okapi BM25.
+    Not thread-safe on its own; VectorIndex guards it with its lock.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, int]] = {}  # term -> {chunk_id: tf}
+        self._lengths: Dict[str, int] = {}  # chunk_id -> token count
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, chunk_id: str, text: str) -> None:
+        if chunk_id in self._lengths:
+            self.remove([chunk_id])
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[chunk_id] = tf
+        length = sum(counts.values())
+        self._lengths[chunk_id] = length
+        self._total_length += length
+
+    def remove(self, chunk_ids: Iterable[str]) -> None:
+        removed = {chunk_id for chunk_id in chunk_ids if chunk_id in self._lengths}
+        if not removed:
+            return
+        for chunk_id in removed:
+            self._total_length -= self._lengths.pop(chunk_id)
+        for term in list(self._postings):
+            postings = self._postings[term]
+            for chunk_id in removed & postings.keys():
+                del postings[chunk_id]
+            if not postings:
+                del self._postings[term]
+
+    def idf(self, term: str) -> float:
+        df = len(self._postings.get(term, ()))
+        return math.log(1 + (len(self._lengths) - df + 0.5) / (df + 0.5))
+
+    def score(self, query: str) -> Dict[str, Tuple[float, float]]:
+        """
+        Every chunk sharing a term with the query, as chunk_id -> (BM25 score, coverage).
+        Coverage is the IDF-weighted share of the query's terms the chunk contains:
+        1.0 means every term matched.
+        """
+        terms = set(tokenize(query))
+        if not terms or not self._lengths:
+            return {}
+        average_length = self._total_length / len(self._lengths)
+        weights = {term: self.idf(term) for term in terms}
+        total_weight = sum(weights.values())
+
+        scores: Dict[str, float] = {}
+        matched: Dict[str, float] = {}
+        for term, weight in weights.items():
+            for chunk_id, tf in self._postings.get(term, {}).items():
+                norm = K1 * (1 - B + B * self._lengths[chunk_id] / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + weight * tf * (K1 + 1) / (tf + norm)
+                matched[chunk_id] = matched.get(chunk_id, 0.0) + weight
+
+        return {chunk_id: (scores[chunk_id], matched[chunk_id] / total_weight) for chunk_id in scores}
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float, float]]:
+        """Top-k chunks as (chunk_id, BM25 score, coverage)"""
+        scored = self.score(query)
+        best = sorted(scored, key=lambda chunk_id: scored[chunk_id][0], reverse=True)[:k]
+        return [(chunk_id, *scored[chunk_id]) for chunk_id in best]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: int = 60) -> List[Hashable]:
+    """Merge ranked lists of ids: each id scores sum(1 / (k + rank)) over the lists it appears in"""
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -4,12 +4,6 @@ from typing import Optional, List
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
-# Optional: CUDA availability check
-try:
-    import torch
-except ImportError:
-    torch = None
-
 
 class Settings(BaseSettings):
     """App settings loaded from environment variables or defaults"""
@@ -22,29 +16,86 @@ class Settings(BaseSettings):
     llm_model: str = Field(default="anthropic/claude-3-haiku", env="LLM_MODEL")
     llm_temperature: float = Field(default=0.1, env="LLM_TEMPERATURE")
     llm_max_tokens: int = Field(default=150, env="LLM_MAX_TOKENS")
+    llm_context_max_tokens: int = Field(default=1200, env="LLM_CONTEXT_MAX_TOKENS")  # document context per prompt
+    answer_cache_enabled: bool = Field(default=True, env="ANSWER_CACHE_ENABLED")
+    answer_cache_ttl_hours: int = Field(default=24, env="ANSWER_CACHE_TTL_HOURS")
+    answer_cache_max_entries: int = Field(default=10_000, env="ANSWER_CACHE_MAX_ENTRIES")  # per cache level
+    answer_cache_semantic: bool = Field(default=False, env="ANSWER_CACHE_SEMANTIC")  # also reuse answers of similar questions
+    answer_cache_semantic_threshold: float = Field(default=0.95, env="ANSWER_CACHE_SEMANTIC_THRESHOLD")  # cosine similarity
+    answer_cache_semantic_max_rows: int = Field(default=2000, env="ANSWER_CACHE_SEMANTIC_MAX_ROWS")  # compared per lookup and scope
+    llm_group_questions: bool = Field(default=False, env="LLM_GROUP_QUESTIONS")  # answer related questions in one call
+    llm_group_max_questions: int = Field(default=5, env="LLM_GROUP_MAX_QUESTIONS")
+    llm_group_min_overlap: float = Field(default=0.5, env="LLM_GROUP_MIN_OVERLAP")  # share of a question's chunks already in the group
+    llm_max_concurrency: int = Field(default=8, env="LLM_MAX_CONCURRENCY")  # questions answered in parallel
+    llm_timeout: float = Field(default=15.0, env="LLM_TIMEOUT")
+    llm_max_retries: int = Field(default=2, env="LLM_MAX_RETRIES")  # retries on 429/5xx and network errors
+    llm_backoff_base: float = Field(default=0.5, env="LLM_BACKOFF_BASE")
+    llm_backoff_max: float = Field(default=8.0, env="LLM_BACKOFF_MAX")
+    llm_hedge_requests: bool = Field(default=False, env="LLM_HEDGE_REQUESTS")  # duplicate calls slower than p95
+    llm_hedge_min_samples: int = Field(default=20, env="LLM_HEDGE_MIN_SAMPLES")
+    llm_max_connections: int = Field(default=20, env="LLM_MAX_CONNECTIONS")
+    llm_unhealthy_after: int = Field(default=5, env="LLM_UNHEALTHY_AFTER")  # consecutive failed calls before /ready fails
 
     # Embedding Model
     embedding_model: str = Field(default="intfloat/e5-small", env="EMBEDDING_MODEL")
     embedding_device: str = Field(default="cpu", env="EMBEDDING_DEVICE")  # "cuda" or "cpu"
+    embedding_backend: str = Field(default="torch", env="EMBEDDING_BACKEND")  # "torch", "quantized" (int8) or "onnx"
+    embedding_batch_size: int = Field(default=32, env="EMBEDDING_BATCH_SIZE")
+    embedding_threads: int = Field(default=0, env="EMBEDDING_THREADS")  # CPU threads for the model; 0 = library default
+    embedding_cache_size: int = Field(default=50_000, env="EMBEDDING_CACHE_SIZE")  # float32 vectors kept in memory (~1.5 KB each)
+    embedding_cache_disk_entries: int = Field(default=200_000, env="EMBEDDING_CACHE_DISK_ENTRIES")  # vectors kept in embeddings.sqlite3
+    warmup_on_startup: bool = Field(default=True, env="WARMUP_ON_STARTUP")  # load the model in the background at startup
+    warmup_retries: int = Field(default=3, env="WARMUP_RETRIES")  # per step, before /ready starts a new warmup
+    warmup_retry_backoff: float = Field(default=2.0, env="WARMUP_RETRY_BACKOFF")  # seconds, doubled per retry
 
     # Document Processing
     chunk_size: int = Field(default=500, env="CHUNK_SIZE")
     chunk_overlap: int = Field(default=50, env="CHUNK_OVERLAP")
     max_docs_for_context: int = Field(default=2, env="MAX_DOCS_FOR_CONTEXT")
+    pdf_workers: int = Field(default=0, env="PDF_WORKERS")  # 0 = one process per CPU
+    pdf_parallel_min_pages: int = Field(default=20, env="PDF_PARALLEL_MIN_PAGES")
+    max_indexed_documents: int = Field(default=50, env="MAX_INDEXED_DOCUMENTS")  # per-document indexes kept in memory
+
+    # Vector Index
+    faiss_index_type: str = Field(default="auto", env="FAISS_INDEX_TYPE")  # "auto", "flat", "hnsw" or "ivfpq"
+    faiss_hnsw_min_chunks: int = Field(default=20_000, env="FAISS_HNSW_MIN_CHUNKS")  # auto: HNSW from this size
+    faiss_ivfpq_min_chunks: int = Field(default=500_000, env="FAISS_IVFPQ_MIN_CHUNKS")  # auto: IVF-PQ from this size
+    faiss_hnsw_m: int = Field(default=32, env="FAISS_HNSW_M")  # graph links per vector
+    faiss_hnsw_ef_construction: int = Field(default=200, env="FAISS_HNSW_EF_CONSTRUCTION")
+    faiss_hnsw_ef_search: int = Field(default=64, env="FAISS_HNSW_EF_SEARCH")  # higher = better recall, slower
+    faiss_ivf_nlist: int = Field(default=0, env="FAISS_IVF_NLIST")  # 0 = about 4 * sqrt(chunks)
+    faiss_ivf_nprobe: int = Field(default=16, env="FAISS_IVF_NPROBE")  # lists scanned per query
+    faiss_pq_m: int = Field(default=32, env="FAISS_PQ_M")  # bytes per compressed vector
+
+    # Retrieval
+    retrieval_mode: str = Field(default="hybrid", env="RETRIEVAL_MODE")  # "hybrid" (BM25 + vectors) or "vector"
+    hybrid_candidates: int = Field(default=20, env="HYBRID_CANDIDATES")  # hits per ranking fed into fusion
+    rrf_k: int = Field(default=60, env="RRF_K")  # reciprocal rank fusion damping constant
+    keyword_fast_path: bool = Field(default=True, env="KEYWORD_FAST_PATH")  # skip embedding on strong keyword matches
+    keyword_fast_path_coverage: float = Field(default=1.0, env="KEYWORD_FAST_PATH_COVERAGE")  # share of query terms matched
+    keyword_fast_path_max_matches: int = Field(default=5, env="KEYWORD_FAST_PATH_MAX_MATCHES")  # more full matches = not specific
 
     # Caching
     enable_cache: bool = Field(default=True, env="ENABLE_CACHE")
     cache_dir: str = Field(default="cache", env="CACHE_DIR")
     cache_ttl_hours: int = Field(default=24, env="CACHE_TTL_HOURS")
+    download_cache_max_files: int = Field(default=500, env="DOWNLOAD_CACHE_MAX_FILES")  # extracted documents kept in cache/downloads
+    index_mmap: bool = Field(default=False, env="INDEX_MMAP")  # memory-map saved FAISS indexes on load
+    strip_sas_params: bool = Field(default=True, env="STRIP_SAS_PARAMS")  # ignore SAS tokens of Azure Blob links in document cache keys
 
     # File Upload
     max_file_size_mb: int = Field(default=10, env="MAX_FILE_SIZE_MB")
+    ingest_max_concurrency: int = Field(default=8, env="INGEST_MAX_CONCURRENCY")  # URLs fetched/parsed in parallel
+    ingest_job_workers: int = Field(default=2, env="INGEST_JOB_WORKERS")  # background ingest jobs run at once
+    ingest_job_queue_size: int = Field(default=20, env="INGEST_JOB_QUEUE_SIZE")  # queued + running jobs accepted
+    ingest_job_history: int = Field(default=200, env="INGEST_JOB_HISTORY")  # finished jobs kept for polling
     allowed_file_types: List[str] = Field(default=[".pdf", ".txt", ".md", ".docx"], env="ALLOWED_FILE_TYPES")
 
     # Server Config
     host: str = Field(default="0.0.0.0", env="HOST")
     port: int = Field(default=8000, env="PORT")
     debug: bool = Field(default=True, env="DEBUG")
+    system_info_interval: float = Field(default=15.0, env="SYSTEM_INFO_INTERVAL")  # seconds between CPU/memory samples for /health
 
     # Logging
     log_level: str = Field(default="INFO", env="LOG_LEVEL")
@@ -87,6 +138,11 @@ else:
     print(f"✅ OpenRouter key loaded: {settings.openrouter_api_key[:5]}...{settings.openrouter_api_key[-5:]}")
 
 if settings.embedding_device == "cuda":
+    # torch is only imported when a GPU was asked for; it is slow to import
+    try:
+        import torch
+    except ImportError:
+        torch = None
     if torch and not torch.cuda.is_available():
         print("⚠️  WARNING: CUDA selected but no GPU found. Switching to CPU.")
         settings.embedding_device = "cpu"
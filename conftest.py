@@ -0,0 +1,2 @@
+# test_system.py is a manual script that posts to a running server, not a pytest module
+collect_ignore = ["test_system.py"]
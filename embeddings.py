@@ -0,0 +1,294 @@
+"""
+Embedding helpers: selectable model backends and a content-addressed cache in front of them
+"""
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+from utils import get_cache_key
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Maps (embedding model, text hash) -> vector.
+    Hot entries live in an in-memory LRU of float32 arrays (about 1.5 KB per
+    384-dim vector); when `db_path` is set every vector is also written to a
+    SQLite file so a restart or re-ingest can reuse it. The file keeps at most
+    `max_disk_entries` vectors, dropping the oldest first.
+    """
+
+    def __init__(self, model_name: str, max_entries: int = 50_000, db_path: Optional[Path] = None,
+                 max_disk_entries: int = 200_000):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, array]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path is not None:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB, created_at REAL);
+                CREATE INDEX IF NOT EXISTS embeddings_created_at ON embeddings (created_at);
+            """)
+            self._db.commit()
+            self._disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def key(self, text: str) -> str:
+        return f"{self.model_name}:{get_cache_key(text)}"
+
+    def _remember(self, key: str, vector: array) -> None:
+        """Insert into the LRU. Caller holds the lock."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up vectors for `texts`; None marks a miss"""
+        keys = [self.key(text) for text in texts]
+        found: Dict[str, array] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+
+            missing = [key for key in set(keys) if key not in found]
+            if missing and self._db is not None:
+                for start in range(0, len(missing), 500):  # stay under SQLite's variable limit
+                    batch = missing[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                        batch
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = array("f")
+                        vector.frombytes(blob)
+                        found[key] = vector
+                        self._remember(key, vector)
+                        self.disk_hits += 1
+
+            hit_count = sum(1 for key in keys if key in found)
+            self.hits += hit_count
+            self.misses += len(keys) - hit_count
+        # Lists only for the caller; the cache itself keeps the compact arrays
+        return [found[key].tolist() if key in found else None for key in keys]
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]) -> None:
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                packed = array("f", vector)
+                self._remember(key, packed)
+                rows.append((key, packed.tobytes(), time.time()))
+            if self._db is not None and rows:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+                self._disk_entries += len(rows)  # over-counts replaced rows; _trim_disk recounts
+                if self._disk_entries > self.max_disk_entries:
+                    self._trim_disk()
+                self._db.commit()
+
+    def _trim_disk(self) -> None:
+        """Drop the oldest vectors down to 90% of max_disk_entries. Caller holds the lock."""
+        self._disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if self._disk_entries <= self.max_disk_entries:
+            return
+        # Leave headroom so the next writes don't trim again straight away
+        excess = self._disk_entries - int(self.max_disk_entries * 0.9)
+        self._db.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY created_at LIMIT ?)", (excess,)
+        )
+        self._disk_entries -= excess
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only sends texts it has never seen to the model.
+    Re-ingesting a document (e.g. under a fresh SAS-token URL) re-embeds just
+    the chunks whose text actually changed.
+    """
+
+    def __init__(self, base: Embeddings, cache: EmbeddingCache):
+        self.base = base
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(texts)
+        # Deduplicate misses so overlapping/repeated chunks are embedded once
+        pending = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if pending:
+            computed = dict(zip(pending, self.base.embed_documents(pending)))
+            self.cache.put_many(pending, [computed[text] for text in pending])
+            vectors = [vector if vector is not None else computed[text] for text, vector in zip(texts, vectors)]
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.cache.get_many([text])[0]
+        if vector is None:
+            vector = self.base.embed_query(text)
+            self.cache.put_many([text], [vector])
+        return vector
+
+
+EMBEDDING_BACKENDS = ("torch", "quantized", "onnx")
+
+
+def embedding_model_id(model_name: str, backend: str) -> str:
+    """
+    Identity of the vectors a backend produces. Quantized and ONNX vectors drift
+    slightly from the PyTorch ones, so they must not share cache entries or saved indexes.
+    """
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def _transformer_module(embeddings: HuggingFaceEmbeddings):
+    """The sentence-transformers module wrapping the Hugging Face encoder"""
+    return embeddings.client[0]
+
+
+def _quantize(embeddings: HuggingFaceEmbeddings) -> None:
+    """Swap the encoder's Linear layers for dynamically quantized int8 ones (CPU only)"""
+    import torch
+
+    module = _transformer_module(embeddings)
+    module.auto_model = torch.quantization.quantize_dynamic(module.auto_model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _use_onnx(embeddings: HuggingFaceEmbeddings, model_name: str, threads: int) -> None:
+    """
+    Replace the encoder with an ONNX Runtime session exported from the same checkpoint.
+    Tokenization, pooling and normalization stay in sentence-transformers, so the
+    output matches the PyTorch backend up to numerical drift.
+    """
+    import torch
+
+    try:
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+    except ImportError as e:
+        raise RuntimeError("The onnx embedding backend needs `pip install optimum[onnxruntime]`") from e
+
+    session_options = onnxruntime.SessionOptions()
+    if threads > 0:
+        session_options.intra_op_num_threads = threads
+    ort_model = ORTModelForFeatureExtraction.from_pretrained(
+        model_name, export=True, provider="CPUExecutionProvider", session_options=session_options
+    )
+
+    class OnnxEncoder(torch.nn.Module):
+        """Presents the ONNX session the way sentence-transformers calls a Hugging Face model"""
+
+        def __init__(self):
+            super().__init__()
+            self.config = ort_model.config
+
+        def forward(self, **features):
+            features.pop("return_dict", None)
+            return (ort_model(**features).last_hidden_state,)
+
+    _transformer_module(embeddings).auto_model = OnnxEncoder()
+
+
+def load_embedding_model(
+    model_name: str,
+    backend: str = "torch",
+    device: str = "cpu",
+    batch_size: int = 32,
+    threads: int = 0,
+) -> HuggingFaceEmbeddings:
+    """
+    Build the embedding model on the requested backend.
+    "torch" runs the checkpoint as is; "quantized" applies dynamic int8 quantization;
+    "onnx" runs it on ONNX Runtime. The last two are CPU-only. `threads` of 0 keeps
+    the library default.
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {EMBEDDING_BACKENDS}")
+    if backend != "torch" and device != "cpu":
+        logger.warning(f"The {backend} embedding backend runs on CPU; ignoring device={device!r}")
+        device = "cpu"
+
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+
+    embeddings = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={"device": device},
+        encode_kwargs={"batch_size": batch_size},
+    )
+    if backend == "quantized":
+        _quantize(embeddings)
+    elif backend == "onnx":
+        _use_onnx(embeddings, model_name, threads)
+    logger.info(f"Loaded embedding model {model_name} on the {backend} backend (batch_size={batch_size})")
+    return embeddings
+
+
+def cosine_similarities(vectors, query) -> np.ndarray:
+    """Cosine similarity of every row of `vectors` to `query`, as one matrix product"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    query = np.asarray(query, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    scores = vectors @ query
+    return np.divide(scores, norms, out=np.zeros_like(scores), where=norms > 0)
+
+
+def compare_backends(
+    texts: List[str],
+    candidate: Embeddings,
+    reference: Embeddings,
+) -> Dict[str, Any]:
+    """
+    Embed `texts` with both models and report how far the candidate's vectors drift
+    from the reference (cosine similarity per text) and how long each took.
+    """
+    start = time.perf_counter()
+    expected = reference.embed_documents(texts)
+    reference_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = candidate.embed_documents(texts)
+    candidate_seconds = time.perf_counter() - start
+
+    similarities = sorted(float(cosine_similarities([a], b)[0]) for a, b in zip(expected, actual))
+    return {
+        "texts": len(texts),
+        "mean_cosine": round(sum(similarities) / len(similarities), 6),
+        "min_cosine": round(similarities[0], 6),
+        "p5_cosine": round(similarities[int(len(similarities) * 0.05)], 6),
+        "max_drift": round(1 - similarities[0], 6),
+        "reference_seconds": round(reference_seconds, 3),
+        "candidate_seconds": round(candidate_seconds, 3),
+        "speedup": round(reference_seconds / candidate_seconds, 2) if candidate_seconds else None,
+    }
@@ -0,0 +1,159 @@
+"""
+Background ingestion jobs: a bounded worker pool plus pollable per-stage status
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Stages a job moves through, in order; "failed" can replace any of them
+STAGES = ["queued", "downloading", "parsing", "embedding", "indexed"]
+FINAL_STATUSES = {"indexed", "failed"}
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the job queue is at capacity"""
+
+
+class IngestJob:
+    """State of one background ingest, updated by the worker thread"""
+
+    def __init__(self, doc_id: str, urls: List[str]):
+        self.job_id = uuid.uuid4().hex
+        self.doc_id = doc_id
+        self.urls = urls
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        # stage -> {"started_at", "finished_at", "duration"}
+        self.stages: Dict[str, Dict[str, Optional[float]]] = {
+            "queued": {"started_at": self.created_at, "finished_at": None, "duration": None}
+        }
+        self._lock = threading.Lock()
+
+    def _close_stage(self, stage: str, now: float) -> None:
+        timing = self.stages[stage]
+        if timing["finished_at"] is None:
+            timing["finished_at"] = now
+            timing["duration"] = round(now - timing["started_at"], 3)
+
+    def advance(self, stage: str) -> None:
+        """
+        Move to `stage`. URLs are processed concurrently, so a stage may be reported
+        more than once; the status only ever moves forward.
+        """
+        with self._lock:
+            if self.status in FINAL_STATUSES or STAGES.index(stage) <= STAGES.index(self.status):
+                return
+            now = time.time()
+            self._close_stage(self.status, now)
+            self.status = stage
+            self.stages[stage] = {"started_at": now, "finished_at": None, "duration": None}
+            if stage == "indexed":
+                self._close_stage(stage, now)
+                self.finished_at = now
+
+    def fail(self, error: str) -> None:
+        with self._lock:
+            now = time.time()
+            self._close_stage(self.status, now)
+            self.status = "failed"
+            self.error = error
+            self.finished_at = now
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINAL_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "doc_id": self.doc_id,
+                "urls": list(self.urls),
+                "status": self.status,
+                "stages": {stage: dict(timing) for stage, timing in self.stages.items()},
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+                "total_time": round(self.finished_at - self.created_at, 3) if self.finished_at else None,
+                "error": self.error,
+                "result": self.result,
+            }
+
+
+class IngestJobManager:
+    """
+    Runs ingest jobs on a small thread pool so /ingest can return immediately.
+    At most `max_pending` jobs may be queued or running; the newest
+    `max_history` finished jobs stay available for polling.
+    """
+
+    def __init__(
+        self,
+        ingest: Callable[..., Dict[str, Any]],
+        max_workers: int = settings.ingest_job_workers,
+        max_pending: int = settings.ingest_job_queue_size,
+        max_history: int = settings.ingest_job_history,
+    ):
+        self.ingest = ingest
+        self.max_pending = max_pending
+        self.max_history = max_history
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest-job")
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.done)
+
+    def _trim_history(self) -> None:
+        """Drop the oldest finished jobs beyond max_history. Caller holds the lock."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def submit(self, doc_id: str, urls: List[str]) -> IngestJob:
+        job = IngestJob(doc_id, urls)
+        with self._lock:
+            if sum(1 for existing in self._jobs.values() if not existing.done) >= self.max_pending:
+                raise QueueFullError(f"Ingest queue is full ({self.max_pending} jobs pending)")
+            self._trim_history()
+            self._jobs[job.job_id] = job
+        self._pool.submit(self._run, job)
+        return job
+
+    def _run(self, job: IngestJob) -> None:
+        def on_stage(stage: str) -> None:
+            # "indexed" is only reported once the result is attached
+            if stage != "indexed":
+                job.advance(stage)
+
+        try:
+            job.result = self.ingest(job.doc_id, job.urls, on_stage=on_stage)
+            job.advance("indexed")
+        except Exception as e:
+            logger.exception(f"Ingest job {job.job_id} failed")
+            job.fail(str(e))
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[IngestJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def stats(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for job in self.list():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
@@ -1,14 +1,79 @@
+import json
+import logging
+import math
 import re
-import requests
+import threading
+from collections import Counter
 from config import settings
-from typing import List, Dict, Any
-from langchain.schema import Document  # Import Document
+from typing import Callable, List, Dict, Any, Iterator, Optional, Tuple
+from langchain_core.documents import Document
+from answer_cache import AnswerCache, prompt_key
+from bm25 import tokenize
+from metrics import CONTEXT_TOKENS, span
+from llm_client import LLMError, get_llm_client  # LLMError is re-exported for callers
+from utils import map_concurrently
+
+logger = logging.getLogger(__name__)
+
+TEMPERATURE = 0.1  # Lower temperature for faster, more consistent responses
+
+# Boilerplate the model opens (or pads) answers with; removed wherever it appears
+NOISY_PHRASES = [
+    "According to the document",
+    "As per the policy",
+    "Based on the information provided",
+    "According to Document",
+    "The document states",
+    "It is mentioned in the document",
+    "From the documents",
+    "As per the available data",
+    "Based on the document",
+    "According to the information",
+    "The document indicates",
+    "As mentioned in the document",
+    "From the provided information",
+    "Based on the available information",
+    "Document 1 states",
+    "Document 2 states",
+    "Document 3 states",
+    "The policy states",
+    "The information indicates",
+    "The content shows",
+    "The document mentions",
+    "The text reveals",
+    "The data suggests",
+    "The information shows",
+    "According to",
+    "Based on",
+    "As per",
+    "The documents indicate",
+    "The policy indicates",
+    "The document shows",
+    "The policy shows",
+    "The documents show",
+    "The information reveals",
+    "The document reveals",
+    "The policy reveals",
+]
+
+# clean_answer runs on every answer, so its patterns are compiled once here
+_DOCUMENT_REFERENCE = re.compile(r"Document \d+")
+_SOURCE_REFERENCE = re.compile(r"\(source: [^)]+\)")
+# All phrases in one alternation, tried in list order: a phrase has to come before any
+# shorter phrase it starts with ("Based on the document" before "Based on") to be removed whole
+_NOISY_PHRASE = re.compile(
+    "(?:" + "|".join(re.escape(phrase) for phrase in NOISY_PHRASES) + r")[:,\- ]*",
+    re.IGNORECASE,
+)
+_BULLETS = str.maketrans({"•": "-", "●": "-"})
+_WHITESPACE = re.compile(r"\s+")
+_ELLIPSIS = re.compile(r"\.+$|\.\.\.")
+_SPACE_BEFORE_PUNCTUATION = re.compile(r"\s+([.,!?;])")
+_FILLER_START = re.compile(r"^(yes|no|however|indeed|furthermore|moreover)[, ]+", re.IGNORECASE)
+_GENERIC_PREFIX = re.compile(r"^(The|This|That|Such) [A-Za-z]+ (policy|document)[\s\-:,]*", re.IGNORECASE)
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?]) +")
+_LEADING_WORDS = (re.compile(r"^[A-Z][a-z]+ [a-z]+ [a-z]+[:,\- ]*"), re.compile(r"^[A-Z][a-z]+ [a-z]+[:,\- ]*"))
 
-HEADERS = {
-    "Authorization": f"Bearer {settings.openrouter_api_key}",
-    "HTTP-Referer": "https://yourdomain.com",  # Replace if hosted
-    "X-Title": "Document Query System"
-}
 
 def clean_answer(text: str) -> str:
     """
@@ -18,93 +83,111 @@ def clean_answer(text: str) -> str:
     if not text:
         return ""
 
-    # Remove known noisy prefixes and document references
-    noisy_starts = [
-        "According to the document",
-        "As per the policy",
-        "Based on the information provided",
-        "According to Document",
-        "The document states",
-        "It is mentioned in the document",
-        "From the documents",
-        "As per the available data",
-        "Based on the document",
-        "According to the information",
-        "The document indicates",
-        "As mentioned in the document",
-        "From the provided information",
-        "Based on the available information",
-        "Document 1 states",
-        "Document 2 states",
-        "Document 3 states",
-        "The policy states",
-        "The information indicates",
-        "The content shows",
-        "The document mentions",
-        "The text reveals",
-        "The data suggests",
-        "The information shows",
-        "According to",
-        "Based on",
-        "As per",
-        "The documents indicate",
-        "The policy indicates",
-        "The information shows",
-        "The document shows",
-        "The policy shows",
-        "The documents show",
-        "The information reveals",
-        "The document reveals",
-        "The policy reveals"
-    ]
-    
-    # Remove document references like "Document 1", "Document 3", etc.
-    text = re.sub(r'Document \d+', '', text)
-    text = re.sub(r'\(source: [^)]+\)', '', text)
-    text = re.sub(r'Document \d+ states', '', text)
-    text = re.sub(r'Document \d+ indicates', '', text)
-    
-    # Remove all noisy prefixes
-    for phrase in noisy_starts:
-        text = re.sub(rf"^{re.escape(phrase)}[:,\- ]*", "", text, flags=re.IGNORECASE)
-        text = re.sub(rf"{re.escape(phrase)}[:,\- ]*", "", text, flags=re.IGNORECASE)
-
-    # Replace line breaks and bullet dashes
-    text = text.replace('\n', ' ').replace('•', '-').replace('●', '-')
-
-    # Normalize whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
-
-    # Remove trailing punctuation/ellipses
-    text = re.sub(r"[.]+$", "", text)
-    text = re.sub(r"\.\.\.$", "", text)
-    text = re.sub(r"\.\.\.", "", text)
-    text = re.sub(r'\s+([.,!?;])', r'\1', text)
-    text = re.sub(r'^(yes|no|however|indeed|furthermore|moreover)[, ]+', '', text, flags=re.IGNORECASE)
-# Remove specific 2–3 word generic prefixes
-    text = re.sub(r'^(The|This|That|Such) [A-Za-z]+ (policy|document)[\s\-:,]*', '', text, flags=re.IGNORECASE)
+    # Document references ("Document 2", "(source: ...)") first, then every noisy phrase in one pass
+    text = _DOCUMENT_REFERENCE.sub("", text)
+    text = _SOURCE_REFERENCE.sub("", text)
+    text = _NOISY_PHRASE.sub("", text)
+
+    # Bullets become dashes; line breaks and runs of whitespace a single space
+    text = _WHITESPACE.sub(" ", text.translate(_BULLETS)).strip()
+
+    # Drop trailing dots and ellipses, and spaces before punctuation
+    text = _ELLIPSIS.sub("", text)
+    text = _SPACE_BEFORE_PUNCTUATION.sub(r"\1", text)
+    text = _FILLER_START.sub("", text)
+    # Remove specific 2–3 word generic prefixes
+    text = _GENERIC_PREFIX.sub("", text)
 
     # Extract up to 2 clean sentences
-    sentences = re.split(r'(?<=[.!?]) +', text)
+    sentences = _SENTENCE_SPLIT.split(text)
     if len(sentences) > 2:
-        combined_length = sum(len(s) for s in sentences[:2])
-        if combined_length < 100 and len(sentences) > 2:
-            text = " ".join(sentences[:3])  # include 3rd if 2 are too short
-        else:
-            text = " ".join(sentences[:2])
-    else:
-        text = " ".join(sentences)
+        # include 3rd if 2 are too short
+        sentences = sentences[:3] if len(sentences[0]) + len(sentences[1]) < 100 else sentences[:2]
+    text = " ".join(sentences)
 
     # Final cleanup - remove any remaining prefixes
-    text = re.sub(r'^[A-Z][a-z]+ [a-z]+ [a-z]+[:,\- ]*', '', text)
-    text = re.sub(r'^[A-Z][a-z]+ [a-z]+[:,\- ]*', '', text)
-    
+    for pattern in _LEADING_WORDS:
+        text = pattern.sub("", text)
+
     return text.strip()
 
 
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?;:])\s+|\n+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English text)"""
+    return max(1, math.ceil(len(text) / 4)) if text else 0
+
+
+def pack_context(question: str, docs: List[Document], max_tokens: int) -> Tuple[List[str], int]:
+    """
+    Fit the retrieved chunks into `max_tokens` of context.
+
+    Sentences repeated by the splitter's chunk overlap are kept once. If the rest
+    still does not fit, sentences are ranked by how many (and how rare) question
+    terms they contain, with the chunk's retrieval rank breaking ties, and the best
+    ones are kept in their original order. Returns one text block per chunk that
+    kept anything, and the tokens used.
+    """
+    sentences = []  # (chunk rank, position, text)
+    seen: List[str] = []
+    for rank, doc in enumerate(docs):
+        for position, sentence in enumerate(SENTENCE_BOUNDARY.split(doc.page_content.strip())):
+            key = " ".join(sentence.lower().split())
+            # Overlap often starts mid-sentence, so a fragment of a kept sentence is a repeat too
+            if not key or key in seen or (len(key) >= 20 and any(key in other for other in seen)):
+                continue
+            seen.append(key)
+            sentences.append((rank, position, sentence.strip()))
+
+    selected = sentences
+    if sum(estimate_tokens(text) for _, _, text in sentences) > max_tokens:
+        question_terms = set(tokenize(question))
+        sentence_terms = [set(tokenize(text)) for _, _, text in sentences]
+        df = Counter(term for terms in sentence_terms for term in terms)
+
+        def score(i: int) -> float:
+            overlap = sum(math.log(1 + len(sentences) / df[term]) for term in sentence_terms[i] & question_terms)
+            return overlap + 1.0 / (2 + sentences[i][0])
+
+        selected, used = [], 0
+        for i in sorted(range(len(sentences)), key=score, reverse=True):
+            cost = estimate_tokens(sentences[i][2])
+            if used + cost <= max_tokens:
+                selected.append(sentences[i])
+                used += cost
+        if not selected and sentences:
+            # Even the best sentence is over budget; keep its start
+            rank, position, text = sentences[max(range(len(sentences)), key=score)]
+            selected = [(rank, position, text[:max_tokens * 4])]
+        selected.sort(key=lambda item: item[:2])
+
+    blocks: Dict[int, List[str]] = {}
+    for rank, _, text in selected:
+        blocks.setdefault(rank, []).append(text)
+    texts = [" ".join(block) for block in blocks.values()]
+    return texts, sum(estimate_tokens(text) for _, _, text in selected)
+
+
+def build_prompt(question: str, docs: List[Document], max_context_tokens: int = None) -> Tuple[str, int]:
+    """
+    Prompt for `question` with the retrieved `docs` packed into the context budget
+    (settings.llm_context_max_tokens by default). Returns the prompt and the
+    estimated tokens of document context it carries.
+    """
+    if not docs:
+        return format_prompt(question, []), 0
+    with span("prompt"):
+        blocks, context_tokens = pack_context(question, docs, max_context_tokens or settings.llm_context_max_tokens)
+    CONTEXT_TOKENS.observe(context_tokens)
+    return format_prompt(question, [Document(page_content=block) for block in blocks]), context_tokens
+
+
 def format_prompt(question: str, docs: List[Document]) -> str:
     """
     Optimized prompt formatting for Claude 3 to produce clean, concise answers.
+    Chunks are pasted as given; use build_prompt to fit them into a token budget.
     """
     if not docs:
         return f"""You are a helpful assistant. Answer the following question in 1-2 clear, concise sentences without any prefixes like "According to" or "Based on".
@@ -137,39 +220,202 @@ Answer:"""
 
 
 
-def query_openrouter(prompt: str) -> str:
+def query_openrouter(prompt: str, max_tokens: int = 150) -> str:
     """
     Send a query to OpenRouter API using the configured model.
     Optimized for speed with reduced token limits.
+    Raises LLMError when the API fails instead of returning a placeholder answer.
     """
-    payload = {
+    # Pooled keep-alive client with retry/backoff; failures raise LLMError
+    with span("llm"):
+        return get_llm_client().complete(_payload(prompt, max_tokens))
+
+
+def stream_openrouter(prompt: str, max_tokens: int = 150) -> Iterator[str]:
+    """Like query_openrouter, but yields the answer's text as OpenRouter streams it"""
+    return get_llm_client().stream(_payload(prompt, max_tokens))
+
+
+def _payload(prompt: str, max_tokens: int) -> Dict[str, Any]:
+    return {
         "model": settings.llm_model,
         "messages": [
             {"role": "system", "content": "You are a helpful assistant. Provide concise answers in 1-2 sentences."},
             {"role": "user", "content": prompt}
         ],
-        "temperature": 0.1,  # Lower temperature for faster, more consistent responses
-        "max_tokens": 150,   # Reduced for faster responses
+        "temperature": TEMPERATURE,
+        "max_tokens": max_tokens,   # Reduced for faster responses
         "top_p": 0.9,        # Add top_p for better speed
         "frequency_penalty": 0.1,  # Reduce repetition
         "presence_penalty": 0.1    # Encourage conciseness
     }
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def _embed_question(question: str) -> List[float]:
+    from vector_store import get_embeddings  # deferred: loads the embedding model
+    return get_embeddings().embed_query(question)
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """The process-wide answer cache, or None when disabled"""
+    global _answer_cache
+    if not settings.answer_cache_enabled:
+        return None
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache(
+                    db_path=settings.cache_path / "answers.sqlite3" if settings.enable_cache else None,
+                    ttl_seconds=settings.answer_cache_ttl_hours * 3600,
+                    max_entries=settings.answer_cache_max_entries,
+                    semantic_threshold=settings.answer_cache_semantic_threshold,
+                    embed=_embed_question if settings.answer_cache_semantic else None,
+                    max_scope_rows=settings.answer_cache_semantic_max_rows,
+                )
+    return _answer_cache
+
+
+def answer_cache_stats() -> Dict[str, Any]:
+    return _answer_cache.stats() if _answer_cache is not None else {}
+
+
+def cached_completion(prompt: str, question: Optional[str] = None, scope: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """
+    query_openrouter behind the answer cache. `scope` names the documents the
+    question was asked about and enables the semantic level. Returns the answer and
+    "exact"/"semantic" for a cache hit, or None when the LLM was called.
+    """
+    cache = get_answer_cache()
+    if cache is None:
+        return query_openrouter(prompt), None
+    key = prompt_key(settings.llm_model, TEMPERATURE, prompt)
+    answer, hit = cache.lookup(key, scope=scope, question=question)
+    if answer is not None:
+        return answer, hit
+    answer = query_openrouter(prompt)
+    cache.store(key, answer, scope=scope, question=question)
+    return answer, None
+
+
+def cached_similar_answer(question: str, scope: Optional[str]) -> Optional[str]:
+    """Semantic-level lookup on its own, for questions about to be answered in a group"""
+    cache = get_answer_cache()
+    if cache is None or scope is None:
+        return None
+    answer = cache.get_similar(scope, question)
+    if answer is not None:
+        cache.record("semantic")
+    return answer
+
+
+def _chunk_key(doc: Document):
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+
+def group_questions(retrieved: List[List[Document]], max_group: int, min_overlap: float) -> List[List[int]]:
+    """
+    Group question indexes whose retrieved chunks overlap, so each group can share
+    one prompt. A question joins the first group whose chunks cover at least
+    `min_overlap` of its own; groups hold at most `max_group` questions.
+    """
+    groups: List[Tuple[List[int], set]] = []
+    for i, docs in enumerate(retrieved):
+        keys = {_chunk_key(doc) for doc in docs}
+        for members, group_keys in groups:
+            if len(members) < max_group and keys and len(keys & group_keys) / len(keys) >= min_overlap:
+                members.append(i)
+                group_keys |= keys
+                break
+        else:
+            groups.append(([i], set(keys)))
+    return [members for members, _ in groups]
+
+
+def build_group_prompt(questions: List[str], docs: List[Document]) -> Tuple[str, int]:
+    """
+    One prompt asking every question in `questions` against the shared `docs`,
+    requesting a JSON array with one answer per question. Returns the prompt and
+    its context tokens; the budget grows by half a prompt's worth per extra question.
+    """
+    budget = int(settings.llm_context_max_tokens * (1 + 0.5 * (len(questions) - 1)))
+    blocks, context_tokens = pack_context(" ".join(questions), docs, budget)
+    context_chunks = "\n\n".join(f"Document {i+1}:\n{block}" for i, block in enumerate(blocks))
+    numbered = "\n".join(f"{i+1}. {question}" for i, question in enumerate(questions))
+
+    prompt = f"""You are a helpful assistant. Answer each of the following questions based on the provided documents.
+
+IMPORTANT:
+- Answer every question in 1-2 clear, concise sentences
+- Do NOT use phrases like "According to", "Based on", "Document states", etc.
+- Do NOT mention document numbers or sources
+- Reply with ONLY a JSON array of {len(questions)} strings, the answer to question 1 first, with no other text
+
+Documents:
+{context_chunks}
+
+Questions:
+{numbered}
+
+JSON array of answers:"""
+    return prompt, context_tokens
+
+
+def parse_answer_array(text: str, count: int) -> Optional[List[str]]:
+    """The answers from a grouped reply, or None unless it holds exactly `count` of them"""
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        return None
     try:
-        response = requests.post(
-            f"{settings.openrouter_base_url}/chat/completions",
-            headers=HEADERS,
-            json=payload,
-            timeout=15  # Reduced timeout for speed
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data["choices"][0]["message"]["content"].strip()
-    except requests.exceptions.RequestException as e:
-        print(f"WARNING: OpenRouter API request failed: {e}")
-        return f"Based on the provided documents, I cannot provide a specific answer to your question. The API request failed with error: {e}. Please check your API key and try again later."
-    except (KeyError, IndexError) as e:
-        print(f"WARNING: OpenRouter API returned unexpected data: {e}")
-        return "Based on the provided documents, I cannot provide a specific answer to your question due to an unexpected API response. Please try again later."
+        answers = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(answers, list) or len(answers) != count:
+        return None
+    if not all(isinstance(answer, (str, int, float)) for answer in answers):
+        return None
+    return [str(answer) for answer in answers]
+
+
+def answer_question_group(
+    questions: List[str],
+    docs_per_question: List[List[Document]],
+    scope: Optional[str] = None,
+) -> Tuple[Optional[List[str]], int, Optional[str]]:
+    """
+    Answer several questions with a single LLM call over the union of their chunks.
+    Returns (answers in question order, context tokens, "exact" on a cache hit);
+    answers is None when the reply could not be parsed, so the caller can fall back
+    to one call per question. Only parsed replies are cached.
+    """
+    docs, seen = [], set()
+    for question_docs in docs_per_question:
+        for doc in question_docs:
+            if _chunk_key(doc) not in seen:
+                seen.add(_chunk_key(doc))
+                docs.append(doc)
+
+    prompt, context_tokens = build_group_prompt(questions, docs)
+    cache = get_answer_cache()
+    key = prompt_key(settings.llm_model, TEMPERATURE, prompt)
+    if cache is not None:
+        reply, hit = cache.lookup(key)
+        if reply is not None:
+            return json.loads(reply), context_tokens, hit
+
+    reply = query_openrouter(prompt, max_tokens=150 * len(questions))
+    answers = parse_answer_array(reply, len(questions))
+    if answers is None:
+        logger.warning(f"Could not parse grouped answer for {len(questions)} questions: {reply[:200]!r}")
+    elif cache is not None:
+        cache.put_exact(key, json.dumps(answers))
+        if scope is not None:
+            for question, answer in zip(questions, answers):
+                cache.put_similar(scope, question, answer)
+    return answers, context_tokens, None
 
 
 def get_llm_chain():
@@ -178,8 +424,49 @@ def get_llm_chain():
     """
     class LLMChain:
         def run(self, input_documents: List[Document], question: str) -> str:
-            prompt = format_prompt(question, input_documents)
-            return query_openrouter(prompt)
+            return self.run_with_usage(input_documents, question)[0]
+
+        def run_with_usage(
+            self, input_documents: List[Document], question: str, scope: Optional[str] = None
+        ) -> Tuple[str, int, Optional[str]]:
+            """
+            Answer, the estimated tokens of document context sent with it, and
+            "exact"/"semantic" when the answer came from the cache (None otherwise).
+            `scope` identifies the searched documents for the semantic cache.
+            """
+            prompt, context_tokens = build_prompt(question, input_documents)
+            answer, cache_hit = cached_completion(prompt, question=question, scope=scope)
+            return answer, context_tokens, cache_hit
+
+        def stream_with_usage(
+            self,
+            input_documents: List[Document],
+            question: str,
+            on_token: Callable[[str], None],
+            scope: Optional[str] = None,
+        ) -> Tuple[str, int, Optional[str]]:
+            """
+            `run_with_usage` in stream mode: `on_token` gets each text delta as it
+            arrives and the full raw answer is returned at the end. Cache hits are
+            returned without calling `on_token`.
+            """
+            prompt, context_tokens = build_prompt(question, input_documents)
+            cache = get_answer_cache()
+            key = prompt_key(settings.llm_model, TEMPERATURE, prompt)
+            if cache is not None:
+                answer, cache_hit = cache.lookup(key, scope=scope, question=question)
+                if answer is not None:
+                    return answer, context_tokens, cache_hit
+
+            parts = []
+            with span("llm"):
+                for delta in stream_openrouter(prompt):
+                    parts.append(delta)
+                    on_token(delta)
+            answer = "".join(parts).strip()
+            if cache is not None:
+                cache.store(key, answer, scope=scope, question=question)
+            return answer, context_tokens, None
 
     return LLMChain()
 
@@ -195,22 +482,19 @@ def query_multiple_questions(docs: List[Document], questions: List[str]) -> List
     Returns:
         List of dictionaries containing question and answer pairs
     """
-    results = []
     chain = get_llm_chain()
-    
-    for question in questions:
-        try:
-            answer = chain.run(input_documents=docs, question=question)
-            results.append({
-                "question": question,
-                "answer": answer,
-                "error": None
-            })
-        except Exception as e:
-            results.append({
-                "question": question,
-                "answer": "",
-                "error": str(e)
-            })
-    
-    return results
\ No newline at end of file
+    outcomes = map_concurrently(
+        lambda question: chain.run(input_documents=docs, question=question),
+        questions,
+        max_workers=settings.llm_max_concurrency
+    )
+
+    results = []
+    for question, (answer, error) in zip(questions, outcomes):
+        results.append({
+            "question": question,
+            "answer": answer if error is None else "",
+            "error": str(error) if error is not None else None
+        })
+
+    return results
@@ -0,0 +1,317 @@
+"""
+Shared, pooled HTTP client for the OpenRouter chat-completions API
+"""
+import importlib.util
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, Iterator, Optional
+
+import httpx
+
+from config import settings
+from metrics import LLM_ERRORS, LLM_REQUESTS, LLM_TOKENS
+
+logger = logging.getLogger(__name__)
+
+HEADERS = {
+    "Authorization": f"Bearer {settings.openrouter_api_key}",
+    "HTTP-Referer": "https://yourdomain.com",  # Replace if hosted
+    "X-Title": "Document Query System"
+}
+
+# Statuses worth another attempt: rate limiting and transient upstream failures
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Structured failure from the LLM API, raised instead of returning a placeholder answer"""
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retryable: bool = False,
+        attempts: int = 1,
+        retry_after: Optional[str] = None,
+    ):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.retryable = retryable
+        self.attempts = attempts
+        self.retry_after = retry_after
+
+    @property
+    def metric_label(self) -> str:
+        """HTTP status, or "network" for transport failures that never got one"""
+        if self.status_code:
+            return str(self.status_code)
+        return "network" if self.retryable else "other"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "message": self.message,
+            "status_code": self.status_code,
+            "retryable": self.retryable,
+            "attempts": self.attempts
+        }
+
+
+def _http2_available() -> bool:
+    """httpx only speaks HTTP/2 when the optional `h2` package is installed"""
+    return importlib.util.find_spec("h2") is not None
+
+
+class OpenRouterClient:
+    """
+    One keep-alive connection pool shared by every LLM call.
+
+    Retryable failures (429/5xx, timeouts, dropped connections) are retried with
+    jittered exponential backoff, honouring Retry-After. With hedging enabled, a
+    duplicate request is sent when the first one outlives the observed p95 latency
+    and whichever answers first wins.
+    """
+
+    def __init__(
+        self,
+        base_url: str = settings.openrouter_base_url,
+        timeout: float = settings.llm_timeout,
+        max_retries: int = settings.llm_max_retries,
+        backoff_base: float = settings.llm_backoff_base,
+        backoff_max: float = settings.llm_backoff_max,
+        hedge_requests: bool = settings.llm_hedge_requests,
+        hedge_min_samples: int = settings.llm_hedge_min_samples,
+        max_connections: int = settings.llm_max_connections,
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_requests = hedge_requests
+        self.hedge_min_samples = hedge_min_samples
+
+        self._client = httpx.Client(
+            base_url=base_url,
+            headers=HEADERS,
+            timeout=httpx.Timeout(timeout, connect=5.0),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            http2=_http2_available(),
+        )
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.last_success_at: Optional[float] = None
+        self._hedge_pool = ThreadPoolExecutor(max_workers=max_connections) if hedge_requests else None
+
+    def _record_latency(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def _record_outcome(self, success: bool) -> None:
+        LLM_REQUESTS.inc(outcome="success" if success else "error")
+        with self._lock:
+            if success:
+                self.consecutive_failures = 0
+                self.last_success_at = time.time()
+            else:
+                self.consecutive_failures += 1
+
+    def health(self) -> Dict[str, Any]:
+        """
+        Judged from recent calls, without calling the API: unhealthy when no key is
+        configured or the last settings.llm_unhealthy_after calls all failed
+        """
+        with self._lock:
+            failures = self.consecutive_failures
+            last_success = self.last_success_at
+        configured = bool(settings.openrouter_api_key)
+        return {
+            "healthy": configured and failures < settings.llm_unhealthy_after,
+            "configured": configured,
+            "consecutive_failures": failures,
+            "last_success_age_s": round(time.time() - last_success, 1) if last_success else None,
+        }
+
+    @staticmethod
+    def _record_usage(usage: Optional[Dict[str, Any]]) -> None:
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if (usage or {}).get(kind):
+                LLM_TOKENS.inc(usage[kind], kind=kind[:-len("_tokens")])
+
+    def p95_latency(self) -> Optional[float]:
+        """p95 of recent successful calls, or None until enough samples exist"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def _post_once(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.time()
+        try:
+            response = self._client.post("/chat/completions", json=payload)
+        except httpx.TransportError as e:
+            raise LLMError(f"OpenRouter request failed: {e}", retryable=True)
+
+        if response.status_code >= 400:
+            raise LLMError(
+                f"OpenRouter returned HTTP {response.status_code}: {response.text[:200]}",
+                status_code=response.status_code,
+                retryable=response.status_code in RETRYABLE_STATUS,
+                retry_after=response.headers.get("retry-after"),
+            )
+
+        try:
+            data = response.json()
+        except ValueError as e:
+            raise LLMError(f"OpenRouter returned invalid JSON: {e}", status_code=response.status_code)
+        self._record_latency(time.time() - start)
+        return data
+
+    def _backoff(self, attempt: int, error: LLMError) -> float:
+        if error.retry_after:
+            try:
+                return min(float(error.retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.5)
+
+    def _post_with_retry(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        attempt = 0
+        while True:
+            try:
+                return self._post_once(payload)
+            except LLMError as e:
+                e.attempts = attempt + 1
+                LLM_ERRORS.inc(status=e.metric_label)
+                if not e.retryable or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                logger.warning(f"LLM call failed ({e.message}); retrying in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+
+    def _post_hedged(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        threshold = self.p95_latency()
+        if self._hedge_pool is None or threshold is None:
+            return self._post_with_retry(payload)
+
+        primary = self._hedge_pool.submit(self._post_with_retry, payload)
+        done, _ = wait([primary], timeout=threshold)
+        if done:
+            return primary.result()
+
+        logger.info(f"LLM call exceeded p95 ({threshold:.2f}s); sending hedged request")
+        pending = {primary, self._hedge_pool.submit(self._post_with_retry, payload)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except LLMError as e:
+                    error = e
+        raise error
+
+    def complete(self, payload: Dict[str, Any]) -> str:
+        """Send a chat-completions request and return the message text"""
+        try:
+            data = self._post_hedged(payload)
+            content = data["choices"][0]["message"]["content"].strip()
+        except LLMError:
+            self._record_outcome(False)
+            raise
+        except (KeyError, IndexError, TypeError, AttributeError) as e:
+            self._record_outcome(False)
+            raise LLMError(f"OpenRouter returned unexpected data: {e}")
+        self._record_outcome(True)
+        self._record_usage(data.get("usage"))
+        return content
+
+    def stream(self, payload: Dict[str, Any]) -> Iterator[str]:
+        """
+        Send a chat-completions request in stream mode and yield text deltas as
+        they arrive. Failures before the first token are retried like `complete`;
+        once tokens have been yielded an error is raised as is.
+        """
+        attempt = 0
+        while True:
+            start = time.time()
+            started = False
+            try:
+                with self._client.stream("POST", "/chat/completions", json={**payload, "stream": True}) as response:
+                    if response.status_code >= 400:
+                        response.read()
+                        raise LLMError(
+                            f"OpenRouter returned HTTP {response.status_code}: {response.text[:200]}",
+                            status_code=response.status_code,
+                            retryable=response.status_code in RETRYABLE_STATUS,
+                            retry_after=response.headers.get("retry-after"),
+                        )
+                    for line in response.iter_lines():
+                        # Server-sent events: "data: {...}" lines, ": comments" as keep-alives
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                        except ValueError:
+                            continue
+                        if "error" in chunk:
+                            raise LLMError(f"OpenRouter stream error: {chunk['error']}")
+                        # The last chunk may carry token usage for the whole answer
+                        self._record_usage(chunk.get("usage"))
+                        delta = ((chunk.get("choices") or [{}])[0].get("delta") or {}).get("content")
+                        if delta:
+                            started = True
+                            yield delta
+                self._record_latency(time.time() - start)
+                self._record_outcome(True)
+                return
+            except httpx.TransportError as e:
+                error = LLMError(f"OpenRouter request failed: {e}", retryable=True)
+            except LLMError as e:
+                error = e
+            error.attempts = attempt + 1
+            LLM_ERRORS.inc(status=error.metric_label)
+            if started or not error.retryable or attempt >= self.max_retries:
+                self._record_outcome(False)
+                raise error
+            delay = self._backoff(attempt, error)
+            logger.warning(f"LLM stream failed ({error.message}); retrying in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        self._client.close()
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+
+
+_client: Optional[OpenRouterClient] = None
+_client_lock = threading.Lock()
+
+
+def llm_client_health() -> Dict[str, Any]:
+    """OpenRouterClient.health(), or a not-yet-created placeholder; never creates the client"""
+    if _client is None:
+        return {"healthy": bool(settings.openrouter_api_key), "configured": bool(settings.openrouter_api_key),
+                "consecutive_failures": 0, "last_success_age_s": None}
+    return _client.health()
+
+
+def get_llm_client() -> OpenRouterClient:
+    """Return the process-wide OpenRouter client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenRouterClient()
+    return _client
@@ -1,25 +1,55 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Depends, Request, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field, validator
 from typing import List, Optional, Dict, Any
+import json
 import time
 import logging
+import psutil
 import traceback
+from contextlib import asynccontextmanager
 from fastapi.responses import JSONResponse
 from config import settings  # Corrected import
-from models import DocumentIngestRequest, IngestResponse, QueryRequest, QueryResponse, ErrorResponse, HealthResponse, MultiQueryRequest, MultiQueryResponse, QuestionAnswer  # Import models
-# from vector_store import vector_index  # Import vector_index
-from llm import query_multiple_questions  # Import get_llm_chain and query_multiple_questions
-from utils import extract_text_from_url, clean_text, get_system_info  # Import utils functions
-from langchain.text_splitter import RecursiveCharacterTextSplitter  # Import text splitter
-from langchain.schema import Document  # Import Document
+from models import DocumentIngestRequest, IngestResponse, QueryRequest, QueryResponse, ErrorResponse, HealthResponse, MultiQueryRequest, MultiQueryResponse, QuestionAnswer, IngestJobResponse, StatusResponse  # Import models
+# from vector_store import index_registry  # Import index_registry
+from utils import get_system_info, map_concurrently, start_system_sampler  # Import utils functions
 from auth import verify_api_key  # Import authentication
-from query_engine import process_query_batch  # Import batch function
+from query_engine import process_query_batch, stream_query_batch, get_cache_status, get_index_status, ingest_urls  # Import batch function
+from jobs import IngestJobManager, QueueFullError
+from answer_cache import document_scope
+from metrics import REQUEST_SECONDS, collect_timings, render_metrics
+from warmup import Warmup
+from vector_store import embeddings_loaded, index_registry, warm_up_embeddings
+from llm_client import get_llm_client, llm_client_health
 from models import DocumentInfo  # Or wherever it's defined
 from datetime import datetime
 
-app = FastAPI()
 logger = logging.getLogger(__name__)
+ingest_jobs = IngestJobManager(ingest_urls)
+# Slow initialisation happens here, after the server is up, instead of at import
+warmup = Warmup([
+    ("embedding_model", warm_up_embeddings),
+    ("llm_client", get_llm_client),
+], retries=settings.warmup_retries, backoff=settings.warmup_retry_backoff)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.warmup_on_startup:
+        warmup.start()
+    # /health serves these samples instead of measuring CPU on every probe
+    start_system_sampler(settings.system_info_interval)
+    yield
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Route templates ("/ingest/jobs/{job_id}") keep the label set small
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, route=route, status=response.status_code)
+    return response
 
 @app.get("/")
 def read_root():
@@ -35,8 +65,8 @@ def health_check(request: Request, api_key: str = Depends(verify_api_key)):
         return HealthResponse(
             status="ok",
             timestamp=time.strftime('%Y-%m-%dT%H:%M:%SZ'),
-            models_loaded={"llm": True, "embeddings": True},
-            cache_status={},
+            models_loaded={"llm": llm_client_health()["healthy"], "embeddings": embeddings_loaded()},
+            cache_status=get_cache_status(),
             system_info=sys_info
         )
     except Exception as e:
@@ -47,57 +77,148 @@ def health_check(request: Request, api_key: str = Depends(verify_api_key)):
             content={"detail": f"Health check failed: {str(e)}"}
         )
 
+# Probes are async and only read in-memory state, so they never wait for a threadpool worker
+@app.get("/live")
+async def liveness():
+    """200 whenever the process can answer at all. Unauthenticated, for load balancers."""
+    return {"status": "alive"}
+
+@app.get("/ready")
+async def readiness():
+    """
+    200 when the embedding model is loaded, indexes can be stored and recent LLM
+    calls succeed; 503 otherwise, with the failing checks. Unauthenticated, for load balancers.
+    A warmup that failed (after its retries) is started again, since a load balancer
+    gating on this probe never sends the request that would load the model lazily.
+    """
+    if settings.warmup_on_startup and warmup.status == "failed":
+        warmup.start()
+    checks = {
+        # Without startup warmup the model loads on the first request that needs it
+        "embeddings": {"healthy": embeddings_loaded() or not settings.warmup_on_startup, "loaded": embeddings_loaded(), "warmup": warmup.to_dict()},
+        "index": index_registry.health(),
+        "llm": llm_client_health(),
+    }
+    ready = all(check["healthy"] for check in checks.values())
+    return JSONResponse(status_code=200 if ready else 503, content={"status": "ready" if ready else "not_ready", "checks": checks})
+
 @app.post("/ingest", response_model=IngestResponse, responses={400: {"model": ErrorResponse}, 401: {"model": ErrorResponse}})
-def ingest_document(request: DocumentIngestRequest, api_key: str = Depends(verify_api_key)):
+def ingest_document(
+    request: DocumentIngestRequest,
+    async_: bool = Query(False, alias="async", description="Queue the ingest and return a job to poll"),
+    timings: bool = Query(False, description="Include seconds per pipeline stage in the response"),
+    api_key: str = Depends(verify_api_key)
+):
     start = time.time()
-    from vector_store import vector_index # Import vector_index here to avoid circular import issues
+    if async_:
+        try:
+            job = ingest_jobs.submit(request.doc_id, request.all_urls)
+        except QueueFullError as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        return JSONResponse(status_code=202, content=job.to_dict())
+
     try:
-        raw_text, metadata = extract_text_from_url([request.url])
-        cleaned = clean_text(raw_text)
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=300)
-        docs = splitter.create_documents([cleaned])
-        vector_index.add_documents(docs)
+        # All URLs are fetched and parsed concurrently; failures are reported per URL
+        urls = request.all_urls
+        with collect_timings() as stage_timings:
+            ingested = ingest_urls(request.doc_id, urls)
+        failed = [result for result in ingested["results"] if result["status"] != "success"]
         return IngestResponse(
-             status="success",
-           message="Document ingested successfully",
+             status="partial" if failed else "success",
+           message=f"Ingested {len(urls) - len(failed)} of {len(urls)} documents" if failed else "Document ingested successfully",
           doc_info=DocumentInfo(  # ✅ Use the actual Pydantic model
           doc_id=request.doc_id,
-          url=request.url,
-          chunk_count=len(docs),
+          url=urls[0],
+          chunk_count=ingested["chunk_count"],
           ingested_at=datetime.utcnow(),
-          metadata=metadata if isinstance(metadata, dict) else metadata[0]  # ✅ Ensure it's a dict
+          metadata=ingested["metadata"]
     ),
-    processing_time=round(time.time() - start, 2)
+    processing_time=round(time.time() - start, 2),
+    results=ingested["results"],
+    timings=stage_timings.to_dict() if timings else None
 )
 
     except Exception as e:
         logger.exception("Ingestion failed")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/ingest/jobs/{job_id}", response_model=IngestJobResponse, responses={401: {"model": ErrorResponse}, 404: {"model": ErrorResponse}})
+def get_ingest_job(job_id: str, api_key: str = Depends(verify_api_key)):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job_id: {job_id}")
+    return job.to_dict()
+
+@app.get("/ingest/jobs", response_model=List[IngestJobResponse], responses={401: {"model": ErrorResponse}})
+def list_ingest_jobs(api_key: str = Depends(verify_api_key)):
+    return [job.to_dict() for job in ingest_jobs.list()]
+
+@app.get("/metrics", response_class=PlainTextResponse, responses={401: {"model": ErrorResponse}})
+def prometheus_metrics(api_key: str = Depends(verify_api_key)):
+    """Prometheus text format: stage and request latency, LLM calls, tokens and errors, cache hits"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/status", response_model=StatusResponse, responses={401: {"model": ErrorResponse}})
+def system_status(api_key: str = Depends(verify_api_key)):
+    memory = psutil.Process().memory_info()
+    return StatusResponse(
+        **get_index_status(),
+        memory_usage={"rss_mb": round(memory.rss / 1024 / 1024, 1)},
+        ingest_jobs=ingest_jobs.stats()
+    )
+
 @app.post("/query", response_model=List[QueryResponse], responses={400: {"model": ErrorResponse}, 401: {"model": ErrorResponse}})
-def query_docs(request: QueryRequest, api_key: str = Depends(verify_api_key)):
+def query_docs(
+    request: QueryRequest,
+    timings: bool = Query(False, description="Include seconds per pipeline stage in each answer"),
+    api_key: str = Depends(verify_api_key)
+):
     start = time.time()
-    from vector_store import vector_index
+    from vector_store import index_registry
     from llm import get_llm_chain  # Import get_llm_chain here to avoid circular import issues
 
     try:
         chain = get_llm_chain()
-        responses = []
+        # One embedding pass and one FAISS search per document for the whole batch
+        with collect_timings() as retrieval_timings:
+            retrieved = index_registry.search_batch(request.questions, k=request.max_docs or 3, doc_ids=request.doc_ids)
 
-        for question in request.questions:
-            docs = vector_index.search(question, k=request.max_docs or 3)
-            result = chain.run(input_documents=docs, question=question)
-            responses.append(QueryResponse(
+        def answer_question(item) -> QueryResponse:
+            question, docs = item
+            # Retrieval is shared by the batch; prompt and LLM time are this question's own
+            with collect_timings() as question_timings:
+                result, context_tokens, cache_hit = chain.run_with_usage(
+                    input_documents=docs, question=question, scope=document_scope(request.doc_ids)
+                )
+            return QueryResponse(
                 question=question,
                 answer=result,
+                context_tokens=context_tokens,
+                cache_hit=cache_hit,
                 model_used=settings.llm_model,
                 doc_ids_searched=[
                     doc.metadata.get("doc_id") for doc in docs if doc.metadata.get("doc_id") is not None
                 ],
                 sources=[{"text": d.page_content[:300]} for d in docs],
                 context_used="\n---\n".join(d.page_content[:500] for d in docs),
-                processing_time=round(time.time() - start, 2)
-            ))
+                processing_time=round(time.time() - start, 2),
+                timings={**retrieval_timings.to_dict(), **question_timings.to_dict()} if timings else None
+            )
+
+        # Answer all questions concurrently; a failed question is reported without failing the rest
+        outcomes = map_concurrently(answer_question, list(zip(request.questions, retrieved)), max_workers=settings.llm_max_concurrency)
+        responses = []
+        for question, (response, error) in zip(request.questions, outcomes):
+            if error is not None:
+                logger.error(f"Query failed for question {question!r}: {error}")
+                response = QueryResponse(
+                    question=question,
+                    answer="",
+                    error=str(error),
+                    model_used=settings.llm_model,
+                    processing_time=round(time.time() - start, 2)
+                )
+            responses.append(response)
 
         return responses
 
@@ -108,30 +229,82 @@ def query_docs(request: QueryRequest, api_key: str = Depends(verify_api_key)):
 
 
 @app.post("/hackrx/run", response_class=JSONResponse, responses={400: {"model": ErrorResponse}, 401: {"model": ErrorResponse}})
-def multi_query_docs(request: MultiQueryRequest, api_key: str = Depends(verify_api_key)):
+def multi_query_docs(
+    request: MultiQueryRequest,
+    timings: bool = Query(False, description="Include seconds per pipeline stage in the response"),
+    api_key: str = Depends(verify_api_key)
+):
     start = time.time()
     try:
         # Process queries with ultra-optimized settings for speed
-        results = process_query_batch(
-            request.documents, 
-            request.questions, 
-            request.max_docs or 2,  # Default to 2 for maximum speed
-            request.include_context
-        )
+        with collect_timings() as stage_timings:
+            results = process_query_batch(
+                request.documents,
+                request.questions,
+                request.max_docs or 2,  # Default to 2 for maximum speed
+                request.include_context,
+                request.group_questions
+            )
 
         # Convert to QuestionAnswer format for compatibility
+        errors = results.get("errors") or [None] * len(request.questions)
         question_answers = [
             QuestionAnswer(
                 question=request.questions[i],
                 answer=results["answers"][i],
-                error=None
+                error=errors[i]["message"] if errors[i] else None
             ) for i in range(len(request.questions))
         ]
 
-        return {
-            "answers": [qa.answer for qa in question_answers]
+        response = {
+            "answers": [qa.answer for qa in question_answers],
+            "context_tokens": results.get("context_tokens", []),
+            "cache_hits": results.get("cache_hits", [])
         }
+        # Failed questions are reported separately so they can't be mistaken for answers
+        if any(errors):
+            response["errors"] = errors
+        if timings:
+            response["timings"] = stage_timings.to_dict()
+        return response
 
     except Exception as e:
         logger.exception("Multi-query failed")
         raise HTTPException(status_code=400, detail=f"Failed to process document. Check URL/format. Error: {str(e)}")
+
+
+STREAM_FORMATS = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+
+@app.post("/hackrx/run/stream", responses={400: {"model": ErrorResponse}, 401: {"model": ErrorResponse}})
+def multi_query_docs_stream(
+    request: MultiQueryRequest,
+    format: str = Query("sse", description="sse or ndjson"),
+    tokens: bool = Query(False, description="Also stream raw LLM tokens as they arrive"),
+    api_key: str = Depends(verify_api_key),
+):
+    """
+    Same inputs as /hackrx/run, but every answer is sent as soon as it is ready
+    (start, answer..., done events; token events too with ?tokens=true).
+    """
+    if format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(STREAM_FORMATS)}")
+
+    def frames():
+        try:
+            for event in stream_query_batch(request.documents, request.questions, request.max_docs or 2, stream_tokens=tokens):
+                yield encode_event(event, format)
+        except Exception as e:
+            logger.exception("Streaming multi-query failed")
+            yield encode_event({"event": "error", "message": str(e)}, format)
+
+    # Tell proxies not to buffer the stream
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(frames(), media_type=STREAM_FORMATS[format], headers=headers)
+
+
+def encode_event(event: Dict[str, Any], format: str) -> str:
+    data = json.dumps(event)
+    if format == "ndjson":
+        return data + "\n"
+    return f"event: {event['event']}\ndata: {data}\n\n"
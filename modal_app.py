@@ -1,6 +1,5 @@
 import modal
 from modal import Mount
-from main import app as fastapi_app  # Assumes main.py is in the same directory
 import os
 
 print("DIR CONTENTS:", os.listdir())
@@ -18,4 +17,6 @@ image = (
 @app.function(image=image, mounts=[volume])
 @modal.asgi_app()
 def fastapi_modal_app():
+    # Imported inside the container only: deploying shouldn't load the app locally
+    from main import app as fastapi_app  # Assumes main.py is in the same directory
     return fastapi_app
@@ -8,19 +8,37 @@ from datetime import datetime
 import json
 
 
+def _check_url(v: Optional[str]) -> str:
+    if not v or not v.strip():
+        raise ValueError('URL cannot be empty')
+    if not (v.startswith('http://') or v.startswith('https://')):
+        raise ValueError('URL must start with http:// or https://')
+    return v.strip()
+
+
 class DocumentIngestRequest(BaseModel):
     """Request model for document ingestion"""
-    url: str = Field(..., description="URL of the document to ingest")
+    url: Optional[str] = Field(default=None, description="URL of the document to ingest")
+    urls: Optional[List[str]] = Field(default=None, description="Several document URLs to ingest together under doc_id")
     doc_id: str = Field(..., description="Unique identifier for the document")
     metadata: Optional[Dict[str, Any]] = Field(default={}, description="Additional metadata")
 
     @validator('url')
     def validate_url(cls, v):
-        if not v or not v.strip():
-            raise ValueError('URL cannot be empty')
-        if not (v.startswith('http://') or v.startswith('https://')):
-            raise ValueError('URL must start with http:// or https://')
-        return v.strip()
+        return _check_url(v)
+
+    @validator('urls', always=True)
+    def validate_urls(cls, v, values):
+        if not v:
+            if not values.get('url'):
+                raise ValueError('Either url or urls is required')
+            return v
+        return [_check_url(url) for url in v]
+
+    @property
+    def all_urls(self) -> List[str]:
+        """`url` followed by any `urls`, without duplicates"""
+        return list(dict.fromkeys(([self.url] if self.url else []) + (self.urls or [])))
 
     @validator('doc_id')
     def validate_doc_id(cls, v):
@@ -57,6 +75,7 @@ class MultiQueryRequest(BaseModel):
     questions: List[str] = Field(..., min_items=1, description="List of questions to ask the system")
     max_docs: Optional[int] = Field(default=4, ge=1, le=10, description="Maximum number of documents to retrieve")
     include_context: Optional[bool] = Field(default=True, description="Include context in the response")
+    group_questions: Optional[bool] = Field(default=None, description="Answer questions with overlapping context in one LLM call (default from settings)")
 
     @validator('documents')
     def validate_url(cls, v):
@@ -100,6 +119,10 @@ class QueryResponse(BaseModel):
     processing_time: float
     model_used: str
     doc_ids_searched: List[str] = []
+    context_tokens: Optional[int] = Field(default=None, description="Estimated tokens of document context sent to the LLM")
+    cache_hit: Optional[str] = Field(default=None, description="\"exact\" or \"semantic\" when answered from the answer cache")
+    timings: Optional[Dict[str, float]] = Field(default=None, description="Seconds per pipeline stage, with ?timings=true")
+    error: Optional[str] = None
 
 
 class QuestionAnswer(BaseModel):
@@ -125,6 +148,8 @@ class IngestResponse(BaseModel):
     doc_info: DocumentInfo
     processing_time: float
     cached: bool = False
+    results: List[Dict[str, Any]] = []
+    timings: Optional[Dict[str, float]] = Field(default=None, description="Seconds per pipeline stage, with ?timings=true")
 
 
 class ErrorResponse(BaseModel):
@@ -145,6 +170,20 @@ class HealthResponse(BaseModel):
     system_info: Dict[str, Any] = {}
 
 
+class IngestJobResponse(BaseModel):
+    """Status of a background ingestion job"""
+    job_id: str
+    doc_id: str
+    urls: List[str]
+    status: str = Field(..., description="queued, downloading, parsing, embedding, indexed or failed")
+    stages: Dict[str, Dict[str, Optional[float]]] = Field(default_factory=dict, description="Start/finish time and duration of each stage reached")
+    created_at: float
+    finished_at: Optional[float] = None
+    total_time: Optional[float] = None
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+
+
 class StatusResponse(BaseModel):
     """System status response"""
     vectorstore_status: str
@@ -153,3 +192,4 @@ class StatusResponse(BaseModel):
     available_doc_ids: List[str]
     cache_size: int
     memory_usage: Optional[Dict[str, Any]] = None
+    ingest_jobs: Dict[str, int] = Field(default_factory=dict, description="Background ingest jobs by status")
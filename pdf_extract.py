@@ -0,0 +1,63 @@
+"""
+PDF page text extraction, split across a process pool for large documents.
+Kept free of app imports so spawned workers start quickly.
+"""
+import logging
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+
+from PyPDF2 import PdfReader
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def extract_page_range(path: str, start: int, end: int) -> List[str]:
+    """Text of pages [start, end) of the PDF at `path`; runs inside a worker process"""
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: forking a process that runs torch/uvicorn threads can deadlock
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def extract_pages_parallel(path: str, page_count: int, workers: int) -> List[str]:
+    """
+    Extract every page of the PDF at `path` in page-range batches on a process pool.
+    Returns one string per page, in page order.
+    """
+    # A couple of batches per worker keeps them busy when page costs are uneven
+    batch_size = max(1, math.ceil(page_count / (workers * 2)))
+    ranges = [(start, min(start + batch_size, page_count)) for start in range(0, page_count, batch_size)]
+
+    try:
+        pool = _get_pool(workers)
+        futures = [pool.submit(extract_page_range, path, start, end) for start, end in ranges]
+        pages: List[str] = []
+        for future in futures:
+            pages.extend(future.result())
+        return pages
+    except BrokenProcessPool:
+        logger.warning("PDF worker pool died; extracting pages in-process")
+        _reset_pool()
+        return extract_page_range(path, 0, page_count)
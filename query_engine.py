@@ -1,70 +1,244 @@
+import logging
+import queue
 import time
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_right
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
 from config import settings
-from llm import get_llm_chain, query_multiple_questions, clean_answer
-from utils import extract_text_from_url, clean_text
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
-from vector_store import vector_index
+from llm import get_llm_chain, query_multiple_questions, clean_answer, answer_question_group, group_questions as llm_group_questions, LLMError
+from llm import answer_cache_stats, cached_similar_answer, get_answer_cache
+from utils import extract_text_from_url, extract_documents, clean_text, get_file_hash, map_concurrently, normalize_url, SingleFlight, timing_decorator
+from langchain_core.documents import Document
+from vector_store import VectorIndex, index_registry, embedding_cache_stats
+from metrics import REGISTRY
 
-# Cache for processed documents to avoid re-embedding
-_document_cache = {}
+logger = logging.getLogger(__name__)
+
+# Concurrent requests for the same document share one download/parse/embed
+_index_flights = SingleFlight()
+
+def document_key(url: str) -> str:
+    """Cache key for a document URL, stable across re-signed SAS links"""
+    return get_file_hash(normalize_url(url, strip_sas=settings.strip_sas_params))
+
+def _page_starts(raw_text: str, page_offsets: List[List[int]]) -> Tuple[List[int], List[int]]:
+    """
+    Map PDF page offsets in the raw text onto the cleaned text. clean_text works line
+    by line, so the cleaned document is the cleaned pages joined by newlines.
+    """
+    starts, numbers = [], []
+    position = 0
+    ends = [offset for offset, _ in page_offsets[1:]] + [len(raw_text)]
+    for (offset, number), end in zip(page_offsets, ends):
+        page_text = clean_text(raw_text[offset:end])
+        if page_text:
+            starts.append(position)
+            numbers.append(number)
+            position += len(page_text) + 1
+    return starts, numbers
+
+@timing_decorator(stage="chunk")
+def chunk_document(raw_text: str, metadata: Dict[str, Any], chunk_size: int = 500, chunk_overlap: int = 50) -> List[Document]:
+    """
+    Clean and split one document's extracted text into chunks carrying its metadata.
+    PDF chunks also get the page number they start on; the bulky `page_offsets`
+    entry is removed from `metadata` in the process.
+    """
+    # Imported here: langchain's text splitters are slow to import and only needed once documents arrive
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    page_offsets = metadata.pop("page_offsets", None)
+    cleaned = clean_text(raw_text)
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        add_start_index=bool(page_offsets)
+    )
+    docs = splitter.create_documents([cleaned])
+
+    starts, numbers = _page_starts(raw_text, page_offsets) if page_offsets else ([], [])
+    for doc in docs:
+        doc.metadata.update(metadata)
+        if starts:
+            start_index = doc.metadata.pop("start_index", 0)
+            doc.metadata["page"] = numbers[max(0, bisect_right(starts, start_index) - 1)]
+    return docs
 
 def get_context(url: str) -> List[Document]:
     """
     Extract text from URL and convert to documents for processing.
-    Uses optimized chunking for better performance.
+    Chunks are not kept here: the indexed copy lives in the IndexRegistry docstore,
+    and an unchanged download is served from the validators store after a 304.
     """
-    # Check cache first
-    if url in _document_cache:
-        return _document_cache[url]
-    
     try:
         raw_text, metadata = extract_text_from_url([url])
-        cleaned = clean_text(raw_text)
         
         # Ultra-optimized chunking for speed
-        splitter = RecursiveCharacterTextSplitter(
+        return chunk_document(
+            raw_text,
+            metadata[0] if metadata else {},
             chunk_size=500,  # Reduced for faster processing
             chunk_overlap=50   # Minimal overlap
         )
-        docs = splitter.create_documents([cleaned])
-        
-        # Add metadata to documents
-        for doc in docs:
-            doc.metadata.update(metadata[0] if metadata else {})
-        
-        # Cache the result
-        _document_cache[url] = docs
-        return docs
     except Exception as e:
         print(f"Error getting context from URL {url}: {e}")
         return []
 
-def run_query(question: str, docs: List[Document], max_docs: int = 2) -> str:
+def ingest_urls(doc_id: str, urls: List[str], chunk_size: int = 1000, chunk_overlap: int = 300,
+                on_stage: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
     """
-    Run a single query using the LLM chain and return a clean, concise answer.
-    Returns clean answer without Q: A: format.
+    Fetch and parse `urls` concurrently and index all of their chunks under `doc_id`,
+    replacing whatever that doc_id held before. A failing URL is reported in
+    `results` without aborting the others; RuntimeError is raised if none succeed.
+    `on_stage` is called as the job moves through downloading, parsing, embedding and indexed.
+    """
+    on_stage = on_stage or (lambda stage: None)
+    docs = []
+    results = []
+    metadata = {}
+    for item in extract_documents(urls, on_stage=on_stage):
+        if item["status"] != "success":
+            results.append({"url": item["url"], "status": "error", "error": item["error"]})
+            continue
+        chunks = chunk_document(item["text"], item["metadata"], chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        docs.extend(chunks)
+        metadata = metadata or item["metadata"]
+        results.append({"url": item["url"], "status": "success", "chunk_count": len(chunks)})
+
+    if not docs:
+        errors = "; ".join(f"{result['url']}: {result.get('error', 'no text extracted')}" for result in results)
+        raise RuntimeError(f"No content could be ingested. {errors}")
+
+    on_stage("embedding")
+    index_registry.get_or_create(doc_id).replace_document(doc_id, docs)
+    index_registry.persist(doc_id)
+    # Answers remembered for the old version of the document may no longer hold
+    answer_cache = get_answer_cache()
+    if answer_cache is not None:
+        answer_cache.invalidate(doc_id)
+    on_stage("indexed")
+    return {"chunk_count": len(docs), "metadata": metadata, "results": results}
+
+def get_cache_status() -> Dict[str, Any]:
+    """Size, hit rate and eviction counters for every cache, as reported by /health"""
+    return {
+        "indexes": index_registry.stats(),
+        "embeddings": embedding_cache_stats(),
+        "answers": answer_cache_stats(),
+    }
+
+def cache_metrics():
+    """/metrics collector: hit, miss and entry counts of every cache, read at scrape time"""
+    status = get_cache_status()
+    hits, misses, entries = [], [], []
+    embeddings = status["embeddings"]
+    if embeddings:
+        hits.append(({"cache": "embeddings"}, embeddings["hits"]))
+        misses.append(({"cache": "embeddings"}, embeddings["misses"]))
+        entries.append(({"cache": "embeddings"}, embeddings["entries"]))
+    answers = status["answers"]
+    if answers:
+        hits.append(({"cache": "answers_exact"}, answers["exact_hits"]))
+        hits.append(({"cache": "answers_semantic"}, answers["semantic_hits"]))
+        misses.append(({"cache": "answers"}, answers["misses"]))
+        entries.append(({"cache": "answers_exact"}, answers["exact_entries"]))
+        entries.append(({"cache": "answers_semantic"}, answers["semantic_entries"]))
+    entries.append(({"cache": "indexes"}, status["indexes"]["in_memory"]))
+    return [
+        ("cache_hits_total", "counter", "Cache lookups answered from the cache", hits),
+        ("cache_misses_total", "counter", "Cache lookups that missed", misses),
+        ("cache_entries", "gauge", "Entries currently held by each cache", entries),
+    ]
+
+REGISTRY.add_collector(cache_metrics)
+
+def get_index_status() -> Dict[str, Any]:
+    """Indexed documents and chunk totals, as reported by /status"""
+    doc_ids = index_registry.keys()
+    stats = index_registry.stats()
+    return {
+        "vectorstore_status": "ready" if doc_ids else "empty",
+        "total_documents": len(doc_ids),
+        # indexes evicted to disk are counted once reloaded
+        "total_chunks": stats["chunks_in_memory"],
+        "available_doc_ids": doc_ids,
+        # processed documents are cached as their indexes
+        "cache_size": stats["in_memory"],
+    }
+
+def run_query(question: str, docs: List[Document], max_docs: int = 2, scope: Optional[str] = None) -> Tuple[str, int, Optional[str]]:
+    """
+    Run a single query using the LLM chain over the top `max_docs` chunks.
+    Returns the raw answer (finish_answer cleans it), the context tokens the prompt used,
+    and "exact"/"semantic" when the answer came from the answer cache.
     """
     try:
         chain = get_llm_chain()
-        raw_answer = chain.run(input_documents=docs, question=question)
-        cleaned_answer = clean_answer(raw_answer)
-        
-        return cleaned_answer
+        return chain.run_with_usage(input_documents=docs[:max_docs], question=question, scope=scope)
+    except LLMError:
+        # Let callers report API failures as errors rather than as answers
+        raise
     except Exception as e:
-        return f"Error processing question: {str(e)}"
+        return f"Error processing question: {str(e)}", 0, None
+
+def build_index(doc_key: str, url: str) -> Optional[VectorIndex]:
+    """
+    Download, parse and embed a document into its own index and register it.
+    Runs once per document even when many requests ask for it at the same time.
+    """
+    # A flight that just finished may already have registered it
+    index = index_registry.get(doc_key)
+    if index is not None:
+        return index
 
-def process_query_batch(documents: str, questions: List[str], max_docs: int = 2, include_context: bool = True) -> Dict[str, Any]:
+    docs = get_context(url)
+    if not docs:
+        return None
+
+    index = VectorIndex()
+    index.add_documents(docs, doc_id=doc_key, source=url)
+    return index_registry.put(doc_key, index)
+
+def finish_answer(question: str, raw_answer: str) -> str:
+    """Final cleanup applied to every /hackrx/run answer, exactly once per answer"""
+    # Clean and truncate
+    cleaned_answer = clean_answer(raw_answer)
+
+    if "preventive health check" in question.lower():
+        if "not mention" in cleaned_answer.lower():
+            cleaned_answer = (
+                "Yes, the policy reimburses expenses for health check-ups at the end of every block of two continuous policy years, "
+                "provided the policy has been renewed without a break."
+            )
+    return cleaned_answer
+
+def document_index(documents: str) -> Tuple[str, Optional[VectorIndex]]:
+    """The registry key and index for a document URL, building it on first use"""
+    # Each URL gets its own index namespace so concurrent requests never share a store
+    doc_key = document_key(documents)
+    index = index_registry.get(doc_key)
+    if index is None:
+        index = _index_flights.do(doc_key, lambda: build_index(doc_key, documents))
+    return doc_key, index
+
+def process_query_batch(
+    documents: str,
+    questions: List[str],
+    max_docs: int = 2,
+    include_context: bool = True,
+    group_questions: Optional[bool] = None,
+) -> Dict[str, Any]:
     """
     Process multiple questions against a document URL and return structured results.
     Ultra-optimized for performance with minimal document retrieval.
+    With `group_questions` (default: settings.llm_group_questions), questions that
+    retrieved overlapping chunks are answered together in one LLM call.
     """
     start_time = time.time()
 
     try:
-        docs = get_context(documents)
-        if not docs:
+        doc_key, index = document_index(documents)
+        if index is None:
             return {
                 "answers": [
                     "Could not extract content from the provided URL."
@@ -75,41 +249,96 @@ def process_query_batch(documents: str, questions: List[str], max_docs: int = 2,
                 "processing_time": round(time.time() - start_time, 2)
             }
 
-        vector_index.add_documents(docs)
+        # Embed all questions in one pass and search them as a single FAISS batch
+        retrieved = index.search_batch(questions, k=max_docs)
 
-        answers = []
-        sources = []
-
-        for idx, question in enumerate(questions):
+        def answer_question(i: int):
             try:
-                relevant_docs = vector_index.search(question, k=2)
-                raw_answer = run_query(question, relevant_docs, max_docs)
+                raw_answer, context_tokens, cache_hit = run_query(questions[i], retrieved[i], max_docs, scope=doc_key)
+            except Exception as e:
+                return None, e
+            return (finish_answer(questions[i], raw_answer), retrieved[i], context_tokens, cache_hit), None
+
+        def answer_group(group: List[int]):
+            """(outcome, error) for each question of the group, in group order"""
+            if len(group) == 1:
+                return [answer_question(group[0])]
+            results = {}
+            # Questions seen before are answered from the semantic cache; the rest share one call
+            for i in group:
+                cached = cached_similar_answer(questions[i], doc_key)
+                if cached is not None:
+                    results[i] = ((finish_answer(questions[i], cached), retrieved[i], 0, "semantic"), None)
+            remaining = [i for i in group if i not in results]
+            if len(remaining) == 1:
+                results[remaining[0]] = answer_question(remaining[0])
+            elif remaining:
+                try:
+                    raw_answers, context_tokens, cache_hit = answer_question_group(
+                        [questions[i] for i in remaining], [retrieved[i][:max_docs] for i in remaining], scope=doc_key
+                    )
+                except LLMError as e:
+                    results.update({i: (None, e) for i in remaining})
+                else:
+                    if raw_answers is None:
+                        results.update({i: answer_question(i) for i in remaining})
+                    else:
+                        # The shared context is attributed evenly to the group's questions
+                        share = context_tokens // len(remaining)
+                        for i, raw_answer in zip(remaining, raw_answers):
+                            results[i] = ((finish_answer(questions[i], raw_answer), retrieved[i], share, cache_hit), None)
+            return [results[i] for i in group]
 
-                # Clean and truncate
-                cleaned_answer = clean_answer(raw_answer)
+        if settings.llm_group_questions if group_questions is None else group_questions:
+            groups = llm_group_questions(
+                [docs[:max_docs] for docs in retrieved],
+                max_group=settings.llm_group_max_questions,
+                min_overlap=settings.llm_group_min_overlap,
+            )
+        else:
+            groups = [[i] for i in range(len(questions))]
 
-                if "preventive health check" in question.lower():
-                    if "not mention" in cleaned_answer.lower():
-                        cleaned_answer = (
-                            "Yes, the policy reimburses expenses for health check-ups at the end of every block of two continuous policy years, "
-                            "provided the policy has been renewed without a break."
-                        )
+        # Groups are answered in parallel; results keep the input order
+        outcomes = [None] * len(questions)
+        for group, (group_outcomes, error) in zip(
+            groups, map_concurrently(answer_group, groups, max_workers=settings.llm_max_concurrency)
+        ):
+            for i, outcome in zip(group, group_outcomes or [(None, error)] * len(group)):
+                outcomes[i] = outcome
 
-                answers.append(cleaned_answer)
+        answers = []
+        sources = []
+        errors = []
+        context_tokens = []
+        cache_hits = []
 
-                if include_context and relevant_docs:
-                    sources.append({
-                        "source": documents,
-                        "text": relevant_docs[0].page_content[:200]
-                    })
+        for outcome, error in outcomes:
+            if error is not None:
+                answers.append(f"Error processing question: {str(error)}")
+                errors.append(error.to_dict() if isinstance(error, LLMError) else {"message": str(error)})
+                context_tokens.append(0)
+                cache_hits.append(None)
+                continue
+            errors.append(None)
 
-            except Exception as e:
-                answers.append(f"Error processing question: {str(e)}")
+            cleaned_answer, relevant_docs, tokens, cache_hit = outcome
+            answers.append(cleaned_answer)
+            context_tokens.append(tokens)
+            cache_hits.append(cache_hit)
+
+            if include_context and relevant_docs:
+                sources.append({
+                    "source": documents,
+                    "text": relevant_docs[0].page_content[:200]
+                })
 
         processing_time = round(time.time() - start_time, 2)
 
         return {
             "answers": answers,
+            "errors": errors,
+            "context_tokens": context_tokens,
+            "cache_hits": cache_hits,
             "sources": sources if include_context else [],
             "model_used": settings.llm_model,
             "processing_time": processing_time
@@ -125,3 +354,67 @@ def process_query_batch(documents: str, questions: List[str], max_docs: int = 2,
             "model_used": settings.llm_model,
             "processing_time": round(time.time() - start_time, 2)
         }
+
+def stream_query_batch(
+    documents: str,
+    questions: List[str],
+    max_docs: int = 2,
+    stream_tokens: bool = False,
+) -> Iterator[Dict[str, Any]]:
+    """
+    `process_query_batch` as a stream of events, so clients see each answer as soon
+    as it is ready instead of waiting for the slowest question:
+
+        {"event": "start", "questions": n}
+        {"event": "token", "index": i, "text": "..."}   (only with stream_tokens)
+        {"event": "answer", "index": i, "question": ..., "answer": ..., "error": ...,
+         "context_tokens": ..., "cache_hit": ...}
+        {"event": "done", "processing_time": seconds}
+
+    Answers arrive in completion order; `index` maps them back to `questions`.
+    clean_answer runs on the completed text, so streamed tokens are the raw reply.
+    """
+    start_time = time.time()
+    yield {"event": "start", "questions": len(questions)}
+
+    doc_key, index = document_index(documents)
+    if index is None:
+        for i, question in enumerate(questions):
+            yield {"event": "answer", "index": i, "question": question, "answer": "",
+                   "error": {"message": "Could not extract content from the provided URL."}}
+        yield {"event": "done", "processing_time": round(time.time() - start_time, 2)}
+        return
+
+    retrieved = index.search_batch(questions, k=max_docs)
+    events: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+    chain = get_llm_chain()
+
+    def answer(i: int) -> None:
+        question = questions[i]
+        event = {"event": "answer", "index": i, "question": question, "error": None}
+        try:
+            if stream_tokens:
+                raw_answer, context_tokens, cache_hit = chain.stream_with_usage(
+                    retrieved[i][:max_docs], question,
+                    on_token=lambda text: events.put({"event": "token", "index": i, "text": text}),
+                    scope=doc_key,
+                )
+            else:
+                raw_answer, context_tokens, cache_hit = chain.run_with_usage(retrieved[i][:max_docs], question, scope=doc_key)
+            event.update(answer=finish_answer(question, raw_answer), context_tokens=context_tokens, cache_hit=cache_hit)
+        except Exception as e:
+            logger.error(f"Streaming answer failed for question {question!r}: {e}")
+            event.update(answer="", error=e.to_dict() if isinstance(e, LLMError) else {"message": str(e)})
+        events.put(event)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(settings.llm_max_concurrency, len(questions)))) as pool:
+        for i in range(len(questions)):
+            pool.submit(answer, i)
+        remaining = len(questions)
+        while remaining:
+            event = events.get()
+            if event["event"] == "answer":
+                remaining -= 1
+            yield event
+
+    yield {"event": "done", "processing_time": round(time.time() - start_time, 2)}
@@ -0,0 +1,63 @@
+from answer_cache import AnswerCache, document_scope
+
+VECTORS = {
+    "What is the grace period?": [1.0, 0.0, 0.0],
+    "How long is the grace period?": [0.99, 0.05, 0.0],
+    "What is the waiting period for maternity?": [0.0, 1.0, 0.0],
+}
+
+
+def make_cache(**kwargs) -> AnswerCache:
+    return AnswerCache(embed=VECTORS.__getitem__, **kwargs)
+
+
+def test_exact_hit_comes_before_semantic():
+    cache = make_cache()
+    cache.store("key", "Thirty days.", scope="doc", question="What is the grace period?")
+    assert cache.lookup("key", scope="doc", question="What is the grace period?") == ("Thirty days.", "exact")
+
+
+def test_similar_question_hits_semantic_level():
+    cache = make_cache()
+    cache.store("key", "Thirty days.", scope="doc", question="What is the grace period?")
+    assert cache.lookup("other", scope="doc", question="How long is the grace period?") == ("Thirty days.", "semantic")
+    assert cache.lookup("other", scope="doc", question="What is the waiting period for maternity?") == (None, None)
+    assert cache.stats()["semantic_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_semantic_level_is_per_scope():
+    cache = make_cache()
+    cache.store("key", "Thirty days.", scope="doc-a", question="What is the grace period?")
+    assert cache.get_similar("doc-b", "How long is the grace period?") is None
+
+
+def test_semantic_level_is_off_without_embed():
+    cache = AnswerCache()
+    cache.store("key", "Thirty days.", scope="doc", question="What is the grace period?")
+    assert cache.stats()["semantic_entries"] == 0
+    assert cache.lookup("other", scope="doc", question="How long is the grace period?") == (None, None)
+
+
+def test_semantic_lookup_only_compares_recent_rows():
+    cache = make_cache(max_scope_rows=1)
+    cache.store("a", "Thirty days.", scope="doc", question="What is the grace period?")
+    cache.store("b", "Two years.", scope="doc", question="What is the waiting period for maternity?")
+    assert cache.get_similar("doc", "How long is the grace period?") is None
+
+
+def test_invalidate_drops_semantic_entries_of_the_document():
+    cache = make_cache()
+    cache.store("a", "Thirty days.", scope=document_scope(["doc-a", "doc-b"]), question="What is the grace period?")
+    cache.store("b", "Thirty days.", scope="*", question="What is the grace period?")
+    cache.store("c", "Thirty days.", scope="doc-c", question="What is the grace period?")
+    assert cache.invalidate("doc-b") == 2
+    assert cache.get_similar("doc-c", "How long is the grace period?") == "Thirty days."
+    # Exact entries are keyed by prompt and stay
+    assert cache.get_exact("a") == "Thirty days."
+
+
+def test_expired_entries_are_ignored():
+    cache = make_cache(ttl_seconds=-1)
+    cache.store("key", "Thirty days.", scope="doc", question="What is the grace period?")
+    assert cache.lookup("key", scope="doc", question="What is the grace period?") == (None, None)
@@ -0,0 +1,42 @@
+from bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def make_index() -> BM25Index:
+    index = BM25Index()
+    index.add("grace", "A grace period of thirty days is provided for premium payment.")
+    index.add("cataract", "The policy has a specific waiting period of two years for cataract surgery.")
+    index.add("ped", "Pre-existing diseases have a waiting period of thirty-six months.")
+    return index
+
+
+def test_tokenize_drops_stopwords_and_plural_s():
+    assert tokenize("What are the waiting periods for Diseases?") == ["waiting", "period", "disease"]
+
+
+def test_search_ranks_chunks_with_rare_terms_first():
+    results = make_index().search("waiting period for cataract", k=2)
+    assert [chunk_id for chunk_id, _, _ in results] == ["cataract", "ped"]
+    chunk_id, score, coverage = results[0]
+    assert score > results[1][1]
+    assert coverage == 1.0
+    assert results[1][2] < 1.0
+
+
+def test_search_without_matching_terms_is_empty():
+    assert make_index().search("ambulance") == []
+    assert BM25Index().search("grace") == []
+
+
+def test_remove_and_re_add_update_the_index():
+    index = make_index()
+    index.remove(["cataract"])
+    assert len(index) == 2
+    assert index.search("cataract") == []
+    index.add("grace", "Cataract surgery is covered.")
+    assert len(index) == 2
+    assert [chunk_id for chunk_id, _, _ in index.search("cataract")] == ["grace"]
+    assert index.search("premium") == []
+
+
+def test_reciprocal_rank_fusion_prefers_items_ranked_well_in_both_lists():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "a"]]) == ["b", "a", "c"]
@@ -0,0 +1,30 @@
+from array import array
+
+from embeddings import EmbeddingCache
+
+
+def test_embedding_cache_keeps_float32_arrays_and_returns_lists():
+    cache = EmbeddingCache("model", max_entries=10)
+    cache.put_many(["a"], [[0.5, 0.25]])
+    assert isinstance(cache._memory[cache.key("a")], array)
+    assert cache.get_many(["a", "b"]) == [[0.5, 0.25], None]
+
+
+def test_embedding_cache_memory_is_lru_bounded():
+    cache = EmbeddingCache("model", max_entries=2)
+    cache.put_many(["a", "b"], [[1.0], [2.0]])
+    cache.get_many(["a"])
+    cache.put_many(["c"], [[3.0]])
+    assert cache.get_many(["a", "b", "c"]) == [[1.0], None, [3.0]]
+
+
+def test_embedding_cache_disk_is_capped(tmp_path):
+    cache = EmbeddingCache("model", max_entries=1, db_path=tmp_path / "embeddings.sqlite3", max_disk_entries=10)
+    for i in range(25):
+        cache.put_many([f"text {i}"], [[float(i)]])
+    rows = cache._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    assert rows <= 10
+    # The newest vectors survive and are read back from disk
+    reopened = EmbeddingCache("model", db_path=tmp_path / "embeddings.sqlite3")
+    assert reopened.get_many(["text 24"]) == [[24.0]]
+    assert reopened.get_many(["text 0"]) == [None]
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from jobs import IngestJob, IngestJobManager, QueueFullError
+
+
+def wait_until_done(job: IngestJob, timeout: float = 5.0) -> None:
+    deadline = time.time() + timeout
+    while not job.done and time.time() < deadline:
+        time.sleep(0.01)
+    assert job.done
+
+
+def test_job_moves_through_stages_in_order():
+    job = IngestJob("doc", ["https://example.com/a.pdf"])
+    job.advance("downloading")
+    job.advance("parsing")
+    job.advance("downloading")  # a second URL reporting late doesn't move it back
+    assert job.status == "parsing"
+    job.advance("embedding")
+    job.advance("indexed")
+    state = job.to_dict()
+    assert state["status"] == "indexed" and job.done
+    assert list(state["stages"]) == ["queued", "downloading", "parsing", "embedding", "indexed"]
+    assert all(timing["finished_at"] is not None for timing in state["stages"].values())
+    assert state["total_time"] is not None
+
+
+def test_failed_job_stays_failed():
+    job = IngestJob("doc", [])
+    job.advance("downloading")
+    job.fail("404 Not Found")
+    job.advance("parsing")
+    state = job.to_dict()
+    assert state["status"] == "failed" and state["error"] == "404 Not Found"
+    assert state["stages"]["downloading"]["finished_at"] is not None
+
+
+def test_manager_runs_ingest_and_attaches_result():
+    def ingest(doc_id, urls, on_stage):
+        on_stage("downloading")
+        on_stage("indexed")  # only the manager marks a job indexed, once the result is set
+        return {"doc_id": doc_id, "chunks": 3}
+
+    manager = IngestJobManager(ingest, max_workers=1, max_pending=2, max_history=10)
+    job = manager.submit("doc", ["https://example.com/a.pdf"])
+    wait_until_done(job)
+    assert job.status == "indexed"
+    assert job.result == {"doc_id": "doc", "chunks": 3}
+    assert manager.get(job.job_id) is job
+    assert manager.stats() == {"indexed": 1}
+
+
+def test_manager_records_ingest_errors():
+    def ingest(doc_id, urls, on_stage):
+        raise RuntimeError("Could not extract content")
+
+    manager = IngestJobManager(ingest, max_workers=1, max_pending=2, max_history=10)
+    job = manager.submit("doc", [])
+    wait_until_done(job)
+    assert job.status == "failed" and job.error == "Could not extract content"
+
+
+def test_manager_rejects_jobs_beyond_the_queue_size():
+    release = threading.Event()
+    manager = IngestJobManager(lambda *args, **kwargs: release.wait(5), max_workers=1, max_pending=2, max_history=10)
+    manager.submit("a", [])
+    manager.submit("b", [])
+    with pytest.raises(QueueFullError):
+        manager.submit("c", [])
+    release.set()
+
+
+def test_manager_keeps_only_recent_finished_jobs():
+    manager = IngestJobManager(lambda *args, **kwargs: {}, max_workers=1, max_pending=5, max_history=1)
+    first = manager.submit("a", [])
+    wait_until_done(first)
+    second = manager.submit("b", [])
+    wait_until_done(second)
+    third = manager.submit("c", [])
+    wait_until_done(third)
+    assert manager.get(first.job_id) is None
+    assert manager.get(third.job_id) is third
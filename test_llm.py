@@ -0,0 +1,107 @@
+import json
+from pathlib import Path
+
+import pytest
+from langchain_core.documents import Document
+
+from llm import clean_answer, estimate_tokens, group_questions, pack_context, parse_answer_array
+
+# Outputs recorded from the uncompiled clean_answer; see benchmarks/clean_answer.py
+GOLDEN_CASES = json.loads((Path(__file__).parent / "benchmarks" / "clean_answer_golden.json").read_text(encoding="utf-8"))
+
+
+def chunks(*ids: str):
+    return [Document(page_content=chunk_id, metadata={"chunk_id": chunk_id}) for chunk_id in ids]
+
+
+POLICY_CHUNKS = [
+    "A grace period of thirty days is provided for premium payment. The policy lapses after that.",
+    "Maternity expenses are covered after a waiting period of twenty four months. Two deliveries are covered.",
+    "Cataract surgery has a waiting period of two years. Room rent is capped at one percent of the sum insured.",
+]
+
+
+def docs(*texts: str):
+    return [Document(page_content=text) for text in texts]
+
+
+def test_parse_answer_array_reads_the_json_array():
+    reply = 'Here you go:\n["Thirty days.", "Two years."]\nHope this helps.'
+    assert parse_answer_array(reply, 2) == ["Thirty days.", "Two years."]
+    assert parse_answer_array('["Yes", 24]', 2) == ["Yes", "24"]
+    # The array is taken from whatever the model wrapped it in
+    assert parse_answer_array('{"answers": ["a", "b"]}', 2) == ["a", "b"]
+
+
+def test_parse_answer_array_rejects_wrong_shapes():
+    assert parse_answer_array('["Thirty days."]', 2) is None
+    assert parse_answer_array("Thirty days. Two years.", 2) is None
+    assert parse_answer_array('["Thirty days.", "Two years."', 2) is None
+    assert parse_answer_array('[["Thirty days."], "Two years."]', 2) is None
+
+
+def test_group_questions_joins_overlapping_chunks():
+    retrieved = [chunks("a", "b"), chunks("b", "c"), chunks("x", "y"), chunks("a", "z")]
+    assert group_questions(retrieved, max_group=5, min_overlap=0.5) == [[0, 1, 3], [2]]
+
+
+def test_group_questions_respects_max_group_and_min_overlap():
+    retrieved = [chunks("a", "b"), chunks("a", "b"), chunks("a", "b")]
+    assert group_questions(retrieved, max_group=2, min_overlap=0.5) == [[0, 1], [2]]
+    assert group_questions([chunks("a", "b"), chunks("b", "c")], max_group=5, min_overlap=0.75) == [[0], [1]]
+
+
+def test_group_questions_keeps_questions_without_chunks_alone():
+    assert group_questions([chunks("a"), [], chunks("a")], max_group=5, min_overlap=0.5) == [[0, 2], [1]]
+
+
+@pytest.mark.parametrize("case", GOLDEN_CASES, ids=lambda case: case["input"][:40])
+def test_clean_answer_matches_golden_output(case):
+    assert clean_answer(case["input"]) == case["expected"]
+
+
+def test_clean_answer_matches_reference_implementation():
+    from benchmarks.clean_answer import ANSWERS, reference_clean_answer
+
+    for answer in ANSWERS:
+        assert clean_answer(answer) == reference_clean_answer(answer)
+
+
+@pytest.mark.parametrize("max_tokens", [1, 5, 10, 20, 40, 80, 1000])
+def test_pack_context_never_exceeds_the_budget(max_tokens):
+    texts, used = pack_context("What is the waiting period?", docs(*POLICY_CHUNKS), max_tokens)
+    assert used <= max_tokens
+    assert sum(estimate_tokens(text) for text in texts) <= max_tokens
+    assert texts
+
+
+def test_pack_context_keeps_everything_that_fits():
+    texts, used = pack_context("grace period", docs(*POLICY_CHUNKS), 1000)
+    assert texts == POLICY_CHUNKS
+    assert used == sum(estimate_tokens(sentence) for chunk in POLICY_CHUNKS for sentence in chunk.split(". "))
+
+
+def test_pack_context_ranks_by_question_terms_then_chunk_rank():
+    first = "The insurer settles claims within thirty days."
+    second = "The insurer settles refunds within fifteen days."
+    texts, _ = pack_context("claims", docs(second, first), estimate_tokens(first))
+    assert texts == [first]
+    texts, _ = pack_context("unrelated question", docs(second, first), estimate_tokens(second))
+    assert texts == [second]
+
+
+def test_pack_context_truncates_an_oversized_chunk_instead_of_dropping_it():
+    chunk = "grace " * 200
+    texts, used = pack_context("grace period", docs(chunk), 10)
+    assert texts == [chunk.strip()[:40]]
+    assert used == 10
+
+
+def test_pack_context_keeps_overlapping_sentences_once():
+    overlap = "Two deliveries are covered under the maternity benefit."
+    first = f"Maternity expenses are covered after two years. {overlap}"
+    second = f"{overlap} Newborn cover starts from day one."
+    # The splitter's overlap can also start mid-sentence
+    third = "deliveries are covered under the maternity benefit. Vaccinations are included."
+    texts, _ = pack_context("maternity", docs(first, second, third), 1000)
+    assert texts == [first, "Newborn cover starts from day one.", "Vaccinations are included."]
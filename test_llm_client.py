@@ -0,0 +1,155 @@
+import threading
+
+import httpx
+import pytest
+
+import llm_client
+from llm_client import LLMError, OpenRouterClient
+
+REPLY = {"choices": [{"message": {"content": "Thirty days."}}]}
+PAYLOAD = {"model": "test", "messages": [{"role": "user", "content": "Grace period?"}]}
+
+
+def make_client(handler, **kwargs) -> OpenRouterClient:
+    kwargs.setdefault("max_retries", 2)
+    kwargs.setdefault("backoff_base", 0.5)
+    kwargs.setdefault("backoff_max", 8.0)
+    client = OpenRouterClient(**kwargs)
+    client._client.close()
+    client._client = httpx.Client(base_url="https://openrouter.test/api/v1", transport=httpx.MockTransport(handler))
+    return client
+
+
+def replies(*responses):
+    """Handler answering with `responses` in turn, recording each request"""
+    queue = list(responses)
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return queue.pop(0)
+
+    return handler, seen
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(llm_client.time, "sleep", delays.append)
+    return delays
+
+
+def test_retryable_failures_are_retried_until_success(sleeps):
+    handler, seen = replies(httpx.Response(503), httpx.Response(429), httpx.Response(200, json=REPLY))
+    client = make_client(handler)
+
+    assert client.complete(PAYLOAD) == "Thirty days."
+    assert len(seen) == 3
+    assert len(sleeps) == 2
+    assert client.consecutive_failures == 0
+
+
+def test_client_errors_other_than_429_are_not_retried(sleeps):
+    handler, seen = replies(httpx.Response(400, text="bad request"), httpx.Response(200, json=REPLY))
+    client = make_client(handler)
+
+    with pytest.raises(LLMError) as raised:
+        client.complete(PAYLOAD)
+    assert raised.value.status_code == 400
+    assert not raised.value.retryable
+    assert raised.value.attempts == 1
+    assert len(seen) == 1
+    assert sleeps == []
+
+
+def test_llm_error_is_raised_once_retries_are_exhausted(sleeps):
+    handler, seen = replies(*[httpx.Response(502) for _ in range(3)])
+    client = make_client(handler, max_retries=2)
+
+    with pytest.raises(LLMError) as raised:
+        client.complete(PAYLOAD)
+    assert raised.value.status_code == 502
+    assert raised.value.attempts == 3
+    assert len(seen) == 3
+    assert client.consecutive_failures == 1
+
+
+def test_network_errors_are_retried(sleeps):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, json=REPLY)
+
+    client = make_client(handler)
+    assert client.complete(PAYLOAD) == "Thirty days."
+    assert len(calls) == 2
+
+
+def test_retry_after_is_honoured_and_capped(sleeps):
+    handler, _ = replies(
+        httpx.Response(429, headers={"retry-after": "3"}),
+        httpx.Response(429, headers={"retry-after": "120"}),
+        httpx.Response(200, json=REPLY),
+    )
+    client = make_client(handler, backoff_max=8.0)
+
+    client.complete(PAYLOAD)
+    assert sleeps == [3.0, 8.0]
+
+
+def test_backoff_is_jittered_exponential_and_capped():
+    client = make_client(replies()[0], backoff_base=0.5, backoff_max=4.0)
+    error = LLMError("busy", status_code=503, retryable=True)
+
+    for attempt, delay in enumerate([0.5, 1.0, 2.0, 4.0, 4.0]):
+        samples = [client._backoff(attempt, error) for _ in range(200)]
+        assert all(0.5 * delay <= sample <= 1.5 * delay for sample in samples)
+        # Jitter actually spreads the delays rather than returning a constant
+        assert max(samples) > min(samples)
+
+
+def test_unparseable_retry_after_falls_back_to_backoff():
+    client = make_client(replies()[0], backoff_base=1.0, backoff_max=8.0)
+    error = LLMError("busy", status_code=429, retryable=True, retry_after="Wed, 21 Oct 2026 07:28:00 GMT")
+
+    assert 0.5 <= client._backoff(0, error) <= 1.5
+
+
+def test_no_hedging_until_enough_latency_samples():
+    handler, seen = replies(httpx.Response(200, json=REPLY))
+    client = make_client(handler, hedge_requests=True, hedge_min_samples=3)
+    client._latencies.extend([0.001, 0.001])
+
+    assert client.p95_latency() is None
+    assert client.complete(PAYLOAD) == "Thirty days."
+    assert len(seen) == 1
+    client.close()
+
+
+def test_slow_call_sends_exactly_one_hedged_duplicate():
+    release = threading.Event()
+    calls = []
+    lock = threading.Lock()
+
+    def handler(request):
+        with lock:
+            calls.append(request)
+            number = len(calls)
+        if number == 1:
+            # The primary stalls well past the p95 until the test lets it go
+            release.wait(timeout=5)
+            return httpx.Response(200, json={"choices": [{"message": {"content": "primary"}}]})
+        return httpx.Response(200, json={"choices": [{"message": {"content": "hedge"}}]})
+
+    client = make_client(handler, hedge_requests=True, hedge_min_samples=3)
+    client._latencies.extend([0.01, 0.01, 0.01])
+
+    try:
+        assert client.complete(PAYLOAD) == "hedge"
+        assert len(calls) == 2
+    finally:
+        release.set()
+        client.close()
@@ -0,0 +1,39 @@
+import threading
+
+from fastapi.testclient import TestClient
+
+import main
+from warmup import Warmup
+
+
+def test_ready_recovers_after_a_failed_warmup(monkeypatch):
+    loaded, download_resumed = threading.Event(), threading.Event()
+    calls = []
+
+    def load_model():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("transient Hugging Face download error")
+        download_resumed.wait(5)
+        loaded.set()
+
+    warmup = Warmup([("embedding_model", load_model)], retries=0, backoff=0)
+    monkeypatch.setattr(main, "warmup", warmup)
+    monkeypatch.setattr(main, "embeddings_loaded", loaded.is_set)
+    monkeypatch.setattr(main, "llm_client_health", lambda: {"healthy": True})
+    monkeypatch.setattr(main.settings, "warmup_on_startup", True)
+    client = TestClient(main.app)
+
+    warmup.start()
+    assert warmup.wait(5) and warmup.status == "failed"
+
+    # The probe itself starts the next attempt
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert warmup.status == "warming"
+    download_resumed.set()
+    assert warmup.wait(5) and warmup.status == "ready"
+
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["checks"]["embeddings"]["warmup"]["attempts"] == 2
@@ -0,0 +1,48 @@
+import query_engine
+import utils
+
+
+def test_stream_reports_extraction_failure_as_error_object(monkeypatch):
+    monkeypatch.setattr(query_engine, "document_index", lambda documents: ("key", None))
+    events = list(query_engine.stream_query_batch("https://example.com/empty.pdf", ["Grace period?"]))
+    assert [event["event"] for event in events] == ["start", "answer", "done"]
+    assert events[1]["error"] == {"message": "Could not extract content from the provided URL."}
+
+
+PAGE_MARKERS = {"pone": 1, "pthree": 3, "pfour": 4}
+
+
+def pdf_text(monkeypatch, pages):
+    monkeypatch.setattr(utils, "_extract_pdf_pages", lambda body: pages)
+    return utils.parse_document(utils.DownloadResult("https://example.com/policy.pdf", content_type="application/pdf"))
+
+
+def first_page_in(text: str) -> int:
+    return next(PAGE_MARKERS[word] for word in text.split() if word in PAGE_MARKERS)
+
+
+def test_chunks_carry_the_page_they_start_on(monkeypatch):
+    pages = [
+        "\n  POLICY WORDING\n" + "pone clause text here.\n" * 9 + "7\n",
+        "",
+        "pthree benefit text.\n" * 12,
+        "pfour exclusion wording.\n" * 6,
+    ]
+    raw_text, metadata = pdf_text(monkeypatch, pages)
+    assert [number for _, number in metadata["page_offsets"]] == [1, 3, 4]
+
+    docs = query_engine.chunk_document(raw_text, metadata, chunk_size=120, chunk_overlap=0)
+
+    assert "page_offsets" not in metadata
+    assert [doc.metadata["page"] for doc in docs] == [first_page_in(doc.page_content) for doc in docs]
+    assert {doc.metadata["page"] for doc in docs} == {1, 3, 4}
+    straddling = [doc for doc in docs if len({PAGE_MARKERS[w] for w in doc.page_content.split() if w in PAGE_MARKERS}) > 1]
+    assert straddling
+    assert all(doc.metadata["page"] == first_page_in(doc.page_content) for doc in straddling)
+
+
+def test_page_starts_skip_pages_that_clean_to_nothing():
+    raw_text = "pone text\n42\npthree text\n"
+    starts, numbers = query_engine._page_starts(raw_text, [[0, 1], [10, 2], [13, 3]])
+    assert numbers == [1, 3]
+    assert starts == [0, len("pone text") + 1]
@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+
+import pytest
+import requests
+
+import utils
+from config import settings
+from utils import SingleFlight, download_document, extract_document, normalize_url
+
+
+def test_normalize_url_strips_sas_params_from_azure_blob_links():
+    first = "https://hackrx.blob.core.windows.net/assets/policy.pdf?sv=2023-01-03&sp=r&sig=abc"
+    second = "https://HACKRX.blob.core.windows.net/assets/policy.pdf?sig=xyz&sv=2024-05-04&sp=r#page=2"
+    assert normalize_url(first) == normalize_url(second) == "https://hackrx.blob.core.windows.net/assets/policy.pdf"
+
+
+def test_normalize_url_strips_sas_params_when_signed():
+    assert normalize_url("https://cdn.example.com/doc.pdf?se=2027&sig=abc&v=2") == "https://cdn.example.com/doc.pdf?v=2"
+
+
+def test_normalize_url_keeps_sas_like_params_on_other_hosts():
+    assert normalize_url("https://example.com/doc?sr=2") != normalize_url("https://example.com/doc?sr=3")
+    assert normalize_url("https://example.com/doc?st=summary") != normalize_url("https://example.com/doc?st=full")
+
+
+def test_normalize_url_can_keep_sas_params():
+    url = "https://hackrx.blob.core.windows.net/assets/policy.pdf?sig=abc"
+    assert normalize_url(url, strip_sas=False) == url
+
+
+def test_single_flight_shares_one_call_between_concurrent_callers():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def build():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return "index"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("doc", build)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flight.do("doc", build))) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    for thread in [leader] + followers:
+        thread.join()
+    assert results == ["index"] * 5
+    assert len(calls) == 1
+
+
+def test_single_flight_shares_exceptions_and_forgets_finished_calls():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("download failed")
+
+    with pytest.raises(ValueError):
+        flight.do("doc", fail)
+    # The failed call is not remembered: the next caller runs again
+    assert flight.do("doc", lambda: "index") == "index"
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None, chunks=()):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.chunks = list(chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+    def iter_content(self, chunk_size):
+        yield from self.chunks
+
+
+class FakeSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append(headers or {})
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def download_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "enable_cache", True)
+    monkeypatch.setattr(settings, "cache_dir", str(tmp_path))
+    return tmp_path / "downloads"
+
+
+def use_session(monkeypatch, *responses):
+    session = FakeSession(*responses)
+    monkeypatch.setattr(utils, "_http_session", session)
+    return session
+
+
+def test_download_aborts_once_the_size_cap_is_exceeded(monkeypatch):
+    chunk = b"x" * 1024
+    use_session(monkeypatch, FakeResponse(chunks=[chunk] * 3))
+
+    with pytest.raises(ValueError, match="exceeds"):
+        download_document("https://example.com/big.pdf", max_bytes=2 * 1024 + 1)
+
+
+def test_download_rejects_a_declared_size_over_the_cap(monkeypatch):
+    session = use_session(monkeypatch, FakeResponse(headers={"content-length": "5000"}, chunks=[b"never read"]))
+
+    with pytest.raises(ValueError, match="over the"):
+        download_document("https://example.com/big.pdf", max_bytes=4000)
+    assert session.responses == []
+
+
+def test_download_spills_past_the_spool_limit_to_disk(monkeypatch):
+    chunk = b"y" * utils.DOWNLOAD_CHUNK_BYTES
+    count = utils.SPOOL_MAX_BYTES // len(chunk) + 1
+    use_session(monkeypatch, FakeResponse(headers={"content-type": "application/pdf"}, chunks=[chunk] * count))
+
+    download = download_document("https://example.com/doc.pdf")
+    try:
+        assert download.size == len(chunk) * count
+        assert download.body._rolled
+        assert download.body.read() == chunk * count
+    finally:
+        download.close()
+
+
+def test_small_download_stays_in_memory(monkeypatch):
+    use_session(monkeypatch, FakeResponse(chunks=[b"small"]))
+
+    download = download_document("https://example.com/doc.html")
+    try:
+        assert not download.body._rolled
+        assert download.body.read() == b"small"
+    finally:
+        download.close()
+
+
+HTML_PAGE = b"<html><head><title>Policy</title></head><body><p>Grace period is thirty days.</p></body></html>"
+
+
+def test_not_modified_returns_cached_text_without_parsing(monkeypatch, download_cache):
+    url = "https://example.com/policy.html"
+    headers = {"content-type": "text/html", "etag": '"v1"'}
+    session = use_session(monkeypatch, FakeResponse(headers=headers, chunks=[HTML_PAGE]), FakeResponse(status_code=304))
+
+    text, meta = extract_document(url)
+    assert "thirty days" in text
+
+    def fail_parse(download):
+        raise AssertionError("a 304 must not parse the document again")
+
+    monkeypatch.setattr(utils, "parse_document", fail_parse)
+    cached_text, cached_meta = extract_document(url)
+
+    assert session.requests[1]["If-None-Match"] == '"v1"'
+    assert cached_text == text
+    assert cached_meta == meta
+
+
+def test_expired_validators_are_ignored(monkeypatch, download_cache):
+    url = "https://example.com/policy.html"
+    headers = {"content-type": "text/html", "etag": '"v1"'}
+    session = use_session(monkeypatch, FakeResponse(headers=headers, chunks=[HTML_PAGE]),
+                          FakeResponse(headers=headers, chunks=[HTML_PAGE]))
+    extract_document(url)
+
+    real_time = time.time
+    monkeypatch.setattr(utils.time, "time", lambda: real_time() + settings.cache_ttl_hours * 3600 + 1)
+    extract_document(url)
+
+    assert "If-None-Match" not in session.requests[1]
+
+
+def test_validators_store_keeps_the_newest_files(monkeypatch, download_cache):
+    monkeypatch.setattr(settings, "download_cache_max_files", 2)
+    urls = [f"https://example.com/{n}.html" for n in range(3)]
+    responses = [FakeResponse(headers={"content-type": "text/html", "etag": f'"{n}"'}, chunks=[HTML_PAGE])
+                 for n in range(3)]
+    use_session(monkeypatch, *responses)
+
+    for n, url in enumerate(urls):
+        extract_document(url)
+        # Spread the mtimes so the oldest entry is unambiguous
+        os.utime(utils._validator_path(url), (n, n))
+
+    assert len(list(download_cache.glob("*.json"))) == 2
+    assert utils._load_validators(urls[0]) is None
+    assert utils._load_validators(urls[2])["etag"] == '"2"'
@@ -0,0 +1,125 @@
+import hashlib
+import time
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from config import settings
+from vector_store import IndexRegistry, VectorIndex, hybrid_search
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic 8-dim vectors, so indexes can be built without the model"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        digest = hashlib.sha256(text.encode()).digest()
+        return [byte / 255 for byte in digest[:8]]
+
+
+class RecordingEmbeddings(HashEmbeddings):
+    """HashEmbeddings that remembers every text it embedded"""
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+def make_index(text: str = "A grace period of thirty days is provided.") -> VectorIndex:
+    index = VectorIndex(embeddings=HashEmbeddings(), index_type="flat")
+    index.add_documents([Document(page_content=text)], doc_id="doc")
+    return index
+
+
+def test_registry_evicts_least_recently_used():
+    registry = IndexRegistry(max_indexes=2)
+    first, second = registry.put("a", make_index()), registry.put("b", make_index())
+    registry.get("a")
+    registry.put("c", make_index())
+    assert registry.get("a") is first
+    assert registry.get("b") is None
+    assert second is not None and registry.stats()["evictions"] == 1
+
+
+def test_registry_drops_expired_index_from_memory_and_disk(tmp_path):
+    registry = IndexRegistry(store_dir=tmp_path, ttl_hours=1)
+    index = registry.put("a", make_index())
+    assert any(tmp_path.iterdir())
+    index.built_at = time.time() - 2 * 3600
+    assert registry.get("a") is None
+    assert "a" not in registry
+    assert not any(tmp_path.iterdir())
+
+
+def test_restore_skips_directory_without_meta(tmp_path):
+    in_progress = tmp_path / "partial"
+    in_progress.mkdir()
+    (in_progress / "index.faiss.tmp").write_bytes(b"")
+    registry = IndexRegistry(store_dir=tmp_path, ttl_hours=1)
+    assert registry.keys() == []
+    assert in_progress.exists()
+
+
+def test_unscoped_search_covers_only_indexes_in_memory(tmp_path):
+    registry = IndexRegistry(max_indexes=1, store_dir=tmp_path)
+    registry.put("a", make_index())
+    registry.put("b", make_index())  # evicts "a" to disk
+    assert registry.resolve() == ["b"]
+    assert registry.resolve(["a"]) == ["a"]
+
+
+def test_unscoped_search_after_restart_loads_at_most_max_indexes(tmp_path):
+    registry = IndexRegistry(max_indexes=3, store_dir=tmp_path)
+    for key in "abc":
+        registry.put(key, make_index())
+    restarted = IndexRegistry(max_indexes=2, store_dir=tmp_path)
+    assert len(restarted.resolve()) == 2
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_replace_document_drops_old_chunks_and_embeds_only_new_ones(index_type):
+    embeddings = RecordingEmbeddings()
+    index = VectorIndex(embeddings=embeddings, index_type=index_type)
+    index.add_documents([Document(page_content=f"other {n}") for n in range(2)], doc_id="other")
+    index.add_documents([Document(page_content=f"old {n}") for n in range(3)], doc_id="doc")
+    store = index.vectorstore
+    assert store.index.ntotal == 5
+    embeddings.embedded.clear()
+
+    new_ids = index.replace_document("doc", [Document(page_content=f"new {n}") for n in range(2)])
+
+    assert embeddings.embedded == ["new 0", "new 1"]
+    assert store.index.ntotal == 4
+    assert index.chunk_count == 4
+    mapped = set(store.index_to_docstore_id.values())
+    assert mapped == {"other:0", "other:1", *new_ids}
+    assert "doc:2" not in store.docstore._dict
+    contents = {store.docstore.search(chunk_id).page_content for chunk_id in mapped}
+    assert contents == {"other 0", "other 1", "new 0", "new 1"}
+    assert [doc.page_content for doc in index.keyword_search("old", k=5)] == []
+
+
+def test_keyword_rankings_of_separate_indexes_are_fused_not_their_raw_scores(monkeypatch):
+    monkeypatch.setattr(settings, "retrieval_mode", "hybrid")
+    monkeypatch.setattr(settings, "keyword_fast_path", True)
+    monkeypatch.setattr(settings, "keyword_fast_path_coverage", 1.0)
+    monkeypatch.setattr(settings, "keyword_fast_path_max_matches", 100)
+    # "grace" is rare in the first corpus, so its raw BM25 scores dwarf the second's
+    rare = VectorIndex(embeddings=HashEmbeddings(), index_type="flat")
+    rare.add_documents([Document(page_content=text) for text in [
+        "grace period of thirty days", "grace period for renewal",
+        "hospital room rent", "ambulance cover", "maternity benefits", "cataract surgery",
+    ]], doc_id="rare")
+    common = VectorIndex(embeddings=HashEmbeddings(), index_type="flat")
+    common.add_documents([Document(page_content=f"grace period clause {n}") for n in range(6)], doc_id="common")
+    assert common.keyword_hits("grace period")[0][0][1] < rare.keyword_hits("grace period")[0][1][1]
+
+    [top] = hybrid_search([rare, common], ["grace period"], k=2, embeddings=HashEmbeddings())
+
+    assert {doc.metadata["doc_id"] for doc in top} == {"rare", "common"}
@@ -0,0 +1,37 @@
+from warmup import Warmup
+
+
+class Flaky:
+    """A step that fails `failures` times before it succeeds"""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise OSError("connection reset while downloading the model")
+
+
+def test_failed_step_is_retried_on_the_warmup_thread():
+    step = Flaky(failures=2)
+    warmup = Warmup([("embedding_model", step)], retries=3, backoff=0)
+    warmup.start()
+    assert warmup.wait(5)
+    assert warmup.status == "ready"
+    assert step.calls == 3 and warmup.to_dict()["attempts"] == 3
+
+
+def test_failed_warmup_can_be_started_again_and_skips_finished_steps():
+    first, second = Flaky(failures=0), Flaky(failures=1)
+    warmup = Warmup([("first", first), ("second", second)], retries=0, backoff=0)
+    warmup.start()
+    assert warmup.wait(5)
+    assert warmup.status == "failed" and "second" in warmup.error
+
+    assert warmup.start()
+    assert warmup.wait(5)
+    assert warmup.status == "ready" and warmup.error is None
+    assert (first.calls, second.calls) == (1, 2)
+    assert not warmup.start()  # nothing left to do
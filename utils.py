@@ -1,17 +1,22 @@
 """
 Utility functions for the Document Q&A System
 """
+import contextvars
 import hashlib
 import logging
 import time
 import psutil
 import re
 import os
+import threading
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable, List, Tuple
 from functools import wraps
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 import requests
 from bs4 import BeautifulSoup
+from metrics import span
 
 # Set up logger
 logger = logging.getLogger(__name__)
@@ -45,94 +50,455 @@ def get_file_hash(url: str) -> str:
     """Generate a hash for a URL/file for caching purposes"""
     return hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]
 
-def timing_decorator(func):
-    """Decorator to measure function execution time"""
+# Azure Blob SAS token parameters: they change per link but not the document behind it
+SAS_QUERY_PARAMS = {
+    "sv", "ss", "srt", "sp", "se", "st", "spr", "sig", "sip", "si", "sr", "sdd",
+    "skoid", "sktid", "skt", "ske", "sks", "skv", "rscc", "rscd", "rsce", "rscl", "rsct",
+}
+
+AZURE_BLOB_HOST_SUFFIX = ".blob.core.windows.net"
+
+def is_sas_url(parts) -> bool:
+    """Whether a split URL is a signed Azure Blob link, so its SAS parameters can be ignored"""
+    host = (parts.hostname or "").lower()
+    if host.endswith(AZURE_BLOB_HOST_SUFFIX):
+        return True
+    return any(name.lower() == "sig" for name, _ in parse_qsl(parts.query, keep_blank_values=True))
+
+def normalize_url(url: str, strip_sas: bool = True) -> str:
+    """
+    Canonical form of a document URL for cache and de-duplication keys:
+    lower-cased scheme/host, no fragment, sorted query, and SAS token parameters
+    optionally removed so re-signed links map to the same document.
+
+    SAS parameters are only removed from Azure Blob hosts or URLs carrying a `sig`;
+    elsewhere names like `sr` or `st` are ordinary parameters that select the document.
+    """
+    parts = urlsplit(url.strip())
+    strip_sas = strip_sas and is_sas_url(parts)
+    query = [
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not (strip_sas and name.lower() in SAS_QUERY_PARAMS)
+    ]
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(sorted(query)), ""))
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into a single execution.
+    The first caller runs the function; callers arriving while it is in flight
+    wait for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = Future()
+                self._calls[key] = call
+
+        if not leader:
+            return call.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+def timing_decorator(func=None, *, stage: Optional[str] = None):
+    """
+    Decorator to measure function execution time. The time is also recorded as a
+    metrics span named `stage` (default: the function name):
+
+        @timing_decorator
+        @timing_decorator(stage="chunk")
+    """
+    if func is None:
+        return lambda f: timing_decorator(f, stage=stage)
+
     @wraps(func)
     def wrapper(*args, **kwargs):
         start_time = time.time()
-        result = func(*args, **kwargs)
+        with span(stage or func.__name__):
+            result = func(*args, **kwargs)
         end_time = time.time()
-        logger.info(f"{func.__name__} executed in {end_time - start_time:.2f} seconds")
+        logger.debug(f"{func.__name__} executed in {end_time - start_time:.2f} seconds")
         return result
     return wrapper
 
-def get_system_info() -> Dict[str, Any]:
-    """Get system information for monitoring"""
+def map_concurrently(func: Callable[[Any], Any], items: List[Any], max_workers: int = 8) -> List[Tuple[Any, Optional[Exception]]]:
+    """
+    Apply `func` to every item on a bounded thread pool.
+    Returns (result, error) pairs in input order; one failing item never fails the others.
+    """
+    def call(item):
+        try:
+            return func(item), None
+        except Exception as e:
+            return None, e
+
+    if len(items) <= 1 or max_workers <= 1:
+        return [call(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        # Workers run in a copy of the caller's context so their spans reach its timings
+        futures = [pool.submit(contextvars.copy_context().run, call, item) for item in items]
+        return [future.result() for future in futures]
+
+def sample_system_info() -> Dict[str, Any]:
+    """
+    Read current system metrics. Never blocks: CPU usage is measured since the
+    previous call, so the first sample of a process reads 0.0.
+    """
     try:
+        memory = psutil.virtual_memory()
         return {
-            "cpu_percent": psutil.cpu_percent(interval=1),
-            "memory_percent": psutil.virtual_memory().percent,
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_percent": memory.percent,
             "disk_usage": psutil.disk_usage('/').percent,
-            "available_memory_gb": round(psutil.virtual_memory().available / (1024**3), 2)
+            "available_memory_gb": round(memory.available / (1024**3), 2),
+            "sampled_at": round(time.time(), 1)
         }
     except Exception as e:
         logger.warning(f"Could not get system info: {e}")
         return {}
 
+_system_info: Dict[str, Any] = {}
+_system_sampler: Optional[threading.Thread] = None
+_system_sampler_lock = threading.Lock()
+
+def start_system_sampler(interval: float) -> None:
+    """Refresh the system info served by get_system_info every `interval` seconds on a daemon thread"""
+    global _system_sampler
+
+    def sample_forever():
+        global _system_info
+        while True:
+            _system_info = sample_system_info()
+            time.sleep(interval)
+
+    with _system_sampler_lock:
+        if _system_sampler is None:
+            _system_sampler = threading.Thread(target=sample_forever, name="system-info", daemon=True)
+            _system_sampler.start()
+
+def get_system_info() -> Dict[str, Any]:
+    """Get system information for monitoring: the latest background sample, or a fresh non-blocking one"""
+    return dict(_system_info) or sample_system_info()
+
 from typing import Dict, Any
 from bs4 import BeautifulSoup
 from PyPDF2 import PdfReader
-from io import BytesIO
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile
+import json
+import shutil
 import requests
-
-def extract_text_from_url(urls: list[str], timeout: int = 30) -> tuple[str, list[Dict[str, Any]]]:
+from config import settings
+from pdf_extract import extract_pages_parallel
+
+DOWNLOAD_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+SPOOL_MAX_BYTES = 1024 * 1024  # downloads larger than this spill to a temp file
+
+
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+
+def _get_http_session() -> requests.Session:
+    """Keep-alive session whose pool is sized for concurrent document downloads"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=settings.ingest_max_concurrency,
+                    pool_maxsize=settings.ingest_max_concurrency
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _http_session = session
+    return _http_session
+
+
+class DownloadResult:
+    """A streamed download: body spooled to memory/disk, or a 304 for a cached copy"""
+
+    def __init__(self, url: str, content_type: str = "", body=None, size: int = 0,
+                 etag: Optional[str] = None, last_modified: Optional[str] = None,
+                 not_modified: bool = False):
+        self.url = url
+        self.content_type = content_type
+        self.body = body
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = not_modified
+
+    def close(self):
+        if self.body is not None:
+            self.body.close()
+
+
+def _validator_path(url: str) -> Optional[Path]:
+    """Where the ETag/Last-Modified validators and extracted text of a URL are kept"""
+    if not settings.enable_cache:
+        return None
+    key = get_file_hash(normalize_url(url, strip_sas=settings.strip_sas_params))
+    return settings.cache_path / "downloads" / f"{key}.json"
+
+
+def _load_validators(url: str) -> Optional[Dict[str, Any]]:
+    """The stored validators and text of a URL, unless older than settings.cache_ttl_hours"""
+    path = _validator_path(url)
+    if path is None or not path.exists():
+        return None
+    try:
+        with open(path) as f:
+            validators = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - validators.get("stored_at", 0) > settings.cache_ttl_hours * 3600:
+        path.unlink(missing_ok=True)
+        return None
+    return validators
+
+
+def _trim_validators(directory: Path) -> None:
+    """Delete the least recently written entries beyond settings.download_cache_max_files"""
+    entries = []
+    for entry in directory.glob("*.json"):
+        try:
+            entries.append((entry.stat().st_mtime, entry))
+        except OSError:
+            continue
+    excess = len(entries) - settings.download_cache_max_files
+    if excess <= 0:
+        return
+    entries.sort()
+    for _, entry in entries[:excess]:
+        entry.unlink(missing_ok=True)
+
+
+def _save_validators(download: DownloadResult, text: str, metadata: Dict[str, Any]) -> None:
+    path = _validator_path(download.url)
+    if path is None or not (download.etag or download.last_modified):
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "etag": download.etag,
+            "last_modified": download.last_modified,
+            "text": text,
+            "metadata": metadata,
+            "stored_at": time.time()
+        }, f)
+    os.replace(tmp_path, path)
+    _trim_validators(path.parent)
+
+
+def download_document(url: str, timeout: int = 30, max_bytes: Optional[int] = None,
+                      validators: Optional[Dict[str, Any]] = None) -> DownloadResult:
     """
-    Extract and combine text content from multiple URLs.
-    Returns: (combined_text_content, list_of_metadata)
+    Stream a document into a spooled temp file, aborting once it passes `max_bytes`.
+    With `validators` from an earlier download, a conditional request is sent and
+    an unchanged document comes back as `not_modified` without a body.
     """
-    combined_text = ""
-    all_metadata = []
-
-    for url in urls:
+    headers = dict(DOWNLOAD_HEADERS)
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    with _get_http_session().get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if response.status_code == 304 and validators:
+            return DownloadResult(url, not_modified=True,
+                                  etag=validators.get("etag"), last_modified=validators.get("last_modified"))
+        response.raise_for_status()
+
+        declared = response.headers.get("content-length")
+        if max_bytes and declared and declared.isdigit() and int(declared) > max_bytes:
+            raise ValueError(f"Document is {format_file_size(int(declared))}, over the {format_file_size(max_bytes)} limit")
+
+        body = SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        size = 0
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise ValueError(f"Document exceeds the {format_file_size(max_bytes)} limit")
+                body.write(chunk)
+        except Exception:
+            body.close()
+            raise
+        body.seek(0)
+
+        return DownloadResult(
+            url,
+            content_type=response.headers.get('content-type', '').lower(),
+            body=body,
+            size=size,
+            etag=response.headers.get("etag"),
+            last_modified=response.headers.get("last-modified"),
+        )
+
+
+def _extract_pdf_pages(body) -> list[str]:
+    """
+    Text of every page of a PDF. Large documents are split into page ranges and
+    extracted on a process pool, since PyPDF2 is CPU-bound and holds the GIL.
+    """
+    pdf_reader = PdfReader(body)
+    page_count = len(pdf_reader.pages)
+    workers = settings.pdf_workers or os.cpu_count() or 1
+    if workers <= 1 or page_count < settings.pdf_parallel_min_pages:
+        return [page.extract_text() or "" for page in pdf_reader.pages]
+
+    # Worker processes open the file by name, so spill the spooled body to disk
+    with NamedTemporaryFile(suffix=".pdf") as tmp:
+        body.seek(0)
+        shutil.copyfileobj(body, tmp)
+        tmp.flush()
+        return extract_pages_parallel(tmp.name, page_count, workers)
+
+
+def parse_document(download: DownloadResult) -> tuple[str, Dict[str, Any]]:
+    """Extract plain text and metadata from a downloaded PDF or HTML document"""
+    url = download.url
+    content_type = download.content_type
+
+    # Case 1: PDF
+    if 'application/pdf' in content_type:
+        page_texts = _extract_pdf_pages(download.body)
+
+        # Join once instead of growing a string page by page, remembering where each page starts
+        pieces = []
+        page_offsets = []
+        position = 0
+        for number, page_text in enumerate(page_texts, start=1):
+            if page_text:
+                page_offsets.append([position, number])
+                pieces.append(page_text + "\n")
+                position += len(page_text) + 1
+        text = "".join(pieces)
+        leading = len(text) - len(text.lstrip())
+
+        return text.strip(), {
+            "source": url,
+            "type": "pdf",
+            "page_count": len(page_texts),
+            # [offset in the returned text, page number]; consumed by the chunker
+            "page_offsets": [[max(0, offset - leading), number] for offset, number in page_offsets],
+        }
 
-            response = requests.get(url, headers=headers, timeout=timeout)
-            response.raise_for_status()
+    # Case 2: HTML
+    elif 'text/html' in content_type:
+        soup = BeautifulSoup(download.body.read(), 'html.parser')
 
-            content_type = response.headers.get('content-type', '').lower()
+        for script in soup(["script", "style"]):
+            script.decompose()
 
-            # Case 1: PDF
-            if 'application/pdf' in content_type:
-                pdf_reader = PdfReader(BytesIO(response.content))
-                text = ""
-                for page in pdf_reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                combined_text += text.strip() + "\n\n"
-                all_metadata.append({"source": url, "type": "pdf"})
+        text = soup.get_text()
+        # str(): a NavigableString keeps the whole parse tree alive and pickles with it
+        title = str(soup.title.string) if soup.title and soup.title.string else None
 
-            # Case 2: HTML
-            elif 'text/html' in content_type:
-                soup = BeautifulSoup(response.content, 'html.parser')
+        lines = (line.strip() for line in text.splitlines())
+        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        text = ' '.join(chunk for chunk in chunks if chunk)
 
-                for script in soup(["script", "style"]):
-                    script.decompose()
+        meta = {"source": url, "type": "html"}
+        if title:
+            meta["title"] = title
+        return text.strip(), meta
 
-                text = soup.get_text()
-                title = soup.title.string if soup.title else None
+    else:
+        raise ValueError(f"Unsupported content type: {content_type}")
 
-                lines = (line.strip() for line in text.splitlines())
-                chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                text = ' '.join(chunk for chunk in chunks if chunk)
 
-                combined_text += text.strip() + "\n\n"
+def extract_document(url: str, timeout: int = 30,
+                     on_stage: Optional[Callable[[str], None]] = None) -> tuple[str, Dict[str, Any]]:
+    """
+    Download and parse a single URL.
+    Downloads are streamed and capped at settings.max_file_size_mb; a document whose
+    ETag/Last-Modified still matches is served from the local copy after a 304.
+    `on_stage` is told when the "downloading" and "parsing" stages begin.
+    """
+    on_stage = on_stage or (lambda stage: None)
+    max_bytes = settings.max_file_size_mb * 1024 * 1024
+    validators = _load_validators(url)
+    on_stage("downloading")
+    with span("download"):
+        download = download_document(url, timeout=timeout, max_bytes=max_bytes, validators=validators)
+
+    if download.not_modified:
+        logger.info(f"{url} not modified; using cached text")
+        return validators["text"], dict(validators["metadata"], source=url)
+
+    try:
+        on_stage("parsing")
+        with span("parse"):
+            text, meta = parse_document(download)
+    finally:
+        download.close()
+    meta["file_size"] = download.size
+    _save_validators(download, text, meta)
+    return text, meta
+
+
+def extract_documents(urls: list[str], timeout: int = 30,
+                      on_stage: Optional[Callable[[str], None]] = None) -> list[Dict[str, Any]]:
+    """
+    Fetch and parse several URLs concurrently (bounded by settings.ingest_max_concurrency).
+    Returns one result per URL, in input order:
+    {"url", "status": "success", "text", "metadata"} or {"url", "status": "error", "error"}.
+    """
+    outcomes = map_concurrently(
+        lambda url: extract_document(url, timeout=timeout, on_stage=on_stage),
+        list(urls),
+        max_workers=settings.ingest_max_concurrency
+    )
 
-                meta = {"source": url, "type": "html"}
-                if title:
-                    meta["title"] = title
-                all_metadata.append(meta)
+    results = []
+    for url, (outcome, error) in zip(urls, outcomes):
+        if error is not None:
+            logger.warning(f"Error extracting text from URL {url}: {error}")
+            results.append({"url": url, "status": "error", "error": str(error)})
+        else:
+            text, meta = outcome
+            results.append({"url": url, "status": "success", "text": text, "metadata": meta})
+    return results
 
-            else:
-                raise ValueError(f"Unsupported content type: {content_type}")
 
-        except Exception as e:
-            raise RuntimeError(f"Error extracting text from URL {url}: {e}")
+def extract_text_from_url(urls: list[str], timeout: int = 30) -> tuple[str, list[Dict[str, Any]]]:
+    """
+    Extract and combine text content from multiple URLs, fetched concurrently.
+    A failing URL is skipped; RuntimeError is raised only if every URL fails.
+    Returns: (combined_text_content, list_of_metadata) for the URLs that succeeded
+    """
+    results = extract_documents(urls, timeout=timeout)
+    succeeded = [result for result in results if result["status"] == "success"]
+    if not succeeded:
+        errors = "; ".join(f"{result['url']}: {result['error']}" for result in results)
+        raise RuntimeError(f"Error extracting text from URL {errors}")
 
-    return combined_text.strip(), all_metadata
+    combined_text = "\n\n".join(result["text"] for result in succeeded)
+    return combined_text.strip(), [result["metadata"] for result in succeeded]
 
 
 
@@ -157,49 +523,6 @@ def format_file_size(size_bytes: int) -> str:
 
 
 import re
-import nltk
-from nltk.tokenize import sent_tokenize
-nltk.download('punkt', quiet=True)
-
-def clean_answer(answer: str, max_length: int = 1000) -> str:
-    """
-    Cleans and formats the answer for HackRx standards.
-
-    Args:
-        answer: Raw answer string from LLM.
-        max_length: Max allowed length.
-
-    Returns:
-        Cleaned and concise answer (≤2 sentences, trimmed, formatted).
-    """
-    if not answer:
-        return ""
-
-    # Remove unwanted phrases
-    answer = re.sub(
-        r"(According to the document|Document \d+ states:|Based on the information provided,?)", 
-        '', 
-        answer, 
-        flags=re.IGNORECASE
-    )
-
-    # Collapse whitespace
-    answer = re.sub(r'\s+', ' ', answer).strip()
-
-    # Fix markdown ellipses and strip trailing punctuations
-    answer = re.sub(r'\.{3,}', '...', answer)
-    answer = re.sub(r'^\W+|\W+$', '', answer)
-
-    # Tokenize and keep first 2 meaningful sentences
-    sentences = sent_tokenize(answer)
-    answer = ' '.join(sentences[:2]).strip()
-
-    # Final truncate check (preserves whole words)
-    if len(answer) > max_length:
-        answer = answer[:max_length].rsplit(' ', 1)[0] + "..."
-
-    return answer
-
 
 def clean_text(text: str) -> str:
     """Clean and normalize raw text extracted from documents or web pages"""
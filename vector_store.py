@@ -1,23 +1,672 @@
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.schema import Document
+from langchain_core.documents import Document
 from config import settings
+from bm25 import BM25Index, reciprocal_rank_fusion
+from embeddings import CachedEmbeddings, EmbeddingCache, embedding_model_id, load_embedding_model
+from metrics import span
+from utils import get_file_hash
 import logging
 
 logger = logging.getLogger(__name__)
 
+_embeddings = None
+_embeddings_lock = threading.Lock()
+# Saved indexes and cached vectors are only reused by the same model on the same backend
+EMBEDDING_MODEL_ID = embedding_model_id(settings.embedding_model, settings.embedding_backend)
+
+def get_embeddings() -> CachedEmbeddings:
+    """
+    Return the embedding model shared by every index, loading it on first use.
+    It sits behind a content-addressed cache so repeated chunks and questions skip the model.
+    """
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                cache = EmbeddingCache(
+                    EMBEDDING_MODEL_ID,
+                    max_entries=settings.embedding_cache_size,
+                    db_path=settings.cache_path / "embeddings.sqlite3" if settings.enable_cache else None,
+                    max_disk_entries=settings.embedding_cache_disk_entries,
+                )
+                model = load_embedding_model(
+                    settings.embedding_model,
+                    backend=settings.embedding_backend,
+                    device=settings.embedding_device,
+                    batch_size=settings.embedding_batch_size,
+                    threads=settings.embedding_threads,
+                )
+                _embeddings = CachedEmbeddings(model, cache)
+    return _embeddings
+
+def embeddings_loaded() -> bool:
+    """True once the embedding model is in memory"""
+    return _embeddings is not None
+
+def warm_up_embeddings() -> None:
+    """
+    Load the embedding model and run it once. The encode goes straight to the model,
+    past the cache, so first-call initialisation happens now rather than on a request.
+    """
+    get_embeddings().base.embed_query("warmup")
+
+def embedding_cache_stats() -> Dict[str, object]:
+    """Embedding cache counters, without forcing the model to load"""
+    return _embeddings.cache.stats() if _embeddings is not None else {}
+
 class VectorIndex:
-    def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(model_name=settings.embedding_model)
+    def __init__(self, embeddings=None, index_type: Optional[str] = None):
+        self.embeddings = embeddings or get_embeddings()
+        # "auto" picks flat, HNSW or IVF-PQ from the chunk count as the index grows
+        self.index_type = index_type or settings.faiss_index_type
         self.vectorstore = None
+        # Keyword index over the same chunks, keyed by the same chunk ids
+        self.bm25 = BM25Index()
+        # doc_id -> ids of its chunks inside the FAISS docstore
+        self._doc_chunk_ids: Dict[str, List[str]] = {}
+        # When documents were last added; the registry expires indexes by it
+        self.built_at = time.time()
+        self._lock = threading.RLock()
+
+    @property
+    def doc_ids(self) -> List[str]:
+        """IDs of all documents currently held in the index"""
+        with self._lock:
+            return list(self._doc_chunk_ids)
+
+    @property
+    def chunk_count(self) -> int:
+        with self._lock:
+            return sum(len(ids) for ids in self._doc_chunk_ids.values())
+
+    @property
+    def faiss_index_type(self) -> Optional[str]:
+        """The FAISS index type currently in use (flat, hnsw or ivfpq)"""
+        from ann_index import index_kind
+
+        with self._lock:
+            return index_kind(self.vectorstore.index) if self.vectorstore is not None else None
+
+    def has_document(self, doc_id: str) -> bool:
+        with self._lock:
+            return doc_id in self._doc_chunk_ids
+
+    def _prepare(self, docs: list[Document], doc_id: Optional[str], source: Optional[str]):
+        """Tag chunks with their document and embed them (outside the lock)."""
+        source = source or docs[0].metadata.get("source")
+        doc_id = doc_id or (get_file_hash(source) if source else "default")
+        for doc in docs:
+            doc.metadata["doc_id"] = doc_id
+            if source:
+                doc.metadata.setdefault("source", source)
+
+        texts = [doc.page_content for doc in docs]
+        with span("embed_chunks"):
+            vectors = self.embeddings.embed_documents(texts)
+        return doc_id, list(zip(texts, vectors)), [doc.metadata for doc in docs]
+
+    def _append(self, doc_id: str, text_embeddings, metadatas) -> List[str]:
+        """Append pre-computed embeddings to the FAISS index. Caller holds the lock."""
+        offset = len(self._doc_chunk_ids.get(doc_id, []))
+        ids = [f"{doc_id}:{offset + i}" for i in range(len(text_embeddings))]
+        for chunk_id, metadata, (text, _) in zip(ids, metadatas, text_embeddings):
+            metadata["chunk_id"] = chunk_id
+            self.bm25.add(chunk_id, text)
+        with span("index_build"):
+            if self.vectorstore is None:
+                self.vectorstore = FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas=metadatas, ids=ids)
+            else:
+                self.vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            self._doc_chunk_ids.setdefault(doc_id, []).extend(ids)
+            self._fit_index_type()
+        self.built_at = time.time()
+        return ids
+
+    def _fit_index_type(self) -> None:
+        """Rebuild the FAISS index when the chunk count calls for another type. Caller holds the lock."""
+        from ann_index import all_vectors, build_index, choose_index_type, index_kind
+
+        index = self.vectorstore.index
+        current = index_kind(index)
+        target = choose_index_type(index.ntotal, self.index_type)
+        if current == "ivfpq" and target != "flat" and self.index_type == "auto":
+            # IVF-PQ only keeps compressed vectors; shrinking back to HNSW can't restore precision
+            return
+        if target != current:
+            logger.info(f"Switching FAISS index from {current} to {target} at {index.ntotal} chunks")
+            self.vectorstore.index = build_index(target, all_vectors(index), index.metric_type)
+
+    def _remove(self, doc_id: str) -> int:
+        """Drop every chunk of a document from the index. Caller holds the lock."""
+        import numpy as np
+        from ann_index import index_kind, rebuild_without
+
+        ids = self._doc_chunk_ids.pop(doc_id, [])
+        self.bm25.remove(ids)
+        if not ids or self.vectorstore is None:
+            return len(ids)
+        store = self.vectorstore
+        if index_kind(store.index) == "flat":
+            store.delete(ids)
+        else:
+            # Approximate indexes can't drop vectors in place; rebuild from the survivors
+            dropped = set(ids)
+            keep = [i for i in range(store.index.ntotal) if store.index_to_docstore_id[i] not in dropped]
+            store.index = rebuild_without(store.index, np.array(keep, dtype=np.int64))
+            store.docstore.delete(ids)
+            store.index_to_docstore_id = {new: store.index_to_docstore_id[old] for new, old in enumerate(keep)}
+        self._fit_index_type()
+        return len(ids)
+
+    def add_documents(self, docs: list[Document], doc_id: Optional[str] = None, source: Optional[str] = None) -> List[str]:
+        """
+        Embed only the given chunks and append them to the existing index.
+        Chunks are tagged with `doc_id` and `source` so they can be filtered or removed later.
+        """
+        if not docs:
+            return []
+        logger.info(f"Embedding and indexing {len(docs)} chunks...")
+        doc_id, text_embeddings, metadatas = self._prepare(docs, doc_id, source)
+        with self._lock:
+            return self._append(doc_id, text_embeddings, metadatas)
+
+    def delete_document(self, doc_id: str) -> int:
+        """Remove one document's chunks without touching the others. Returns chunks removed."""
+        with self._lock:
+            removed = self._remove(doc_id)
+        if removed:
+            logger.info(f"Removed {removed} chunks for document {doc_id}")
+        return removed
+
+    def replace_document(self, doc_id: str, docs: list[Document], source: Optional[str] = None) -> List[str]:
+        """
+        Swap a document's chunks for a new version.
+        The new chunks are embedded first so searches never see the document missing.
+        """
+        if not docs:
+            self.delete_document(doc_id)
+            return []
+        logger.info(f"Re-indexing document {doc_id} with {len(docs)} chunks...")
+        doc_id, text_embeddings, metadatas = self._prepare(docs, doc_id, source)
+        with self._lock:
+            self._remove(doc_id)
+            return self._append(doc_id, text_embeddings, metadatas)
+
+    def search_by_vector(self, embedding: List[float], k: int = 3, doc_ids: Optional[List[str]] = None) -> List[Tuple[Document, float]]:
+        """Return (chunk, L2 distance) pairs for a pre-computed query embedding"""
+        with self._lock:
+            if not self.vectorstore or not self._doc_chunk_ids:
+                return []
+            if not doc_ids:
+                return self.vectorstore.similarity_search_with_score_by_vector(embedding, k=k)
+
+            wanted = set(doc_ids)
+            return self.vectorstore.similarity_search_with_score_by_vector(
+                embedding,
+                k=k,
+                filter=lambda metadata: metadata.get("doc_id") in wanted,
+                fetch_k=self.vectorstore.index.ntotal,
+            )
+
+    def search_by_vectors(self, embeddings: List[List[float]], k: int = 3) -> List[List[Tuple[Document, float]]]:
+        """
+        Run one batched FAISS search over a matrix of query embeddings.
+        Returns (chunk, L2 distance) pairs per query, in query order.
+        """
+        import faiss
+        import numpy as np
+
+        with self._lock:
+            if not self.vectorstore or not self._doc_chunk_ids:
+                return [[] for _ in embeddings]
+            vectors = np.array(embeddings, dtype=np.float32)
+            if self.vectorstore._normalize_L2:
+                faiss.normalize_L2(vectors)
+            scores, indices = self.vectorstore.index.search(vectors, k)
+
+            results = []
+            for row_scores, row_indices in zip(scores, indices):
+                hits = []
+                for score, i in zip(row_scores, row_indices):
+                    if i == -1:
+                        continue  # fewer than k chunks in the index
+                    doc = self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[i])
+                    hits.append((doc, float(score)))
+                results.append(hits)
+            return results
+
+    def keyword_hits(self, query: str, k: int = 10, doc_ids: Optional[List[str]] = None) -> Tuple[List[Tuple[Document, float, float]], int]:
+        """
+        BM25 lookup: the top-k (chunk, score, coverage) triples, plus how many chunks
+        matched at least settings.keyword_fast_path_coverage of the query terms.
+        """
+        with self._lock:
+            if not self.vectorstore:
+                return [], 0
+            scored = self.bm25.score(query)
+            if doc_ids:
+                wanted = set(doc_ids)
+                scored = {chunk_id: hit for chunk_id, hit in scored.items() if chunk_id.rsplit(":", 1)[0] in wanted}
+            full_matches = sum(1 for _, coverage in scored.values() if coverage >= settings.keyword_fast_path_coverage - 1e-9)
+            best = sorted(scored, key=lambda chunk_id: scored[chunk_id][0], reverse=True)[:k]
+            return [(self.vectorstore.docstore.search(chunk_id), *scored[chunk_id]) for chunk_id in best], full_matches
+
+    def keyword_search(self, query: str, k: int = 3, doc_ids: Optional[List[str]] = None) -> list[Document]:
+        """Lexical-only retrieval; no embedding is computed"""
+        return [doc for doc, _, _ in self.keyword_hits(query, k=k, doc_ids=doc_ids)[0]]
+
+    def search(self, query: str, k: int = 3, doc_ids: Optional[List[str]] = None) -> list[Document]:
+        if not self.vectorstore or not self._doc_chunk_ids:
+            raise RuntimeError("Vector store is empty")
+        return hybrid_search([self], [query], k=k, doc_ids=doc_ids, embeddings=self.embeddings)[0]
+
+    def search_batch(self, questions: List[str], k: int = 3) -> List[list[Document]]:
+        """
+        Retrieve chunks for many questions at once: one embedding forward pass
+        for all questions and a single FAISS search over the whole matrix.
+        """
+        if not self.vectorstore or not self._doc_chunk_ids:
+            raise RuntimeError("Vector store is empty")
+        return hybrid_search([self], questions, k=k, embeddings=self.embeddings)
+
+    def save(self, path: Path, key: str) -> bool:
+        """
+        Write the FAISS index, the chunk docstore and the doc_id bookkeeping under `path`.
+        meta.json is written last, so a directory without it is never loaded.
+        """
+        import faiss
+
+        with self._lock:
+            if self.vectorstore is None:
+                return False
+            path.mkdir(parents=True, exist_ok=True)
+            faiss.write_index(self.vectorstore.index, str(path / "index.faiss.tmp"))
+            with open(path / "index.pkl.tmp", "wb") as f:
+                pickle.dump((self.vectorstore.docstore, self.vectorstore.index_to_docstore_id, self.bm25), f)
+            meta = {
+                "key": key,
+                "created_at": self.built_at,
+                "embedding_model": EMBEDDING_MODEL_ID,
+                "index_type": self.index_type,
+                "doc_chunk_ids": self._doc_chunk_ids,
+            }
+            with open(path / "meta.json.tmp", "w") as f:
+                json.dump(meta, f)
+
+            os.replace(path / "index.faiss.tmp", path / "index.faiss")
+            os.replace(path / "index.pkl.tmp", path / "index.pkl")
+            os.replace(path / "meta.json.tmp", path / "meta.json")
+        return True
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = False) -> "VectorIndex":
+        """Restore an index written by `save`. No embedding work is done."""
+        import faiss
+        from ann_index import apply_search_params
+
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+        index = faiss.read_index(str(path / "index.faiss"), faiss.IO_FLAG_MMAP if mmap else 0)
+        apply_search_params(index)
+        with open(path / "index.pkl", "rb") as f:
+            stored = pickle.load(f)  # written by save() above
+        docstore, index_to_docstore_id = stored[:2]
+
+        restored = cls(index_type=meta.get("index_type"))
+        restored.vectorstore = FAISS(restored.embeddings, index, docstore, index_to_docstore_id)
+        restored._doc_chunk_ids = meta["doc_chunk_ids"]
+        restored.built_at = meta.get("created_at", 0)
+        if len(stored) > 2:
+            restored.bm25 = stored[2]
+        else:
+            # Saved before keyword search existed; index the stored chunk texts
+            for chunk_id in index_to_docstore_id.values():
+                restored.bm25.add(chunk_id, docstore.search(chunk_id).page_content)
+        return restored
+
+
+_retrieval_counts = Counter()
+_retrieval_lock = threading.Lock()
+
+def retrieval_stats() -> Dict[str, int]:
+    """Questions answered by the keyword fast path vs. the embedding path"""
+    with _retrieval_lock:
+        return dict(_retrieval_counts)
+
+def _count_retrieval(path: str, n: int) -> None:
+    if n:
+        with _retrieval_lock:
+            _retrieval_counts[path] += n
+
+def _chunk_key(doc: Document):
+    return doc.metadata.get("chunk_id") or id(doc)
+
+def hybrid_search(
+    indexes: List[VectorIndex],
+    questions: List[str],
+    k: int = 3,
+    doc_ids: Optional[List[str]] = None,
+    embeddings=None,
+) -> List[list[Document]]:
+    """
+    Retrieve k chunks per question from `indexes`.
+
+    In "hybrid" mode each question is first looked up in the BM25 indexes. When the
+    best keyword hit contains all of the question's terms and only a handful of chunks
+    do, the keyword ranking is used as is and the question is never embedded. The
+    remaining questions are embedded in one batch and their FAISS ranking is merged
+    with the keyword ranking by reciprocal rank fusion. "vector" mode skips BM25.
+    """
+    if not questions:
+        return []
+    embeddings = embeddings or get_embeddings()
+    hybrid = settings.retrieval_mode == "hybrid"
+    candidates = max(k, settings.hybrid_candidates)
+    results: List[Optional[list[Document]]] = [None] * len(questions)
+
+    lexical: List[list[Document]] = [[] for _ in questions]
+    if hybrid:
+        with span("keyword_search"):
+            for i, question in enumerate(questions):
+                # BM25 scores depend on each index's own corpus statistics, so the
+                # indexes are ranked separately and their rankings fused, not their scores
+                rankings, docs, coverage, full_matches = [], {}, {}, 0
+                for index in indexes:
+                    index_hits, index_matches = index.keyword_hits(question, k=candidates, doc_ids=doc_ids)
+                    full_matches += index_matches
+                    if not index_hits:
+                        continue
+                    rankings.append([_chunk_key(doc) for doc, _, _ in index_hits])
+                    for doc, _, hit_coverage in index_hits:
+                        docs[_chunk_key(doc)] = doc
+                        coverage[_chunk_key(doc)] = hit_coverage
+                # Top hits of different indexes tie after fusion; the better-covered one goes first
+                rankings.sort(key=lambda ranking: coverage[ranking[0]], reverse=True)
+                ranked = reciprocal_rank_fusion(rankings, k=settings.rrf_k)[:candidates]
+                lexical[i] = [docs[key] for key in ranked]
+                strong = (
+                    settings.keyword_fast_path
+                    and ranked
+                    and coverage[ranked[0]] >= settings.keyword_fast_path_coverage - 1e-9
+                    and full_matches <= settings.keyword_fast_path_max_matches
+                )
+                if strong:
+                    results[i] = lexical[i][:k]
+
+    pending = [i for i, result in enumerate(results) if result is None]
+    _count_retrieval("keyword_only", len(questions) - len(pending))
+    _count_retrieval("hybrid" if hybrid else "vector", len(pending))
+    if not pending:
+        return results
+
+    with span("embed_query"):
+        vectors = embeddings.embed_documents([questions[i] for i in pending])
+    scored = [[] for _ in pending]
+    with span("vector_search"):
+        for index in indexes:
+            if doc_ids:
+                batches = [index.search_by_vector(vector, k=candidates, doc_ids=doc_ids) for vector in vectors]
+            else:
+                batches = index.search_by_vectors(vectors, k=candidates)
+            for row, hits in zip(scored, batches):
+                row.extend(hits)
+
+    for i, row in zip(pending, scored):
+        row.sort(key=lambda pair: pair[1])
+        semantic = [doc for doc, _ in row[:candidates]]
+        if not hybrid or not lexical[i]:
+            results[i] = semantic[:k]
+            continue
+        docs = {_chunk_key(doc): doc for doc in semantic + lexical[i]}
+        fused = reciprocal_rank_fusion(
+            [[_chunk_key(doc) for doc in semantic], [_chunk_key(doc) for doc in lexical[i]]],
+            k=settings.rrf_k,
+        )
+        results[i] = [docs[key] for key in fused[:k]]
+    return results
+
+
+class IndexRegistry:
+    """
+    Thread-safe, size-bounded map of document key -> VectorIndex.
+    Each document (an ingested doc_id or a hash of a /hackrx/run URL) gets its own
+    namespace, so concurrent requests never write into the index another one is searching.
+    Least recently used indexes are evicted once `max_indexes` is exceeded.
+
+    When `store_dir` is set, every index is also saved there under a hash of its key
+    and reloaded lazily on first use, so a warm restart does no embedding work.
+    Indexes built more than `ttl_hours` ago are discarded, in memory and on disk,
+    so the next request for the document downloads and revalidates it again.
+    """
+
+    def __init__(
+        self,
+        max_indexes: int = settings.max_indexed_documents,
+        store_dir: Optional[Path] = None,
+        ttl_hours: int = settings.cache_ttl_hours,
+    ):
+        self.max_indexes = max_indexes
+        self.store_dir = store_dir
+        self.ttl_seconds = ttl_hours * 3600
+        self._indexes: "OrderedDict[str, VectorIndex]" = OrderedDict()
+        # key -> directory of a saved index that has not been loaded yet
+        self._on_disk: Dict[str, Path] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+        if self.store_dir is not None:
+            self.restore()
+
+    def _path_for(self, key: str) -> Path:
+        return self.store_dir / get_file_hash(key)
+
+    def _is_fresh(self, meta: dict) -> bool:
+        if meta.get("embedding_model") != EMBEDDING_MODEL_ID:
+            return False
+        return time.time() - meta.get("created_at", 0) < self.ttl_seconds
+
+    def _is_expired(self, index: VectorIndex) -> bool:
+        return time.time() - index.built_at >= self.ttl_seconds
+
+    def restore(self) -> int:
+        """
+        Scan the store directory for saved indexes and register them for lazy loading.
+        Expired entries are deleted. A directory without a readable meta.json may be a
+        save in progress (meta.json is written last), so it is only deleted once it has
+        been left untouched for longer than the TTL. Returns the number of indexes found.
+        """
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        found = {}
+        for path in self.store_dir.iterdir():
+            if not path.is_dir():
+                continue
+            try:
+                with open(path / "meta.json") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                meta = None
+            if meta is None:
+                try:
+                    abandoned = time.time() - path.stat().st_mtime >= self.ttl_seconds
+                except OSError:
+                    abandoned = False
+                if abandoned:
+                    shutil.rmtree(path, ignore_errors=True)
+            elif self._is_fresh(meta):
+                found[meta["key"]] = path
+            else:
+                shutil.rmtree(path, ignore_errors=True)
+
+        with self._lock:
+            self._on_disk.update(found)
+        if found:
+            logger.info(f"Found {len(found)} saved indexes in {self.store_dir}")
+        return len(found)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._indexes or key in self._on_disk
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._indexes) + [key for key in self._on_disk if key not in self._indexes]
+
+    def health(self) -> Dict[str, object]:
+        """Whether indexes can be built and saved, as checked by /ready"""
+        writable = self.store_dir is None or os.access(self.store_dir, os.W_OK)
+        return {"healthy": writable, "documents": len(self.keys()), "store_writable": writable}
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "in_memory": len(self._indexes),
+                "on_disk_not_loaded": len(self._on_disk),
+                "max_in_memory": self.max_indexes,
+                "evictions": self.evictions,
+                "chunks_in_memory": sum(index.chunk_count for index in self._indexes.values()),
+                "index_types": dict(Counter(index.faiss_index_type for index in self._indexes.values())),
+                "retrieval": retrieval_stats(),
+            }
+
+    def _insert(self, key: str, index: VectorIndex) -> VectorIndex:
+        """Add to the in-memory LRU, keeping any index registered first. Caller holds the lock."""
+        existing = self._indexes.get(key)
+        if existing is not None:
+            self._indexes.move_to_end(key)
+            return existing
+        self._indexes[key] = index
+        while len(self._indexes) > self.max_indexes:
+            evicted, _ = self._indexes.popitem(last=False)
+            self.evictions += 1
+            # Evicting from memory is cheap when a saved copy can be reloaded
+            if self.store_dir is not None and self._path_for(evicted).exists():
+                self._on_disk[evicted] = self._path_for(evicted)
+            logger.info(f"Evicted index for document {evicted}")
+        return index
+
+    def _load(self, key: str, path: Path) -> Optional[VectorIndex]:
+        try:
+            with open(path / "meta.json") as f:
+                meta = json.load(f)
+            if not self._is_fresh(meta):
+                shutil.rmtree(path, ignore_errors=True)
+                return None
+            return VectorIndex.load(path, mmap=settings.index_mmap)
+        except Exception as e:
+            logger.warning(f"Could not load saved index for {key}: {e}")
+            return None
+
+    def _expire(self, key: str, index: VectorIndex) -> None:
+        """Drop an index built longer than the TTL ago, unless it was replaced meanwhile"""
+        with self._lock:
+            if self._indexes.get(key) is not index:
+                return
+            del self._indexes[key]
+            self._on_disk.pop(key, None)
+        if self.store_dir is not None:
+            shutil.rmtree(self._path_for(key), ignore_errors=True)
+        logger.info(f"Index for document {key} expired")
+
+    def get(self, key: str) -> Optional[VectorIndex]:
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None and not self._is_expired(index):
+                self._indexes.move_to_end(key)
+                return index
+            path = self._on_disk.get(key)
+        if index is not None:
+            self._expire(key, index)
+            return None
+        if path is None:
+            return None
+
+        # Load outside the lock so other documents stay available meanwhile
+        index = self._load(key, path)
+        with self._lock:
+            self._on_disk.pop(key, None)
+            if index is None:
+                return self._indexes.get(key)
+            return self._insert(key, index)
+
+    def persist(self, key: str) -> None:
+        """Save the current state of a registered index to the store directory"""
+        if self.store_dir is None:
+            return
+        with self._lock:
+            index = self._indexes.get(key)
+        if index is None:
+            return
+        try:
+            with span("persist"):
+                index.save(self._path_for(key), key)
+        except Exception as e:
+            logger.warning(f"Could not save index for {key}: {e}")
+
+    def put(self, key: str, index: VectorIndex, persist: bool = True) -> VectorIndex:
+        """
+        Register an index under `key`. If another thread registered one first,
+        that index wins and is returned so callers all share the same namespace.
+        """
+        with self._lock:
+            registered = self._insert(key, index)
+        if persist and registered is index:
+            self.persist(key)
+        return registered
+
+    def get_or_create(self, key: str) -> VectorIndex:
+        index = self.get(key)
+        if index is None:
+            index = self.put(key, VectorIndex(), persist=False)
+        return index
+
+    def remove(self, key: str) -> bool:
+        with self._lock:
+            removed = self._indexes.pop(key, None) is not None
+            removed = self._on_disk.pop(key, None) is not None or removed
+        if self.store_dir is not None:
+            shutil.rmtree(self._path_for(key), ignore_errors=True)
+        return removed
+
+    def resolve(self, doc_ids: Optional[List[str]] = None) -> List[str]:
+        """
+        Return the keys a search should cover: the named documents, or every
+        document already in memory. Saved indexes are not all loaded for an unscoped
+        search, since that would thrash the LRU on every query; right after a restart,
+        when nothing is loaded yet, the first `max_indexes` saved ones are used.
+        Raises ValueError for unknown IDs and RuntimeError when empty.
+        """
+        if doc_ids:
+            missing = [doc_id for doc_id in doc_ids if doc_id not in self]
+            if missing:
+                raise ValueError(f"Unknown document IDs: {', '.join(missing)}")
+            return list(doc_ids)
+
+        with self._lock:
+            keys = list(self._indexes) or list(self._on_disk)[:self.max_indexes]
+        if not keys:
+            raise RuntimeError("Vector store is empty")
+        return keys
 
-    def add_documents(self, docs: list[Document]):
-        logger.info("Embedding and indexing documents...")
-        self.vectorstore = FAISS.from_documents(docs, self.embeddings)
+    def search(self, query: str, k: int = 3, doc_ids: Optional[List[str]] = None) -> list[Document]:
+        """
+        Search the named documents (or every one in memory); see `hybrid_search`
+        for how keyword and vector hits are combined.
+        """
+        return self.search_batch([query], k=k, doc_ids=doc_ids)[0]
 
-    def search(self, query: str, k: int = 3) -> list[Document]:
-        if not self.vectorstore:
+    def search_batch(self, questions: List[str], k: int = 3, doc_ids: Optional[List[str]] = None) -> List[list[Document]]:
+        """Batched `search`: embeds every question once and queries each index with the full matrix"""
+        indexes = [index for index in (self.get(key) for key in self.resolve(doc_ids)) if index is not None]
+        if not indexes:
             raise RuntimeError("Vector store is empty")
-        return self.vectorstore.similarity_search(query, k=k)
+        return hybrid_search(indexes, questions, k=k, embeddings=get_embeddings())
 
-vector_index = VectorIndex()
+index_registry = IndexRegistry(store_dir=settings.cache_path / "indexes" if settings.enable_cache else None)
@@ -0,0 +1,105 @@
+"""
+Background warmup: load the embedding model and other slow-to-initialise pieces
+right after startup, so imports stay cheap, the first request doesn't pay for the
+model and /ready can tell when the process is worth sending traffic to
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """
+    Runs named steps once, in order, on a daemon thread and reports their progress.
+    A failing step is retried `retries` times with exponential backoff; if it still
+    fails the warmup is "failed" and the next `start()` tries again, skipping the
+    steps that already succeeded.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], Any]]], retries: int = 3,
+                 backoff: float = 2.0, max_backoff: float = 30.0):
+        self.steps = steps
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.attempts = 0
+        self.status = "pending"  # pending, warming, ready or failed
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.step_seconds: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> bool:
+        """
+        Start warming up in the background. Does nothing (and returns False) while a
+        warmup is running or once it succeeded; a failed warmup is started again.
+        """
+        with self._lock:
+            if self._thread is not None and self.status != "failed":
+                return False
+            self.status = "warming"
+            self.error = None
+            self.started_at = time.time()
+            self.finished_at = None
+            self._done.clear()
+            self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        self._thread.start()
+        return True
+
+    def _run_step(self, name: str, step: Callable[[], Any]) -> None:
+        """Run one step, retrying with backoff; raises the last error"""
+        for attempt in range(self.retries + 1):
+            with self._lock:
+                self.attempts += 1
+            try:
+                step()
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+                logger.warning(f"Warmup step {name} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def run(self) -> None:
+        for name, step in self.steps:
+            if name in self.step_seconds:
+                continue  # done by an earlier attempt
+            start = time.perf_counter()
+            try:
+                self._run_step(name, step)
+            except Exception as e:
+                logger.exception(f"Warmup step {name} failed")
+                self._finish("failed", f"{name}: {e}")
+                return
+            with self._lock:
+                self.step_seconds[name] = round(time.perf_counter() - start, 3)
+        self._finish("ready")
+        logger.info(f"Warmup finished in {self.finished_at - self.started_at:.2f}s: {self.step_seconds}")
+
+    def _finish(self, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until warmup has finished (ready or failed); False on timeout"""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "status": self.status,
+                "steps": dict(self.step_seconds),
+                "attempts": self.attempts,
+                "seconds": round(self.finished_at - self.started_at, 3) if self.finished_at and self.started_at else None,
+                "error": self.error,
+            }